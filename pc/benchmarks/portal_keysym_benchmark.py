@@ -0,0 +1,162 @@
+"""Round-trip cost of RemoteDesktop NotifyKeyboardKeysym sequences.
+
+Starts a private ``dbus-daemon`` with a fake ``org.freedesktop.portal.Desktop``
+service and compares one blocking call per key event against the pipelined
+``RemoteDesktopPortalKeyboardBackend._send_key_sequence``.
+
+    python benchmarks/portal_keysym_benchmark.py --iterations 500 --delay-ms 0.2
+
+``--delay-ms`` simulates the compositor's per-event handling time in the fake
+portal. Linux only; needs ``dbus-daemon`` on PATH.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+PORTAL_SERVICE = "org.freedesktop.portal.Desktop"
+PORTAL_PATH = "/org/freedesktop/portal/desktop"
+SESSION_PATH = "/org/freedesktop/portal/desktop/session/benchmark"
+
+
+def serve_fake_portal(delay_ms: float) -> int:
+    from PyQt5.QtCore import QCoreApplication, QObject, Q_CLASSINFO, pyqtSlot
+    from PyQt5.QtDBus import QDBusAbstractAdaptor, QDBusConnection, QDBusObjectPath
+
+    app = QCoreApplication([])
+
+    class RemoteDesktopAdaptor(QDBusAbstractAdaptor):
+        Q_CLASSINFO("D-Bus Interface", "org.freedesktop.portal.RemoteDesktop")
+        Q_CLASSINFO(
+            "D-Bus Introspection",
+            '<interface name="org.freedesktop.portal.RemoteDesktop">'
+            '<method name="NotifyKeyboardKeysym">'
+            '<arg direction="in" type="o" name="session_handle"/>'
+            '<arg direction="in" type="a{sv}" name="options"/>'
+            '<arg direction="in" type="i" name="keysym"/>'
+            '<arg direction="in" type="u" name="state"/>'
+            "</method>"
+            "</interface>",
+        )
+
+        @pyqtSlot(QDBusObjectPath, "QVariantMap", int, "uint")
+        def NotifyKeyboardKeysym(self, session_handle, options, keysym, state):
+            if delay_ms > 0:
+                time.sleep(delay_ms / 1000)
+
+    root = QObject()
+    RemoteDesktopAdaptor(root)
+    bus = QDBusConnection.sessionBus()
+    if not bus.registerObject(PORTAL_PATH, root) or not bus.registerService(PORTAL_SERVICE):
+        print("fake portal: D-Bus registration failed", file=sys.stderr)
+        return 1
+    print("ready", flush=True)
+    return app.exec()
+
+
+def run_benchmark(iterations: int) -> None:
+    from PyQt5.QtCore import QCoreApplication
+
+    import platform_keyboard
+    from platform_keyboard import (
+        RemoteDesktopPortalKeyboardBackend,
+        _ctrl_shift_v_sequence,
+        _ctrl_v_sequence,
+        _dbus_uint,
+    )
+
+    # The tray app owns the QApplication in production; keep one alive here too.
+    app = QCoreApplication.instance() or QCoreApplication([])
+    backend = RemoteDesktopPortalKeyboardBackend()
+    backend._session_handle = SESSION_PATH
+
+    def blocking(sequence):
+        iface = backend._remote_desktop_interface()
+        for keysym, state in sequence:
+            reply = iface.call(
+                "NotifyKeyboardKeysym",
+                backend._dbus_object_path(SESSION_PATH),
+                {},
+                int(keysym),
+                _dbus_uint(int(state)),
+            )
+            if reply.errorMessage():
+                raise RuntimeError(reply.errorMessage())
+
+    sequences = {
+        "Ctrl+V": _ctrl_v_sequence(),
+        "Ctrl+Shift+V": _ctrl_shift_v_sequence(),
+        "Enter": (
+            (platform_keyboard.KEYSYM_RETURN, platform_keyboard.KEY_STATE_PRESSED),
+            (platform_keyboard.KEYSYM_RETURN, platform_keyboard.KEY_STATE_RELEASED),
+        ),
+    }
+    print(f"{'sequence':<14}{'events':>7}{'blocking ms':>14}{'pipelined ms':>15}{'speedup':>9}")
+    for name, sequence in sequences.items():
+        results = []
+        for send in (blocking, backend._send_key_sequence):
+            send(sequence)
+            started = time.perf_counter()
+            for _ in range(iterations):
+                send(sequence)
+            results.append((time.perf_counter() - started) * 1000 / iterations)
+        print(
+            f"{name:<14}{len(sequence):>7}{results[0]:>14.3f}{results[1]:>15.3f}"
+            f"{results[0] / results[1]:>8.1f}x"
+        )
+    del app
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--delay-ms", type=float, default=0.0)
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        return serve_fake_portal(args.delay_ms)
+
+    dbus_daemon = shutil.which("dbus-daemon")
+    if dbus_daemon is None:
+        print("dbus-daemon not found", file=sys.stderr)
+        return 1
+
+    daemon = subprocess.Popen(
+        [dbus_daemon, "--session", "--nofork", "--print-address"],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    portal = None
+    try:
+        address = daemon.stdout.readline().strip()
+        os.environ["DBUS_SESSION_BUS_ADDRESS"] = address
+        portal = subprocess.Popen(
+            [sys.executable, __file__, "--serve", "--delay-ms", str(args.delay_ms)],
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        if portal.stdout.readline().strip() != "ready":
+            print("fake portal failed to start", file=sys.stderr)
+            return 1
+        print(f"private bus: {address}")
+        print(f"iterations: {args.iterations}, simulated portal work: {args.delay_ms} ms/event")
+        run_benchmark(args.iterations)
+    finally:
+        for process in (portal, daemon):
+            if process is not None:
+                process.terminate()
+                process.wait(5)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
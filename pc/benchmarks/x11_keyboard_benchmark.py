@@ -0,0 +1,107 @@
+"""Cost of X11 paste/Enter key sequences: XTest backend versus pyautogui.
+
+Starts a private ``Xvfb`` server and sends the same key sequences through
+``XTestKeyboardBackend`` (one flush per sequence on a persistent connection)
+and through the pyautogui calls it replaces (``hotkey(..., interval=0.02)``
+and ``press("enter")`` with ``PAUSE = 0.01``).
+
+    python benchmarks/x11_keyboard_benchmark.py --iterations 50
+
+Linux only; needs ``Xvfb`` on PATH.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+
+def start_xvfb() -> tuple[subprocess.Popen, str]:
+    read_fd, write_fd = os.pipe()
+    server = subprocess.Popen(
+        ["Xvfb", "-displayfd", str(write_fd), "-nolisten", "tcp"],
+        pass_fds=(write_fd,),
+        stderr=subprocess.DEVNULL,
+    )
+    os.close(write_fd)
+    with os.fdopen(read_fd) as reader:
+        return server, f":{reader.readline().strip()}"
+
+
+def measure(send, iterations: int) -> float:
+    send()
+    started = time.perf_counter()
+    for _ in range(iterations):
+        send()
+    return (time.perf_counter() - started) * 1000 / iterations
+
+
+def run_benchmark(display_name: str, iterations: int) -> None:
+    os.environ["DISPLAY"] = display_name
+
+    import platform_keyboard
+    from platform_keyboard import PasteMode, XTestKeyboardBackend, set_paste_mode
+
+    started = time.perf_counter()
+    pyautogui = platform_keyboard._get_pyautogui()
+    import_ms = (time.perf_counter() - started) * 1000
+    backend = XTestKeyboardBackend.connect(display_name)
+
+    cases = {
+        "Ctrl+V": (
+            PasteMode.NORMAL,
+            backend.paste_from_clipboard,
+            lambda: pyautogui.hotkey("ctrl", "v", interval=0.02),
+        ),
+        "Ctrl+Shift+V": (
+            PasteMode.TERMINAL,
+            backend.paste_from_clipboard,
+            lambda: pyautogui.hotkey("ctrl", "shift", "v", interval=0.02),
+        ),
+        "Enter": (
+            PasteMode.NORMAL,
+            backend.press_enter,
+            lambda: pyautogui.press("enter"),
+        ),
+    }
+    print(f"pyautogui first import: {import_ms:.1f} ms")
+    print(f"{'sequence':<14}{'pyautogui ms':>14}{'xtest ms':>11}{'speedup':>9}")
+    try:
+        for name, (mode, xtest_send, pyautogui_send) in cases.items():
+            set_paste_mode(mode)
+            pyautogui_ms = measure(pyautogui_send, iterations)
+            xtest_ms = measure(lambda: (xtest_send(), backend._display.sync()), iterations)
+            print(f"{name:<14}{pyautogui_ms:>14.3f}{xtest_ms:>11.3f}{pyautogui_ms / xtest_ms:>8.1f}x")
+    finally:
+        backend.close()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    if shutil.which("Xvfb") is None:
+        print("Xvfb not found", file=sys.stderr)
+        return 1
+
+    server, display_name = start_xvfb()
+    try:
+        print(f"Xvfb display: {display_name}, iterations: {args.iterations}")
+        print("XTest timings include one XSync per sequence so the server has processed every event.")
+        run_benchmark(display_name, args.iterations)
+    finally:
+        server.terminate()
+        server.wait(5)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,300 @@
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import time
+
+
+EIS_CONNECT_TIMEOUT_SEC = 2.0
+EIS_CLIENT_NAME = "Voicing"
+
+# enum ei_event_type / enum ei_device_capability from libei.h (libei >= 1.0).
+EI_EVENT_CONNECT = 1
+EI_EVENT_DISCONNECT = 2
+EI_EVENT_SEAT_ADDED = 3
+EI_EVENT_SEAT_REMOVED = 4
+EI_EVENT_DEVICE_ADDED = 5
+EI_EVENT_DEVICE_REMOVED = 6
+EI_EVENT_DEVICE_PAUSED = 7
+EI_EVENT_DEVICE_RESUMED = 8
+EI_DEVICE_CAP_KEYBOARD = 1 << 2
+EI_KEYMAP_TYPE_XKB = 1
+
+XKB_KEYMAP_FORMAT_TEXT_V1 = 1
+XKB_EVDEV_KEYCODE_OFFSET = 8
+
+# EIS speaks evdev keycodes, not keysyms, so each key Voicing sends is looked
+# up in the device's XKB keymap (on Dvorak, "v" is KEY_DOT). These US QWERTY
+# positions are used only when the server sends no keymap, libxkbcommon is
+# missing, or the layout has no such keysym (Cyrillic, Greek, ...), where
+# toolkits match shortcuts against the physical key anyway.
+KEYSYM_TO_EVDEV_KEYCODE = {
+    0xFF0D: 28,  # Return -> KEY_ENTER
+    0xFFE3: 29,  # Control_L -> KEY_LEFTCTRL
+    0xFFE1: 42,  # Shift_L -> KEY_LEFTSHIFT
+    0xFF63: 110,  # Insert -> KEY_INSERT
+    0x0076: 47,  # v -> KEY_V
+}
+
+
+class EisUnavailableError(RuntimeError):
+    pass
+
+
+def load_libei():
+    """Load libei with the prototypes this module uses, or raise EisUnavailableError."""
+    path = ctypes.util.find_library("ei")
+    if path is None:
+        raise EisUnavailableError("未找到 libei，无法使用 EIS 键盘后端。")
+    lib = ctypes.CDLL(path)
+    pointer = ctypes.c_void_p
+    prototypes = {
+        "ei_new_sender": (pointer, [pointer]),
+        "ei_unref": (pointer, [pointer]),
+        "ei_configure_name": (None, [pointer, ctypes.c_char_p]),
+        "ei_setup_backend_fd": (ctypes.c_int, [pointer, ctypes.c_int]),
+        "ei_get_fd": (ctypes.c_int, [pointer]),
+        "ei_dispatch": (None, [pointer]),
+        "ei_get_event": (pointer, [pointer]),
+        "ei_now": (ctypes.c_uint64, [pointer]),
+        "ei_event_get_type": (ctypes.c_int, [pointer]),
+        "ei_event_get_seat": (pointer, [pointer]),
+        "ei_event_get_device": (pointer, [pointer]),
+        "ei_event_unref": (pointer, [pointer]),
+        "ei_device_ref": (pointer, [pointer]),
+        "ei_device_unref": (pointer, [pointer]),
+        "ei_device_has_capability": (ctypes.c_bool, [pointer, ctypes.c_int]),
+        "ei_device_start_emulating": (None, [pointer, ctypes.c_uint32]),
+        "ei_device_stop_emulating": (None, [pointer]),
+        "ei_device_keyboard_key": (None, [pointer, ctypes.c_uint32, ctypes.c_bool]),
+        "ei_device_frame": (None, [pointer, ctypes.c_uint64]),
+        "ei_device_keyboard_get_keymap": (pointer, [pointer]),
+        "ei_keymap_get_type": (ctypes.c_int, [pointer]),
+        "ei_keymap_get_fd": (ctypes.c_int, [pointer]),
+        "ei_keymap_get_size": (ctypes.c_size_t, [pointer]),
+    }
+    for name, (restype, argtypes) in prototypes.items():
+        function = getattr(lib, name)
+        function.restype = restype
+        function.argtypes = argtypes
+    # Variadic (NULL-terminated capability list): no argtypes, typed args at the call.
+    lib.ei_seat_bind_capabilities.restype = None
+    return lib
+
+
+def load_xkbcommon():
+    """Load libxkbcommon with the prototypes this module uses, or raise EisUnavailableError."""
+    path = ctypes.util.find_library("xkbcommon")
+    if path is None:
+        raise EisUnavailableError("未找到 libxkbcommon，无法解析 EIS 键盘布局。")
+    lib = ctypes.CDLL(path)
+    pointer = ctypes.c_void_p
+    prototypes = {
+        "xkb_context_new": (pointer, [ctypes.c_int]),
+        "xkb_context_unref": (None, [pointer]),
+        "xkb_keymap_new_from_string": (pointer, [pointer, ctypes.c_char_p, ctypes.c_int, ctypes.c_int]),
+        "xkb_keymap_unref": (None, [pointer]),
+        "xkb_keymap_min_keycode": (ctypes.c_uint32, [pointer]),
+        "xkb_keymap_max_keycode": (ctypes.c_uint32, [pointer]),
+        "xkb_keymap_num_layouts": (ctypes.c_uint32, [pointer]),
+        "xkb_keymap_key_get_syms_by_level": (
+            ctypes.c_int,
+            [pointer, ctypes.c_uint32, ctypes.c_uint32, ctypes.c_uint32, ctypes.POINTER(ctypes.POINTER(ctypes.c_uint32))],
+        ),
+    }
+    for name, (restype, argtypes) in prototypes.items():
+        function = getattr(lib, name)
+        function.restype = restype
+        function.argtypes = argtypes
+    return lib
+
+
+def evdev_keycodes_for_keysyms(keymap_text: bytes, keysyms, xkb=None) -> dict[int, int]:
+    """Map each keysym to the evdev keycode that types it unshifted in an XKB keymap.
+
+    Layouts are searched in order, so the first layout wins; keysyms that no
+    key produces at level one are left out.
+    """
+    xkb = xkb if xkb is not None else load_xkbcommon()
+    context = xkb.xkb_context_new(0)
+    if not context:
+        raise EisUnavailableError("libxkbcommon 初始化失败。")
+    try:
+        keymap = xkb.xkb_keymap_new_from_string(context, keymap_text, XKB_KEYMAP_FORMAT_TEXT_V1, 0)
+        if not keymap:
+            raise EisUnavailableError("无法解析 EIS 键盘布局。")
+        try:
+            return _find_keysym_keycodes(xkb, keymap, set(keysyms))
+        finally:
+            xkb.xkb_keymap_unref(keymap)
+    finally:
+        xkb.xkb_context_unref(context)
+
+
+def _find_keysym_keycodes(xkb, keymap, wanted: set[int]) -> dict[int, int]:
+    found: dict[int, int] = {}
+    syms = ctypes.POINTER(ctypes.c_uint32)()
+    keycodes = range(xkb.xkb_keymap_min_keycode(keymap), xkb.xkb_keymap_max_keycode(keymap) + 1)
+    for layout in range(xkb.xkb_keymap_num_layouts(keymap)):
+        for keycode in keycodes:
+            count = xkb.xkb_keymap_key_get_syms_by_level(keymap, keycode, layout, 0, ctypes.byref(syms))
+            for index in range(count):
+                keysym = syms[index]
+                if keysym in wanted and keysym not in found:
+                    found[keysym] = keycode - XKB_EVDEV_KEYCODE_OFFSET
+        if len(found) == len(wanted):
+            break
+    return found
+
+
+class EisKeyboard:
+    """Keyboard events over an EIS connection handed out by ``ConnectToEIS``.
+
+    Key presses are written straight to the EIS socket, so a whole paste or
+    Enter sequence costs no D-Bus round trip. Once a session is connected to
+    EIS the portal rejects ``Notify*`` calls, so this object owns all key input
+    for that session.
+    """
+
+    def __init__(self, fd: int, lib=None, connect_timeout_sec: float = EIS_CONNECT_TIMEOUT_SEC):
+        self._lib = lib if lib is not None else load_libei()
+        self._ei = self._lib.ei_new_sender(None)
+        if not self._ei:
+            os.close(fd)
+            raise EisUnavailableError("libei 初始化失败。")
+        self._device = None
+        self._keycodes = dict(KEYSYM_TO_EVDEV_KEYCODE)
+        self._device_resumed = False
+        self._emulating = False
+        self._sequence = 0
+        self._disconnected = False
+        self._lib.ei_configure_name(self._ei, EIS_CLIENT_NAME.encode("utf-8"))
+        # libei takes ownership of the fd on success.
+        if self._lib.ei_setup_backend_fd(self._ei, fd) != 0:
+            os.close(fd)
+            self.close()
+            raise EisUnavailableError("libei 无法接管 EIS 连接。")
+        try:
+            self._wait_for_keyboard(connect_timeout_sec)
+        except Exception:
+            self.close()
+            raise
+
+    @property
+    def is_ready(self) -> bool:
+        return (
+            self._ei is not None
+            and not self._disconnected
+            and self._device is not None
+            and self._device_resumed
+        )
+
+    def send_key_sequence(self, sequence: tuple[tuple[int, int], ...]) -> None:
+        keycodes = []
+        for keysym, state in sequence:
+            keycode = self._keycodes.get(int(keysym))
+            if keycode is None:
+                raise RuntimeError(f"EIS 键盘后端不支持 keysym 0x{int(keysym):x}。")
+            keycodes.append((keycode, bool(state)))
+
+        self._dispatch()
+        if not self.is_ready:
+            raise RuntimeError("EIS 键盘设备不可用（已断开或被暂停）。")
+        if not self._emulating:
+            self._sequence += 1
+            self._lib.ei_device_start_emulating(self._device, self._sequence)
+            self._emulating = True
+        for keycode, is_press in keycodes:
+            self._lib.ei_device_keyboard_key(self._device, keycode, is_press)
+            self._lib.ei_device_frame(self._device, self._lib.ei_now(self._ei))
+        # Flush anything libei buffered and pick up a disconnect right away.
+        self._dispatch()
+
+    def close(self) -> None:
+        if self._device is not None:
+            if self._emulating:
+                self._lib.ei_device_stop_emulating(self._device)
+            self._lib.ei_device_unref(self._device)
+        self._device = None
+        self._emulating = False
+        self._device_resumed = False
+        if self._ei is not None:
+            self._lib.ei_unref(self._ei)
+        self._ei = None
+
+    def _wait_for_keyboard(self, timeout_sec: float) -> None:
+        fd = self._lib.ei_get_fd(self._ei)
+        deadline = time.monotonic() + timeout_sec
+        while not self.is_ready:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("等待 EIS 键盘设备超时。")
+            readable, _writable, _errors = select.select([fd], [], [], remaining)
+            if readable:
+                self._dispatch()
+            if self._disconnected:
+                raise EisUnavailableError("EIS 服务端断开了连接。")
+
+    def _dispatch(self) -> None:
+        if self._ei is None:
+            return
+        self._lib.ei_dispatch(self._ei)
+        while self._ei is not None:
+            event = self._lib.ei_get_event(self._ei)
+            if not event:
+                return
+            try:
+                self._handle_event(event)
+            finally:
+                self._lib.ei_event_unref(event)
+
+    def _handle_event(self, event) -> None:
+        event_type = self._lib.ei_event_get_type(event)
+        if event_type == EI_EVENT_SEAT_ADDED:
+            self._lib.ei_seat_bind_capabilities(
+                ctypes.c_void_p(self._lib.ei_event_get_seat(event)),
+                ctypes.c_int(EI_DEVICE_CAP_KEYBOARD),
+                ctypes.c_void_p(None),
+            )
+        elif event_type == EI_EVENT_DEVICE_ADDED:
+            device = self._lib.ei_event_get_device(event)
+            if self._device is None and self._lib.ei_device_has_capability(device, EI_DEVICE_CAP_KEYBOARD):
+                self._device = self._lib.ei_device_ref(device)
+                # A server changes the keymap by removing and re-adding the device.
+                self._keycodes = self._device_keycodes(device)
+        elif event_type == EI_EVENT_DEVICE_RESUMED:
+            if self._is_our_device(event):
+                self._device_resumed = True
+        elif event_type == EI_EVENT_DEVICE_PAUSED:
+            if self._is_our_device(event):
+                # The server drops emulation state on pause; restart it on resume.
+                self._device_resumed = False
+                self._emulating = False
+        elif event_type == EI_EVENT_DEVICE_REMOVED:
+            if self._is_our_device(event):
+                self._lib.ei_device_unref(self._device)
+                self._device = None
+                self._device_resumed = False
+                self._emulating = False
+        elif event_type == EI_EVENT_DISCONNECT:
+            self._disconnected = True
+
+    def _device_keycodes(self, device) -> dict[int, int]:
+        keycodes = dict(KEYSYM_TO_EVDEV_KEYCODE)
+        keymap = self._lib.ei_device_keyboard_get_keymap(device)
+        if not keymap or self._lib.ei_keymap_get_type(keymap) != EI_KEYMAP_TYPE_XKB:
+            return keycodes
+        try:
+            # libei keeps ownership of the keymap fd.
+            fd = self._lib.ei_keymap_get_fd(keymap)
+            keymap_text = os.pread(fd, self._lib.ei_keymap_get_size(keymap), 0).rstrip(b"\0")
+            keycodes.update(evdev_keycodes_for_keysyms(keymap_text, KEYSYM_TO_EVDEV_KEYCODE))
+        except (OSError, EisUnavailableError) as exc:
+            logging.warning(f"读取 EIS 键盘布局失败，按 US QWERTY 键位发送: {exc}")
+        return keycodes
+
+    def _is_our_device(self, event) -> bool:
+        return self._device is not None and self._lib.ei_event_get_device(event) == self._device
@@ -0,0 +1,250 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Any, Callable
+
+
+INJECTION_QUEUE_MAX_SIZE = 64
+INJECTION_SLOW_WAIT_LOG_SEC = 1.0
+INJECTION_STOP_POLL_SEC = 0.01
+
+
+class InjectionQueueFullError(RuntimeError):
+    pass
+
+
+@dataclass(frozen=True)
+class InjectionStats:
+    queue_depth: int
+    submitted: int
+    completed: int
+    failed: int
+    rejected: int
+    last_wait_sec: float
+    last_service_sec: float
+    max_wait_sec: float
+    total_wait_sec: float
+    total_service_sec: float
+
+    @property
+    def average_wait_sec(self) -> float:
+        return self.total_wait_sec / self.completed if self.completed else 0.0
+
+    @property
+    def average_service_sec(self) -> float:
+        return self.total_service_sec / self.completed if self.completed else 0.0
+
+
+@dataclass
+class _InjectionItem:
+    func: Callable[..., Any]
+    args: tuple
+    kwargs: dict
+    future: Future
+    enqueued_at: float
+
+
+_STOP = object()
+
+
+class InjectionWorker:
+    """Single thread that owns clipboard/keyboard injection.
+
+    Every paste and Enter from every connection goes through one FIFO, so text
+    lands in arrival order and the platform backends (portal session, Qt D-Bus
+    objects, clipboard owners) are only ever touched from one thread.
+    """
+
+    def __init__(
+        self,
+        max_queue_size: int = INJECTION_QUEUE_MAX_SIZE,
+        name: str = "voicing-injection",
+        idle_callback: Callable[[bool], float | None] | None = None,
+    ):
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue_size)
+        self._name = name
+        # Called on the worker thread after each item, when its requested delay
+        # elapses with the queue empty, and once with force=True on stop. It
+        # returns the seconds until it wants to run again, or None.
+        self._idle_callback = idle_callback
+        self._thread: threading.Thread | None = None
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._last_wait_sec = 0.0
+        self._last_service_sec = 0.0
+        self._max_wait_sec = 0.0
+        self._total_wait_sec = 0.0
+        self._total_service_sec = 0.0
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop_event = threading.Event()
+            self._thread = threading.Thread(
+                target=self._run,
+                args=(self._stop_event,),
+                name=self._name,
+                daemon=True,
+            )
+            self._thread.start()
+
+    def stop(self, timeout: float | None = 2.0, process_events: Callable[[], Any] | None = None) -> None:
+        """Stop after the current call; queued calls are cancelled, not run.
+
+        ``process_events`` is called while waiting, for a caller whose event
+        loop the last call (or the final idle flush) may be blocked on.
+        """
+        with self._lock:
+            thread = self._thread
+            stop_event = self._stop_event
+            self._thread = None
+        if thread is None or not thread.is_alive():
+            return
+        stop_event.set()
+        # Only wakes an idle worker; a full queue means it is busy and will
+        # see the stop flag after the current call.
+        try:
+            self._queue.put_nowait(_STOP)
+        except queue.Full:
+            pass
+        if process_events is None:
+            thread.join(timeout)
+            return
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while thread.is_alive() and (deadline is None or time.monotonic() < deadline):
+            process_events()
+            thread.join(INJECTION_STOP_POLL_SEC)
+
+    def is_running(self) -> bool:
+        thread = self._thread
+        return thread is not None and thread.is_alive()
+
+    def is_worker_thread(self) -> bool:
+        return threading.current_thread() is self._thread
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def submit(self, func: Callable[..., Any], *args, **kwargs) -> Future:
+        """Queue ``func`` behind every previously submitted call."""
+        self.start()
+        future: Future = Future()
+        item = _InjectionItem(func, args, kwargs, future, time.monotonic())
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            with self._lock:
+                self._rejected += 1
+            raise InjectionQueueFullError(
+                f"文本注入队列已满（{self._queue.maxsize} 项），丢弃新的注入请求。"
+            ) from None
+        with self._lock:
+            self._submitted += 1
+        return future
+
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Await ``func`` on the injection thread from an asyncio coroutine."""
+        return await asyncio.wrap_future(self.submit(func, *args, **kwargs))
+
+    def stats(self) -> InjectionStats:
+        with self._lock:
+            return InjectionStats(
+                queue_depth=self._queue.qsize(),
+                submitted=self._submitted,
+                completed=self._completed,
+                failed=self._failed,
+                rejected=self._rejected,
+                last_wait_sec=self._last_wait_sec,
+                last_service_sec=self._last_service_sec,
+                max_wait_sec=self._max_wait_sec,
+                total_wait_sec=self._total_wait_sec,
+                total_service_sec=self._total_service_sec,
+            )
+
+    def _run(self, stop_event: threading.Event) -> None:
+        idle_timeout = None
+        while not stop_event.is_set():
+            try:
+                item = self._queue.get(timeout=idle_timeout)
+            except queue.Empty:
+                idle_timeout = self._run_idle_callback(force=False)
+                continue
+            if item is _STOP:
+                continue
+            self._execute(item)
+            idle_timeout = self._run_idle_callback(force=False)
+        self._cancel_pending()
+        self._run_idle_callback(force=True)
+
+    def _cancel_pending(self) -> None:
+        cancelled = 0
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP and item.future.cancel():
+                cancelled += 1
+        if cancelled:
+            logging.warning(f"文本注入线程停止，取消 {cancelled} 个未执行的注入请求")
+
+    def _run_idle_callback(self, force: bool) -> float | None:
+        if self._idle_callback is None:
+            return None
+        try:
+            delay = self._idle_callback(force)
+        except Exception as exc:
+            logging.warning(f"文本注入空闲回调失败: {exc}")
+            return None
+        if delay is None:
+            return None
+        return max(0.0, float(delay))
+
+    def _execute(self, item: _InjectionItem) -> None:
+        started_at = time.monotonic()
+        wait_sec = started_at - item.enqueued_at
+        if not item.future.set_running_or_notify_cancel():
+            return
+
+        result = None
+        error: BaseException | None = None
+        try:
+            result = item.func(*item.args, **item.kwargs)
+        except BaseException as exc:
+            error = exc
+        service_sec = time.monotonic() - started_at
+        failed = error is not None
+
+        # Record stats before resolving the future so awaiting callers observe them.
+        with self._lock:
+            self._completed += 1
+            if failed:
+                self._failed += 1
+            self._last_wait_sec = wait_sec
+            self._last_service_sec = service_sec
+            self._max_wait_sec = max(self._max_wait_sec, wait_sec)
+            self._total_wait_sec += wait_sec
+            self._total_service_sec += service_sec
+
+        if error is not None:
+            item.future.set_exception(error)
+        else:
+            item.future.set_result(result)
+
+        log = logging.warning if wait_sec >= INJECTION_SLOW_WAIT_LOG_SEC else logging.debug
+        log(
+            f"文本注入 {getattr(item.func, '__name__', 'call')}: "
+            f"排队 {wait_sec * 1000:.0f}ms, 执行 {service_sec * 1000:.0f}ms, "
+            f"剩余队列 {self._queue.qsize()}"
+        )
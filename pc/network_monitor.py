@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import asyncio
+import errno
+import logging
+import socket
+import struct
+
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+
+NLMSG_ERROR = 2
+NLMSG_OVERRUN = 4
+RTM_NEWLINK = 16
+RTM_DELLINK = 17
+RTM_NEWADDR = 20
+RTM_DELADDR = 21
+
+IFF_UP = 0x1
+IFF_RUNNING = 0x40
+
+NLMSG_HEADER = struct.Struct("=LHHLL")
+IFINFO_MESSAGE = struct.Struct("=BxHiII")
+RECV_BUFFER_SIZE = 65536
+
+NETWORK_CHANGE_DEBOUNCE_SEC = 0.5
+NETWORK_CHANGE_MAX_SETTLE_SEC = 3.0
+
+
+class NetlinkChangeMonitor:
+    """Wakes on IPv4 address and link up/down changes reported by rtnetlink."""
+
+    def __init__(
+        self,
+        sock: socket.socket | None = None,
+        *,
+        debounce_sec: float = NETWORK_CHANGE_DEBOUNCE_SEC,
+        max_settle_sec: float = NETWORK_CHANGE_MAX_SETTLE_SEC,
+    ):
+        if sock is None:
+            sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+            try:
+                sock.bind((0, RTMGRP_LINK | RTMGRP_IPV4_IFADDR))
+            except OSError:
+                sock.close()
+                raise
+        sock.setblocking(False)
+        self._sock = sock
+        self._debounce_sec = debounce_sec
+        self._max_settle_sec = max_settle_sec
+        self._link_flags: dict[int, int] = {}
+
+    def fileno(self) -> int:
+        return self._sock.fileno()
+
+    def drain(self) -> bool:
+        """Read every queued notification; True if any of them changes the address set."""
+        changed = False
+        while True:
+            try:
+                data = self._sock.recv(RECV_BUFFER_SIZE)
+            except (BlockingIOError, InterruptedError):
+                return changed
+            except OSError as exc:
+                if exc.errno != errno.ENOBUFS:
+                    raise
+                # The kernel dropped notifications; only a full rescan is safe.
+                changed = True
+                continue
+            if not data:
+                return changed
+            changed = self._parse(data) or changed
+
+    def _parse(self, data: bytes) -> bool:
+        changed = False
+        offset = 0
+        while offset + NLMSG_HEADER.size <= len(data):
+            length, message_type, _flags, _seq, _pid = NLMSG_HEADER.unpack_from(data, offset)
+            if length < NLMSG_HEADER.size:
+                break
+            body = offset + NLMSG_HEADER.size
+            if message_type in (RTM_NEWADDR, RTM_DELADDR, NLMSG_OVERRUN):
+                changed = True
+            elif message_type in (RTM_NEWLINK, RTM_DELLINK) and body + IFINFO_MESSAGE.size <= len(data):
+                _family, _type, index, flags, _change = IFINFO_MESSAGE.unpack_from(data, body)
+                changed = self._link_changed(message_type, index, flags) or changed
+            offset += (length + 3) & ~3
+        return changed
+
+    def _link_changed(self, message_type: int, index: int, flags: int) -> bool:
+        # Wireless drivers report scans and signal updates as RTM_NEWLINK, so
+        # only a change in the up/running bits counts.
+        if message_type == RTM_DELLINK:
+            return self._link_flags.pop(index, None) is not None
+        state = flags & (IFF_UP | IFF_RUNNING)
+        previous = self._link_flags.get(index)
+        self._link_flags[index] = state
+        return previous != state
+
+    async def wait_for_change(self, timeout: float) -> bool:
+        """Wait up to ``timeout`` for a change, then until notifications go quiet."""
+        loop = asyncio.get_running_loop()
+        readable = asyncio.Event()
+        fd = self.fileno()
+        loop.add_reader(fd, readable.set)
+        try:
+            deadline = loop.time() + timeout
+            while True:
+                if not await self._wait_readable(readable, deadline - loop.time()):
+                    return False
+                if self.drain():
+                    break
+            settle_deadline = loop.time() + self._max_settle_sec
+            while await self._wait_readable(
+                readable,
+                min(self._debounce_sec, settle_deadline - loop.time()),
+            ):
+                self.drain()
+            return True
+        finally:
+            loop.remove_reader(fd)
+
+    @staticmethod
+    async def _wait_readable(readable: asyncio.Event, timeout: float) -> bool:
+        if timeout <= 0:
+            return False
+        try:
+            await asyncio.wait_for(readable.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        readable.clear()
+        return True
+
+    def close(self) -> None:
+        self._sock.close()
+
+
+def open_network_change_monitor() -> NetlinkChangeMonitor | None:
+    """Return an rtnetlink monitor, or None where only polling is available."""
+    if not hasattr(socket, "AF_NETLINK"):
+        return None
+    try:
+        return NetlinkChangeMonitor()
+    except OSError as exc:
+        logging.warning(f"rtnetlink 网络变化监听不可用，改用轮询: {exc}")
+        return None
+
+
+async def wait_for_network_change(monitor: NetlinkChangeMonitor | None, timeout: float) -> bool:
+    """Sleep ``timeout`` without a monitor; otherwise return early on a change."""
+    if monitor is None:
+        await asyncio.sleep(timeout)
+        return False
+    return await monitor.wait_for_change(timeout)
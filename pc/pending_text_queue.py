@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import asyncio
+from collections import deque
+from typing import NamedTuple
+
+from voicing_protocol import TEXT_SEND_MODE_COMMIT, TEXT_SEND_MODE_SUBMIT
+
+
+class PendingText(NamedTuple):
+    text: str
+    send_mode: str = TEXT_SEND_MODE_SUBMIT
+    auto_enter: bool = False
+    send_ack: bool = True
+
+
+class TextBatch(NamedTuple):
+    """Pending messages that are injected together by one paste (or one Enter)."""
+
+    messages: tuple[PendingText, ...]
+
+    @property
+    def is_commit(self) -> bool:
+        return self.messages[0].send_mode == TEXT_SEND_MODE_COMMIT
+
+    @property
+    def text(self) -> str:
+        return "".join(message.text for message in self.messages)
+
+    @property
+    def auto_enter(self) -> bool:
+        return self.messages[-1].auto_enter
+
+
+def take_text_batch(pending: deque[PendingText]) -> TextBatch:
+    """Pop the longest run at the head of ``pending`` that can share one paste.
+
+    Shadow frames are increments of the same utterance, so texts that have not
+    reached the injector yet are concatenated. A ``commit`` (Enter only) is a
+    barrier and always travels alone, and a message that asks for Enter closes
+    the run so Enter still follows exactly the text that preceded it.
+    """
+    first = pending.popleft()
+    messages = [first]
+    if first.send_mode == TEXT_SEND_MODE_COMMIT or first.auto_enter:
+        return TextBatch(tuple(messages))
+    while pending and pending[0].send_mode != TEXT_SEND_MODE_COMMIT:
+        message = pending.popleft()
+        messages.append(message)
+        if message.auto_enter:
+            break
+    return TextBatch(tuple(messages))
+
+
+class PendingTextQueue:
+    """Per-connection texts received from the phone but not yet injected."""
+
+    def __init__(self):
+        self._pending: deque[PendingText] = deque()
+        self._ready = asyncio.Event()
+        self._closed = False
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def put(self, message: PendingText) -> None:
+        self._pending.append(message)
+        self._ready.set()
+
+    def close(self) -> None:
+        """Stop accepting waits; messages already queued are still drained."""
+        self._closed = True
+        self._ready.set()
+
+    async def next_batch(self) -> TextBatch | None:
+        while not self._pending:
+            if self._closed:
+                return None
+            self._ready.clear()
+            await self._ready.wait()
+        return take_text_batch(self._pending)
@@ -2,22 +2,40 @@ from __future__ import annotations
 
 import ctypes
 import json
+import logging
 import os
+import queue
+import select
 import shutil
 import subprocess
 import sys
 import threading
 import time
 import uuid
+from collections import OrderedDict
 from dataclasses import dataclass
 from enum import Enum
 from typing import Any
 
-from platform_utils import ensure_runtime_supported, get_platform, is_wayland_session, system_subprocess_env
+from eis_keyboard import EisKeyboard, load_libei
+from platform_utils import (
+    CAPABILITY_REMOTE_DESKTOP_KEYBOARD,
+    ensure_runtime_supported,
+    get_capability,
+    get_data_dir,
+    get_platform,
+    invalidate_capability,
+    is_wayland_session,
+    system_subprocess_env,
+    which_cached,
+)
 
 
 _PYAUTOGUI = None
 _PORTAL_BACKEND = None
+_XTEST_BACKEND: XTestKeyboardBackend | None = None
+_XTEST_BACKEND_FAILED_AT = 0.0
+_XTEST_BACKEND_LOCK = threading.Lock()
 
 KEY_STATE_RELEASED = 0
 KEY_STATE_PRESSED = 1
@@ -29,12 +47,51 @@ KEYSYM_INSERT = 0xFF63
 KEYSYM_V = 0x0076
 
 REMOTE_DESKTOP_DEVICE_KEYBOARD = 1
+# persist_mode 2: keep the grant until the user revokes it (RemoteDesktop v2).
+REMOTE_DESKTOP_PERSIST_UNTIL_REVOKED = 2
 PORTAL_REQUEST_TIMEOUT_MS = 60000
+PORTAL_SESSION_FILE_NAME = "portal_session.json"
+PORTAL_CLIPBOARD_READ_TIMEOUT_SEC = 0.5
+PORTAL_CLIPBOARD_TEXT_MIME_TYPES = (
+    "text/plain;charset=utf-8",
+    "UTF8_STRING",
+    "text/plain",
+    "STRING",
+    "TEXT",
+)
 ATSPI_FOCUS_TIMEOUT_SEC = 0.8
 ATSPI_FOCUS_SAMPLE_WINDOW_SEC = 0.5
 ATSPI_FOCUS_SAMPLE_INTERVAL_SEC = 0.04
 ATSPI_FOCUS_MAX_SAMPLES = 8
 TERMINAL_FOCUS_FALLBACK_CACHE_SEC = 3.0
+FOCUS_TRACKER_RESTART_BACKOFF_SEC = 30.0
+ATSPI_HELPER_MIN_RESTART_INTERVAL_SEC = 5.0
+PASTE_MODE_CACHE_TTL_SEC = 30.0
+PASTE_MODE_CACHE_MAX_ENTRIES = 32
+PASTE_SEQUENCE_PREFETCH_MAX_AGE_SEC = 1.0
+X11_FOCUS_RECONNECT_BACKOFF_SEC = 5.0
+XTEST_MAX_SPARE_KEYCODES = 16
+XTEST_REMAP_SETTLE_SEC = 0.03
+X11_CLIPBOARD_READ_TIMEOUT_SEC = 0.5
+X11_CLIPBOARD_HANDOFF_TIMEOUT_SEC = 1.0
+SETTLE_PROFILE_FILE_NAME = "settle_delays.json"
+SETTLE_DELAY_MAX_SEC = 1.0
+SETTLE_DELAY_MIN_SAMPLES = 3
+SETTLE_DELAY_LATENCY_MARGIN = 2.0
+SETTLE_DELAY_SMOOTHING = 0.3
+SETTLE_PROFILE_MAX_APPS = 64
+SETTLE_PROFILE_SAVE_INTERVAL_SEC = 30.0
+X11_CLIPBOARD_TEXT_TARGETS = ("UTF8_STRING", "text/plain;charset=utf-8", "TEXT", "STRING")
+GNOME_SHELL_INTROSPECT_SERVICE = "org.gnome.Shell.Introspect"
+GNOME_SHELL_INTROSPECT_PATH = "/org/gnome/Shell/Introspect"
+GNOME_SHELL_INTROSPECT_INTERFACE = "org.gnome.Shell.Introspect"
+# Shell answers GetWindows only for allowed callers (unsafe mode or an allowlist).
+GNOME_SHELL_INTROSPECT_UNAVAILABLE_ERRORS = {
+    "org.freedesktop.DBus.Error.AccessDenied",
+    "org.freedesktop.DBus.Error.ServiceUnknown",
+    "org.freedesktop.DBus.Error.UnknownMethod",
+    "org.freedesktop.DBus.Error.UnknownObject",
+}
 
 
 class PasteMode(str, Enum):
@@ -44,6 +101,27 @@ class PasteMode(str, Enum):
     COMPAT = "compat"
 
 
+class WaylandKeyboardBackend(str, Enum):
+    PORTAL = "portal"
+    EIS = "eis"
+
+
+WAYLAND_KEYBOARD_BACKEND_ENV = "VOICING_WAYLAND_KEYBOARD"
+
+
+class TextInjectionStrategy(str, Enum):
+    # Paste. Typed key events go through the active input method (IBus/Fcitx),
+    # which composes them when a CJK IME is on, so direct typing is opt-in.
+    AUTO = "auto"
+    # Always paste through the clipboard.
+    CLIPBOARD = "clipboard"
+    # Type short texts directly on X11 (XTest) and over the Wayland portal.
+    DIRECT = "direct"
+
+
+TEXT_INJECTION_STRATEGY_ENV = "VOICING_TEXT_INJECTION"
+
+
 class _FocusKind(str, Enum):
     TERMINAL = "terminal"
     NORMAL = "normal"
@@ -72,6 +150,8 @@ TERMINAL_APP_NAMES = {
     "kitty",
     "kgx",
     "konsole",
+    "lxterminal",
+    "mate-terminal",
     "org.gnome.console",
     "org.gnome.ptyxis",
     "org.gnome.terminal",
@@ -81,17 +161,55 @@ TERMINAL_APP_NAMES = {
     "ptyxis",
     "qterminal",
     "rio",
+    "st-256color",
     "tabby",
     "terminal",
     "terminator",
     "tilix",
+    "urxvt",
+    "uxterm",
     "wezterm",
     "xfce4-terminal",
+    "xterm",
 }
 
 _PASTE_MODE = PasteMode.AUTO
+_WAYLAND_KEYBOARD_BACKEND = (
+    WaylandKeyboardBackend.EIS
+    if os.environ.get(WAYLAND_KEYBOARD_BACKEND_ENV, "").strip().lower() == WaylandKeyboardBackend.EIS.value
+    else WaylandKeyboardBackend.PORTAL
+)
+_TEXT_INJECTION_STRATEGY = next(
+    (
+        strategy
+        for strategy in TextInjectionStrategy
+        if strategy.value == os.environ.get(TEXT_INJECTION_STRATEGY_ENV, "").strip().lower()
+    ),
+    TextInjectionStrategy.AUTO,
+)
 _LAST_TERMINAL_FOCUS_SEEN_AT = 0.0
 _LAST_TERMINAL_FOCUS_INFO: dict[str, str] | None = None
+_FOCUS_TRACKER: _AtspiFocusTracker | None = None
+_LAST_FOCUS_SCAN_NODES_VISITED = 0
+_FOCUS_TRACKER_LOCK = threading.Lock()
+_ATSPI_HELPER: _AtspiHelperProcess | None = None
+_ATSPI_HELPER_LOCK = threading.Lock()
+_CLIPBOARD_BURST: _ClipboardBurst | None = None
+_LAST_PASTE_SETTLE: _PasteSettle | None = None
+_PASTE_SEQUENCE_PREFETCH: _PasteSequencePrefetch | None = None
+_PASTE_SEQUENCE_PREFETCH_LOCK = threading.Lock()
+_AUTO_PASTE_MODE_LOCK = threading.Lock()
+_X11_FOCUS_CLASSIFIER: _X11FocusClassifier | None = None
+_X11_FOCUS_CLASSIFIER_FAILED_AT = 0.0
+_X11_FOCUS_CLASSIFIER_LOCK = threading.Lock()
+_SHELL_INTROSPECTOR: _GnomeShellWindowIntrospector | None = None
+_SHELL_INTROSPECTOR_LOCK = threading.Lock()
+_X11_CLIPBOARD: _X11ClipboardBackend | None = None
+_X11_CLIPBOARD_FAILED_AT = 0.0
+_X11_CLIPBOARD_LOCK = threading.Lock()
+_QT_CLIPBOARD_BRIDGE = None
+_QT_CLIPBOARD_BRIDGE_LOCK = threading.Lock()
+_CLIPBOARD_BURST_LOCK = threading.RLock()
 
 
 def _dbus_uint(value: int):
@@ -119,6 +237,16 @@ def _dbus_uint_variant(value: int):
     return QVariant(_dbus_uint(value))
 
 
+def _dbus_string_list_variant(values: list[str]):
+    """``as`` wrapped as a variant; a plain Python list would marshal as ``av``."""
+    from PyQt5.QtCore import QMetaType, QVariant
+    from PyQt5.QtDBus import QDBusArgument
+
+    arg = QDBusArgument()
+    arg.add(list(values), QMetaType.QStringList)
+    return QVariant(arg)
+
+
 def _get_pyautogui():
     global _PYAUTOGUI
     if _PYAUTOGUI is None:
@@ -146,10 +274,42 @@ def get_paste_mode_label(mode: PasteMode | None = None) -> str:
     return PASTE_MODE_LABELS[mode or _PASTE_MODE]
 
 
+def get_wayland_keyboard_backend() -> WaylandKeyboardBackend:
+    return _WAYLAND_KEYBOARD_BACKEND
+
+
+def set_wayland_keyboard_backend(backend: WaylandKeyboardBackend | str) -> WaylandKeyboardBackend:
+    """Choose how key events reach the portal session; applies from the next session."""
+    global _WAYLAND_KEYBOARD_BACKEND
+    if not isinstance(backend, WaylandKeyboardBackend):
+        backend = WaylandKeyboardBackend(str(backend))
+    if backend != _WAYLAND_KEYBOARD_BACKEND and _PORTAL_BACKEND is not None:
+        # EIS and Notify* cannot share a session, so switching needs a new one.
+        _PORTAL_BACKEND.close()
+    _WAYLAND_KEYBOARD_BACKEND = backend
+    return _WAYLAND_KEYBOARD_BACKEND
+
+
+def get_text_injection_strategy() -> TextInjectionStrategy:
+    return _TEXT_INJECTION_STRATEGY
+
+
+def set_text_injection_strategy(strategy: TextInjectionStrategy | str) -> TextInjectionStrategy:
+    global _TEXT_INJECTION_STRATEGY
+    if not isinstance(strategy, TextInjectionStrategy):
+        strategy = TextInjectionStrategy(str(strategy))
+    _TEXT_INJECTION_STRATEGY = strategy
+    return _TEXT_INJECTION_STRATEGY
+
+
 def _is_linux_wayland() -> bool:
     return get_platform() == "linux" and is_wayland_session()
 
 
+def _is_linux_x11() -> bool:
+    return get_platform() == "linux" and not is_wayland_session()
+
+
 def get_paste_hotkey() -> tuple[str, str]:
     return ("command", "v") if get_platform() == "darwin" else ("ctrl", "v")
 
@@ -157,8 +317,17 @@ def get_paste_hotkey() -> tuple[str, str]:
 def press_enter() -> None:
     ensure_runtime_supported()
     if _is_linux_wayland():
-        _get_remote_desktop_portal_backend().press_enter()
+        try:
+            _get_remote_desktop_portal_backend().press_enter()
+        except Exception:
+            invalidate_capability(CAPABILITY_REMOTE_DESKTOP_KEYBOARD)
+            raise
         return
+    if _is_linux_x11():
+        xtest = _get_xtest_keyboard_backend()
+        if xtest is not None:
+            xtest.press_enter()
+            return
 
     if get_platform() == "windows":
         try:
@@ -173,14 +342,56 @@ def press_enter() -> None:
 def paste_from_clipboard() -> None:
     ensure_runtime_supported()
     if _is_linux_wayland():
-        _get_remote_desktop_portal_backend().paste_from_clipboard()
+        try:
+            _get_remote_desktop_portal_backend().paste_from_clipboard()
+        except Exception:
+            # Re-probe the portal next time instead of trusting the startup check.
+            invalidate_capability(CAPABILITY_REMOTE_DESKTOP_KEYBOARD)
+            raise
+        return
+    if _is_linux_x11():
+        xtest = _get_xtest_keyboard_backend()
+        if xtest is not None:
+            xtest.paste_from_clipboard()
+            return
+        _get_pyautogui().hotkey(*_resolve_x11_paste_hotkey(), interval=0.02)
         return
 
     _get_pyautogui().hotkey(*get_paste_hotkey(), interval=0.02)
 
 
+def _primary_selection_mirroring_enabled() -> bool:
+    """Whether the text should also be mirrored to PRIMARY via wl-copy.
+
+    The portal Clipboard interface only covers CLIPBOARD. When it is in use we
+    skip the PRIMARY subprocess round trips unless the compat Shift+Insert
+    sequence, the only one that may read PRIMARY, is selected.
+    """
+    if not _is_linux_wayland():
+        return False
+    portal = _PORTAL_BACKEND
+    if portal is not None and portal.clipboard_enabled:
+        return get_paste_mode() == PasteMode.COMPAT
+    return True
+
+
+def _get_x11_primary_selection():
+    """PRIMARY backend on X11, used only when Shift+Insert is the paste sequence."""
+    if not _is_linux_x11() or get_paste_mode() != PasteMode.COMPAT:
+        return None
+    return _get_qt_clipboard_backend(selection=True)
+
+
 def _paste_primary_selection_if_supported() -> str | None:
-    if not _is_linux_wayland() or not shutil.which("wl-paste"):
+    if not _is_linux_wayland():
+        selection = _get_x11_primary_selection()
+        if selection is None:
+            return None
+        try:
+            return selection.paste()
+        except Exception:
+            return None
+    if not _primary_selection_mirroring_enabled() or not which_cached("wl-paste"):
         return None
     try:
         return subprocess.check_output(
@@ -189,12 +400,24 @@ def _paste_primary_selection_if_supported() -> str | None:
             text=True,
             stderr=subprocess.DEVNULL,
         )
+    except OSError:
+        invalidate_capability("which:wl-paste")
+        return None
     except Exception:
         return None
 
 
 def _copy_to_primary_selection_if_supported(text: str) -> bool:
-    if not _is_linux_wayland() or not shutil.which("wl-copy"):
+    if not _is_linux_wayland():
+        selection = _get_x11_primary_selection()
+        if selection is None:
+            return False
+        try:
+            selection.copy(text)
+            return True
+        except Exception:
+            return False
+    if not _primary_selection_mirroring_enabled() or not which_cached("wl-copy"):
         return False
     try:
         subprocess.run(
@@ -205,6 +428,9 @@ def _copy_to_primary_selection_if_supported(text: str) -> bool:
             check=True,
         )
         return True
+    except OSError:
+        invalidate_capability("which:wl-copy")
+        return False
     except Exception:
         return False
 
@@ -214,36 +440,376 @@ def type_text_at_cursor(
     auto_enter: bool = False,
     enter_delay_sec: float = 0.2,
     restore_delay_sec: float = 0.1,
+    burst_idle_sec: float = 0.0,
+    direct_typing_max_chars: int = 0,
+    direct_typing_keys_per_sec: float = 0.0,
 ) -> None:
-    """Paste Unicode text at the current cursor and optionally press Enter."""
+    """Paste Unicode text at the current cursor and optionally press Enter.
+
+    With ``burst_idle_sec`` > 0 the user's clipboard is snapshotted once per
+    dictation burst and restored by :func:`flush_clipboard_burst` after the
+    burst has been idle that long, instead of around every single paste.
+
+    Text of at most ``direct_typing_max_chars`` characters is typed key by
+    key instead when :class:`TextInjectionStrategy` ``DIRECT`` is chosen,
+    leaving the clipboard untouched; ``direct_typing_keys_per_sec`` > 0 caps
+    the typing rate for apps that drop fast input.
+    """
+    global _LAST_PASTE_SETTLE
     ensure_runtime_supported()
+    if len(text) <= direct_typing_max_chars and _type_text_directly(text, direct_typing_keys_per_sec):
+        with _CLIPBOARD_BURST_LOCK:
+            _LAST_PASTE_SETTLE = None
+        if auto_enter:
+            threading.Event().wait(enter_delay_sec)
+            press_enter()
+        return
+    # Resolve the paste keys while the clipboard is being staged.
+    prefetch_paste_sequence()
+    if burst_idle_sec > 0:
+        _type_text_in_clipboard_burst(text, auto_enter, enter_delay_sec, restore_delay_sec, burst_idle_sec)
+        return
+
     clipboard = _get_clipboard_backend()
 
     try:
         old_clipboard = clipboard.paste()
-    except Exception:
-        old_clipboard = ""
+    except Exception as exc:
+        # Restoring a failed snapshot would wipe the user's clipboard instead.
+        logging.warning(f"读取原剪贴板失败，粘贴后不恢复: {exc}")
+        old_clipboard = None
+    clipboard = _clipboard_for_snapshot(clipboard, old_clipboard)
     old_primary = _paste_primary_selection_if_supported()
 
     copied_primary = False
+    settle = _PasteSettle(clipboard, _paste_target_app())
+    with _CLIPBOARD_BURST_LOCK:
+        _LAST_PASTE_SETTLE = settle
     try:
         clipboard.copy(text)
         copied_primary = _copy_to_primary_selection_if_supported(text)
         paste_from_clipboard()
+        settle.pasted()
 
         if auto_enter:
-            threading.Event().wait(enter_delay_sec)
+            settle.wait(enter_delay_sec)
             press_enter()
     finally:
-        threading.Event().wait(restore_delay_sec)
-        try:
-            clipboard.copy(old_clipboard)
-        except Exception:
-            pass
+        settle.wait(restore_delay_sec)
+        if old_clipboard is not None:
+            try:
+                clipboard.copy(old_clipboard)
+            except Exception:
+                pass
         if copied_primary and old_primary is not None:
             _copy_to_primary_selection_if_supported(old_primary)
 
 
+def press_enter_after_paste(enter_delay_sec: float = 0.2) -> None:
+    """Press Enter once the target has fetched the last paste.
+
+    For an Enter sent on its own after the text, like the commit that ends a
+    streamed utterance. The last paste's settle state is reused, so Enter goes
+    out at once if that fetch was already seen and otherwise waits for it,
+    capped by the target app's learned delay.
+    """
+    ensure_runtime_supported()
+    with _CLIPBOARD_BURST_LOCK:
+        settle = _LAST_PASTE_SETTLE
+    if settle is None:
+        settle = _PasteSettle(None, _paste_target_app())
+    settle.wait(enter_delay_sec)
+    press_enter()
+
+
+def _clipboard_for_snapshot(clipboard, old_clipboard: str | None):
+    """The clipboard to paste and restore with, given the user's snapshot.
+
+    The in-process X11 owner serves text in a single reply, so a snapshot too
+    large for that goes through the Qt or pyperclip clipboard instead of being
+    lost when it is restored.
+    """
+    fits = getattr(type(clipboard), "fits", None)
+    if old_clipboard is None or not callable(fits) or clipboard.fits(old_clipboard):
+        return clipboard
+    logging.warning("原剪贴板内容超出 X11 CLIPBOARD 单次传输上限，本次改用其他剪贴板后端")
+    return _get_qt_clipboard_backend() or _PyperclipClipboardBackend()
+
+
+def _wait_for_paste_transfer(clipboard, timeout_sec: float) -> bool | None:
+    """Wait until the paste target fetched the clipboard, at most ``timeout_sec``.
+
+    Backends that serve the selection themselves report the fetch, so Enter and
+    the clipboard restore follow right after it; others just sleep the cap.
+    Only fetches after ``expect_transfer()`` (called right after the paste
+    keystroke) count, so a clipboard manager copying the text when the owner
+    changes does not cut the wait short.
+    Returns whether the fetch was seen, or ``None`` if the backend cannot tell.
+    """
+    if callable(getattr(type(clipboard), "wait_for_transfer", None)):
+        return clipboard.wait_for_transfer(timeout_sec)
+    threading.Event().wait(timeout_sec)
+    return None
+
+
+class _PasteSettle:
+    """Settle waits for one paste, capped by the target app's learned delay.
+
+    The first wait that can tell whether the target fetched the clipboard feeds
+    the observed latency, or a miss, back into ``_SETTLE_DELAYS``. Fetches the
+    backend does not attribute to the paste (before the keystroke, or from
+    another X client) never count, and a timeout after such a fetch records
+    nothing.
+    """
+
+    def __init__(self, clipboard, app: str | None):
+        self._clipboard = clipboard
+        self._app = app
+        self._pasted_at: float | None = None
+        self._recorded = False
+
+    def pasted(self) -> None:
+        if callable(getattr(type(self._clipboard), "expect_transfer", None)):
+            self._clipboard.expect_transfer()
+        self._pasted_at = time.monotonic()
+
+    def wait(self, default_sec: float) -> None:
+        timeout_sec = _SETTLE_DELAYS.delay_for(self._app, default_sec)
+        if self._pasted_at is None:
+            # The keystroke never went out, so there is no fetch to wait for.
+            threading.Event().wait(timeout_sec)
+            return
+        fetched = _wait_for_paste_transfer(self._clipboard, timeout_sec)
+        if fetched is None or self._recorded:
+            return
+        self._recorded = True
+        latency_sec = time.monotonic() - self._pasted_at if fetched else None
+        _SETTLE_DELAYS.record(self._app, latency_sec, timeout_sec)
+
+
+@dataclass
+class _SettleProfile:
+    latency_sec: float
+    samples: int = 0
+    misses: int = 0
+
+
+class _SettleDelayProfiles:
+    """Per-app settle delays learned from how fast paste targets fetch the text.
+
+    Only clipboards that report the fetch (X11 selection owner, portal) give
+    samples. A fetch updates a smoothed latency; a fetch that never came within
+    the wait counts as twice that wait, so apps that lag get more time. Once an
+    app has a few samples its delay is the latency times a margin, capped at
+    ``SETTLE_DELAY_MAX_SEC``. Learning only ever lengthens the caller's default:
+    a backend that reports the fetch returns as soon as it happens anyway, and
+    one slow fetch after fast ones must not find Enter already sent. Profiles
+    persist as JSON under the data dir.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._profiles: OrderedDict[str, _SettleProfile] | None = None
+        self._dirty = False
+        self._saved_at = 0.0
+
+    def delay_for(self, app: str | None, default_sec: float) -> float:
+        if not app:
+            return default_sec
+        with self._lock:
+            profile = self._load().get(app)
+            if profile is None or profile.samples < SETTLE_DELAY_MIN_SAMPLES:
+                return default_sec
+            delay_sec = profile.latency_sec * SETTLE_DELAY_LATENCY_MARGIN
+        return max(default_sec, min(delay_sec, SETTLE_DELAY_MAX_SEC))
+
+    def record(self, app: str | None, latency_sec: float | None, timeout_sec: float) -> None:
+        """Record one fetch latency, or ``None`` when the wait of ``timeout_sec`` ran out."""
+        if not app:
+            return
+        observed_sec = latency_sec if latency_sec is not None else timeout_sec * 2
+        observed_sec = min(observed_sec, SETTLE_DELAY_MAX_SEC)
+        with self._lock:
+            profiles = self._load()
+            profile = profiles.pop(app, None)
+            if profile is None:
+                profile = _SettleProfile(latency_sec=observed_sec)
+            else:
+                profile.latency_sec += SETTLE_DELAY_SMOOTHING * (observed_sec - profile.latency_sec)
+            profile.samples += 1
+            if latency_sec is None:
+                profile.misses += 1
+            profiles[app] = profile
+            while len(profiles) > SETTLE_PROFILE_MAX_APPS:
+                profiles.popitem(last=False)
+            self._dirty = True
+            due = time.monotonic() - self._saved_at >= SETTLE_PROFILE_SAVE_INTERVAL_SEC
+        if due:
+            self.save()
+
+    def save(self) -> None:
+        with self._lock:
+            if not self._dirty or self._profiles is None:
+                return
+            data = {
+                app: {
+                    "latency_sec": round(profile.latency_sec, 4),
+                    "samples": profile.samples,
+                    "misses": profile.misses,
+                }
+                for app, profile in self._profiles.items()
+            }
+            self._dirty = False
+            self._saved_at = time.monotonic()
+        path = _get_settle_profile_path()
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(path.suffix + ".tmp")
+            tmp_path.write_text(json.dumps(data, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+            tmp_path.replace(path)
+        except OSError as exc:
+            logging.warning(f"保存粘贴延迟配置失败: {exc}")
+
+    def _load(self) -> OrderedDict[str, _SettleProfile]:
+        if self._profiles is not None:
+            return self._profiles
+        self._profiles = OrderedDict()
+        try:
+            data = json.loads(_get_settle_profile_path().read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return self._profiles
+        for app, entry in (data.items() if isinstance(data, dict) else ()):
+            try:
+                self._profiles[str(app)] = _SettleProfile(
+                    latency_sec=float(entry["latency_sec"]),
+                    samples=int(entry.get("samples", 0)),
+                    misses=int(entry.get("misses", 0)),
+                )
+            except (KeyError, TypeError, ValueError, AttributeError):
+                continue
+        return self._profiles
+
+
+_SETTLE_DELAYS = _SettleDelayProfiles()
+
+
+def _get_settle_profile_path():
+    return get_data_dir() / SETTLE_PROFILE_FILE_NAME
+
+
+def _paste_target_app() -> str | None:
+    """Name of the app receiving the paste, from the cheap focus sources only."""
+    name = ""
+    if _is_linux_wayland():
+        tracker = _get_focus_tracker()
+        info = tracker.current_focus_info() if tracker is not None else None
+        if info is None:
+            info = _get_shell_focus_info()
+        name = str((info or {}).get("app_name", ""))
+    elif _is_linux_x11():
+        classifier = _get_x11_focus_classifier()
+        try:
+            wm_class = classifier.active_window_class() if classifier is not None else None
+        except Exception:
+            wm_class = None
+        name = wm_class[-1] if wm_class else ""
+    return _normalize_terminal_app_name(name) or None
+
+
+@dataclass
+class _ClipboardBurst:
+    clipboard: Any
+    old_clipboard: str | None
+    old_primary: str | None
+    idle_sec: float
+    copied_primary: bool = False
+    last_text: str = ""
+    last_used_at: float = 0.0
+
+
+def _type_text_in_clipboard_burst(
+    text: str,
+    auto_enter: bool,
+    enter_delay_sec: float,
+    restore_delay_sec: float,
+    burst_idle_sec: float,
+) -> None:
+    global _CLIPBOARD_BURST, _LAST_PASTE_SETTLE
+    with _CLIPBOARD_BURST_LOCK:
+        burst = _CLIPBOARD_BURST
+        if burst is None:
+            clipboard = _get_clipboard_backend()
+            try:
+                old_clipboard = clipboard.paste()
+            except Exception as exc:
+                logging.warning(f"读取原剪贴板失败，粘贴后不恢复: {exc}")
+                old_clipboard = None
+            burst = _ClipboardBurst(
+                clipboard=_clipboard_for_snapshot(clipboard, old_clipboard),
+                old_clipboard=old_clipboard,
+                old_primary=_paste_primary_selection_if_supported(),
+                idle_sec=burst_idle_sec,
+            )
+            _CLIPBOARD_BURST = burst
+        burst.idle_sec = burst_idle_sec
+
+        settle = _PasteSettle(burst.clipboard, _paste_target_app())
+        _LAST_PASTE_SETTLE = settle
+        try:
+            burst.clipboard.copy(text)
+            burst.last_text = text
+            if _copy_to_primary_selection_if_supported(text):
+                burst.copied_primary = True
+            paste_from_clipboard()
+            settle.pasted()
+
+            if auto_enter:
+                settle.wait(enter_delay_sec)
+                press_enter()
+            # The next message of the burst replaces the clipboard right away, so
+            # give the target the same time to read this one as the per-message path.
+            settle.wait(restore_delay_sec)
+        except Exception:
+            # A failed paste ends the burst right away, like the per-message path.
+            threading.Event().wait(restore_delay_sec)
+            flush_clipboard_burst(force=True)
+            raise
+        finally:
+            burst.last_used_at = time.monotonic()
+
+
+def flush_clipboard_burst(force: bool = False) -> float | None:
+    """Restore the pre-burst clipboard once the burst has been idle long enough.
+
+    Returns the seconds until the burst may be restored, or ``None`` when no
+    burst is pending. The clipboard is left alone if something other than the
+    last pasted text owns it by now, so a copy made by the user mid-burst wins.
+    """
+    global _CLIPBOARD_BURST
+    with _CLIPBOARD_BURST_LOCK:
+        burst = _CLIPBOARD_BURST
+        if burst is None:
+            return None
+        if not force:
+            remaining = burst.last_used_at + burst.idle_sec - time.monotonic()
+            if remaining > 0:
+                return remaining
+        _CLIPBOARD_BURST = None
+
+        try:
+            still_ours = burst.clipboard.paste() == burst.last_text
+        except Exception:
+            still_ours = True
+        if still_ours and burst.old_clipboard is not None:
+            try:
+                burst.clipboard.copy(burst.old_clipboard)
+            except Exception:
+                pass
+        if burst.copied_primary and burst.old_primary is not None:
+            _copy_to_primary_selection_if_supported(burst.old_primary)
+        return None
+
+
 class _PyperclipClipboardBackend:
     def paste(self) -> str:
         import pyperclip
@@ -258,28 +824,123 @@ class _PyperclipClipboardBackend:
 
 class _WlClipboardBackend:
     def paste(self) -> str:
-        return subprocess.check_output(
-            ["wl-paste", "--no-newline"],
-            env=system_subprocess_env(),
-            text=True,
-        )
+        try:
+            return subprocess.check_output(
+                ["wl-paste", "--no-newline"],
+                env=system_subprocess_env(),
+                text=True,
+            )
+        except OSError:
+            invalidate_capability("which:wl-paste")
+            raise
 
     def copy(self, text: str) -> None:
-        subprocess.run(
-            ["wl-copy"],
-            input=text,
-            env=system_subprocess_env(),
-            text=True,
-            check=True,
-        )
+        try:
+            subprocess.run(
+                ["wl-copy"],
+                input=text,
+                env=system_subprocess_env(),
+                text=True,
+                check=True,
+            )
+        except OSError:
+            invalidate_capability("which:wl-copy")
+            raise
+
+
+class _QtClipboardBackend:
+    """``QClipboard`` of the running ``QApplication``, driven from any thread.
+
+    ``QClipboard`` may only be touched on the GUI thread, so calls from the
+    injection worker are marshalled to a bridge object living there with a
+    blocking queued invocation and return synchronously. ``selection`` picks
+    the X11 PRIMARY selection instead of CLIPBOARD.
+    """
+
+    def __init__(self, bridge, selection: bool = False):
+        from PyQt5.QtGui import QClipboard
+
+        self._bridge = bridge
+        self._mode = QClipboard.Selection if selection else QClipboard.Clipboard
+
+    def paste(self) -> str:
+        from PyQt5.QtCore import Q_ARG, Q_RETURN_ARG
+
+        return self._invoke("paste", Q_RETURN_ARG(str), Q_ARG(int, int(self._mode)))
+
+    def copy(self, text: str) -> None:
+        from PyQt5.QtCore import Q_ARG
+
+        self._invoke("copy", Q_ARG(str, text), Q_ARG(int, int(self._mode)))
+
+    def _invoke(self, method: str, *arguments):
+        from PyQt5.QtCore import QMetaObject, QThread, Qt
+
+        if QThread.currentThread() == self._bridge.thread():
+            # Already on the GUI thread: a blocking queued call would deadlock.
+            connection = Qt.DirectConnection
+        else:
+            connection = Qt.BlockingQueuedConnection
+        return QMetaObject.invokeMethod(self._bridge, method, connection, *arguments)
+
+
+def _get_qt_clipboard_backend(selection: bool = False) -> _QtClipboardBackend | None:
+    """Return a ``QClipboard`` backend, or ``None`` without a ``QApplication``."""
+    global _QT_CLIPBOARD_BRIDGE
+    try:
+        from PyQt5.QtCore import QObject, pyqtSlot
+        from PyQt5.QtGui import QGuiApplication
+    except Exception:
+        return None
+    app = QGuiApplication.instance()
+    if not isinstance(app, QGuiApplication):
+        return None
+    with _QT_CLIPBOARD_BRIDGE_LOCK:
+        if _QT_CLIPBOARD_BRIDGE is None:
+
+            class ClipboardBridge(QObject):
+                @pyqtSlot(int, result=str)
+                def paste(self, mode):
+                    return QGuiApplication.clipboard().text(mode)
+
+                @pyqtSlot(str, int)
+                def copy(self, text, mode):
+                    QGuiApplication.clipboard().setText(text, mode)
+
+            bridge = ClipboardBridge()
+            bridge.moveToThread(app.thread())
+            _QT_CLIPBOARD_BRIDGE = bridge
+        bridge = _QT_CLIPBOARD_BRIDGE
+    if selection and not QGuiApplication.clipboard().supportsSelection():
+        return None
+    return _QtClipboardBackend(bridge, selection)
 
 
 def _get_clipboard_backend():
-    if _is_linux_wayland() and shutil.which("wl-copy") and shutil.which("wl-paste"):
-        return _WlClipboardBackend()
+    if _is_linux_wayland():
+        portal_clipboard = _get_portal_clipboard_backend()
+        if portal_clipboard is not None:
+            return portal_clipboard
+        if which_cached("wl-copy") and which_cached("wl-paste"):
+            return _WlClipboardBackend()
+    elif _is_linux_x11():
+        x11_clipboard = _get_x11_clipboard_backend()
+        if x11_clipboard is not None:
+            return x11_clipboard
+        qt_clipboard = _get_qt_clipboard_backend()
+        if qt_clipboard is not None:
+            return qt_clipboard
     return _PyperclipClipboardBackend()
 
 
+def _get_portal_clipboard_backend():
+    """Return the in-process portal clipboard, or None to use wl-copy/wl-paste."""
+    try:
+        return _get_remote_desktop_portal_backend().ensure_clipboard()
+    except Exception:
+        return None
+
+
 def _get_remote_desktop_portal_backend():
     global _PORTAL_BACKEND
     if _PORTAL_BACKEND is None:
@@ -301,6 +962,29 @@ class RemoteDesktopPortalKeyboardBackend:
         self._session_handle: str | None = None
         self._request_timeout_ms = request_timeout_ms
         self._lock = threading.RLock()
+        self._clipboard: _PortalClipboardBackend | None = None
+        self._eis: EisKeyboard | None = None
+        self._eis_failed = False
+
+    @property
+    def clipboard_enabled(self) -> bool:
+        return self._session_handle is not None and self._clipboard is not None
+
+    def ensure_clipboard(self) -> _PortalClipboardBackend | None:
+        """Start the session if needed and return its clipboard, if granted."""
+        self._ensure_started()
+        return self._clipboard
+
+    @property
+    def uses_eis(self) -> bool:
+        return self._eis is not None
+
+    def close(self) -> None:
+        with self._lock:
+            session_handle = self._session_handle
+            self._reset_session()
+            if session_handle:
+                self._close_session(session_handle)
 
     def is_available(self) -> bool:
         try:
@@ -310,7 +994,7 @@ class RemoteDesktopPortalKeyboardBackend:
 
     def paste_from_clipboard(self) -> None:
         self._ensure_started()
-        self._send_key_sequence(_resolve_wayland_paste_sequence())
+        self._send_key_sequence(_take_wayland_paste_sequence())
 
     def press_enter(self) -> None:
         self._ensure_started()
@@ -321,6 +1005,27 @@ class RemoteDesktopPortalKeyboardBackend:
             )
         )
 
+    def type_text(self, text: str, keys_per_sec: float = 0.0) -> bool:
+        """Type ``text`` as Unicode keysyms; ``False`` if this session cannot.
+
+        EIS only carries evdev keycodes, so a session connected to EIS leaves
+        the text to the clipboard path.
+        """
+        keysyms = [_keysym_for_char(char) for char in text]
+        if not keysyms or None in keysyms:
+            return False
+        self._ensure_started()
+        if self._eis is not None:
+            return False
+        governor = _KeyRateGovernor(keys_per_sec)
+        if not governor.enabled:
+            self._send_key_sequence(_keysym_tap_sequence(keysyms))
+            return True
+        for keysym in keysyms:
+            governor.wait()
+            self._send_key_sequence(_keysym_tap_sequence([keysym]))
+        return True
+
     def _ensure_started(self) -> None:
         with self._lock:
             if self._session_handle:
@@ -332,53 +1037,177 @@ class RemoteDesktopPortalKeyboardBackend:
                     "请确认 xdg-desktop-portal 与 GNOME portal 正在运行。"
                 )
 
-            session_token = "voicing" + uuid.uuid4().hex
-            create_results = self._call_request(
-                "CreateSession",
-                {
-                    "session_handle_token": session_token,
-                },
+            restore_token = _read_portal_restore_token()
+            if restore_token:
+                try:
+                    clipboard_requested, start_results = self._start_session(restore_token)
+                except Exception as exc:
+                    # A revoked or stale token must not lock us out: fall back
+                    # to the interactive flow and let it store a fresh token.
+                    logging.info(f"RemoteDesktop portal restore_token 恢复失败，改为重新授权: {exc}")
+                    _write_portal_restore_token(None)
+                    clipboard_requested, start_results = self._start_session(None)
+            else:
+                clipboard_requested, start_results = self._start_session(None)
+
+            new_token = start_results.get("restore_token")
+            if new_token:
+                # Tokens are single use; the portal hands out a new one each Start.
+                _write_portal_restore_token(str(new_token))
+
+            self._clipboard = None
+            if clipboard_requested and start_results.get("clipboard_enabled"):
+                self._clipboard = _PortalClipboardBackend(self, self._session_handle)
+
+            self._eis = None
+            if get_wayland_keyboard_backend() == WaylandKeyboardBackend.EIS and not self._eis_failed:
+                try:
+                    self._eis = self._connect_eis(self._session_handle)
+                except Exception as exc:
+                    # Stay on Notify* for the rest of the run instead of retrying.
+                    self._eis_failed = True
+                    logging.warning(f"EIS 键盘后端不可用，改用 RemoteDesktop portal 按键: {exc}")
+
+    def _connect_eis(self, session_handle: str) -> EisKeyboard:
+        lib = load_libei()
+        reply = self._remote_desktop_interface().call(
+            "ConnectToEIS",
+            self._dbus_object_path(session_handle),
+            {},
+        )
+        if reply.errorMessage() or not reply.arguments():
+            raise RuntimeError(f"RemoteDesktop portal ConnectToEIS 失败: {reply.errorMessage()}")
+        return EisKeyboard(os.dup(reply.arguments()[0].fileDescriptor()), lib=lib)
+
+    def _start_session(self, restore_token: str | None) -> tuple[bool, dict]:
+        session_token = "voicing" + uuid.uuid4().hex
+        create_results = self._call_request(
+            "CreateSession",
+            {
+                "session_handle_token": session_token,
+            },
+        )
+        session_handle = create_results.get("session_handle")
+        if not session_handle:
+            raise RuntimeError("RemoteDesktop portal 未返回 session handle。")
+        self._session_handle = str(session_handle)
+
+        select_options = {
+            "types": _dbus_uint_variant(REMOTE_DESKTOP_DEVICE_KEYBOARD),
+            "persist_mode": _dbus_uint_variant(REMOTE_DESKTOP_PERSIST_UNTIL_REVOKED),
+        }
+        if restore_token:
+            select_options["restore_token"] = restore_token
+
+        try:
+            self._call_request(
+                "SelectDevices",
+                self._dbus_object_path(self._session_handle),
+                select_options,
+            )
+            # Clipboard access must be requested before Start.
+            clipboard_requested = self._request_clipboard(self._session_handle)
+            start_results = self._call_request(
+                "Start",
+                self._dbus_object_path(self._session_handle),
+                "",
+                {},
+            )
+        except Exception:
+            self._close_session(self._session_handle)
+            self._session_handle = None
+            raise
+        return clipboard_requested, start_results
+
+    def _close_session(self, session_handle: str) -> None:
+        try:
+            _app, _event_loop, _timer, _qobject, _pyqt_slot, qdbus_connection, qdbus_interface = self._qt_imports()
+            qdbus_interface(
+                "org.freedesktop.portal.Desktop",
+                session_handle,
+                "org.freedesktop.portal.Session",
+                qdbus_connection.sessionBus(),
+            ).call("Close")
+        except Exception:
+            pass
+
+    def _request_clipboard(self, session_handle: str) -> bool:
+        if not self._has_clipboard_interface():
+            return False
+        reply = self._clipboard_interface().call(
+            "RequestClipboard",
+            self._dbus_object_path(session_handle),
+            {},
+        )
+        return not reply.errorMessage()
+
+    def _has_clipboard_interface(self) -> bool:
+        try:
+            _app, _event_loop, _timer, _qobject, _pyqt_slot, qdbus_connection, qdbus_interface = self._qt_imports()
+            iface = qdbus_interface(
+                "org.freedesktop.portal.Desktop",
+                "/org/freedesktop/portal/desktop",
+                "org.freedesktop.DBus.Properties",
+                qdbus_connection.sessionBus(),
             )
-            session_handle = create_results.get("session_handle")
-            if not session_handle:
-                raise RuntimeError("RemoteDesktop portal 未返回 session handle。")
-            self._session_handle = str(session_handle)
+            reply = iface.call("Get", "org.freedesktop.portal.Clipboard", "version")
+            return not reply.errorMessage() and bool(reply.arguments())
+        except Exception:
+            return False
 
-            try:
-                self._call_request(
-                    "SelectDevices",
-                    self._dbus_object_path(self._session_handle),
-                    {
-                        "types": _dbus_uint_variant(REMOTE_DESKTOP_DEVICE_KEYBOARD),
-                    },
-                )
-                self._call_request(
-                    "Start",
-                    self._dbus_object_path(self._session_handle),
-                    "",
-                    {},
-                )
-            except Exception:
-                self._session_handle = None
-                raise
+    def _reset_session(self) -> None:
+        self._session_handle = None
+        if self._clipboard is not None:
+            self._clipboard.close()
+        self._clipboard = None
+        if self._eis is not None:
+            self._eis.close()
+        self._eis = None
 
     def _send_key_sequence(self, sequence: tuple[tuple[int, int], ...]) -> None:
         session_handle = self._session_handle
         if not session_handle:
             raise RuntimeError("RemoteDesktop portal session 尚未启动。")
 
+        if self._eis is not None:
+            try:
+                self._eis.send_key_sequence(sequence)
+            except Exception as exc:
+                self._reset_session()
+                raise RuntimeError(f"EIS 键盘事件失败: {exc}") from exc
+            return
+
+        # Queue every event before waiting on any reply: one connection delivers
+        # method calls in order, so the sequence stays ordered while costing a
+        # single round trip instead of one per press/release.
+        from PyQt5.QtDBus import QDBusPendingReply
+
         iface = self._remote_desktop_interface()
-        for keysym, state in sequence:
-            reply = iface.call(
-                "NotifyKeyboardKeysym",
-                self._dbus_object_path(session_handle),
-                {},
-                int(keysym),
-                _dbus_uint(int(state)),
+        session_path = self._dbus_object_path(session_handle)
+        pending_calls = [
+            (
+                keysym,
+                state,
+                QDBusPendingReply(
+                    iface.asyncCall(
+                        "NotifyKeyboardKeysym",
+                        session_path,
+                        {},
+                        int(keysym),
+                        _dbus_uint(int(state)),
+                    )
+                ),
             )
-            if reply.errorMessage():
-                self._session_handle = None
-                raise RuntimeError(f"RemoteDesktop portal 键盘事件失败: {reply.errorMessage()}")
+            for keysym, state in sequence
+        ]
+        for keysym, state, pending in pending_calls:
+            pending.waitForFinished()
+            if pending.isError():
+                self._reset_session()
+                raise RuntimeError(
+                    f"RemoteDesktop portal 键盘事件失败 (keysym=0x{int(keysym):x}, state={int(state)}): "
+                    f"{pending.error().message()}"
+                )
 
     def _call_request(self, method_name: str, *args):
         app, event_loop, timer, qobject, pyqt_slot, qdbus_connection, qdbus_interface = self._qt_imports()
@@ -483,6 +1312,15 @@ class RemoteDesktopPortalKeyboardBackend:
             qdbus_connection.sessionBus(),
         )
 
+    def _clipboard_interface(self):
+        _app, _event_loop, _timer, _qobject, _pyqt_slot, qdbus_connection, qdbus_interface = self._qt_imports()
+        return qdbus_interface(
+            "org.freedesktop.portal.Desktop",
+            "/org/freedesktop/portal/desktop",
+            "org.freedesktop.portal.Clipboard",
+            qdbus_connection.sessionBus(),
+        )
+
     def _dbus_object_path(self, path: str):
         from PyQt5.QtDBus import QDBusObjectPath
 
@@ -502,51 +1340,1369 @@ class RemoteDesktopPortalKeyboardBackend:
         return app, QEventLoop, QTimer, QObject, pyqtSlot, QDBusConnection, QDBusInterface
 
 
-def _resolve_wayland_paste_sequence() -> tuple[tuple[int, int], ...]:
-    mode = get_paste_mode()
-    if mode == PasteMode.AUTO:
-        mode = _resolve_auto_paste_mode()
-    if mode == PasteMode.TERMINAL:
-        return _ctrl_shift_v_sequence()
-    if mode == PasteMode.COMPAT:
-        return _shift_insert_sequence()
-    return _ctrl_v_sequence()
+def _get_portal_session_file_path():
+    return get_data_dir() / PORTAL_SESSION_FILE_NAME
 
 
-def _ctrl_v_sequence() -> tuple[tuple[int, int], ...]:
-    return (
-        (KEYSYM_CTRL_L, KEY_STATE_PRESSED),
-        (KEYSYM_V, KEY_STATE_PRESSED),
-        (KEYSYM_V, KEY_STATE_RELEASED),
-        (KEYSYM_CTRL_L, KEY_STATE_RELEASED),
-    )
+def _read_portal_restore_token() -> str | None:
+    try:
+        data = json.loads(_get_portal_session_file_path().read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    token = data.get("restore_token") if isinstance(data, dict) else None
+    return token if isinstance(token, str) and token else None
 
 
-def _ctrl_shift_v_sequence() -> tuple[tuple[int, int], ...]:
-    return (
-        (KEYSYM_CTRL_L, KEY_STATE_PRESSED),
-        (KEYSYM_SHIFT_L, KEY_STATE_PRESSED),
-        (KEYSYM_V, KEY_STATE_PRESSED),
-        (KEYSYM_V, KEY_STATE_RELEASED),
-        (KEYSYM_SHIFT_L, KEY_STATE_RELEASED),
-        (KEYSYM_CTRL_L, KEY_STATE_RELEASED),
-    )
+def _write_portal_restore_token(token: str | None) -> None:
+    path = _get_portal_session_file_path()
+    try:
+        if token is None:
+            path.unlink(missing_ok=True)
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(path.suffix + ".tmp")
+        tmp_path.write_text(json.dumps({"restore_token": token}) + "\n", encoding="utf-8")
+        os.chmod(tmp_path, 0o600)
+        tmp_path.replace(path)
+    except OSError as exc:
+        logging.warning(f"保存 RemoteDesktop portal restore_token 失败: {exc}")
+
+
+class _PortalClipboardBackend:
+    """CLIPBOARD selection through the RemoteDesktop session's portal Clipboard.
+
+    Offered text is served from memory when another app pastes: the portal
+    emits ``SelectionTransfer`` and we answer on the fd from ``SelectionWrite``.
+    The signal receiver lives on the Qt GUI thread, so transfers are served even
+    while the injection thread is blocked sending key events.
+    """
+
+    def __init__(self, portal: RemoteDesktopPortalKeyboardBackend, session_handle: str):
+        self._portal = portal
+        self._session_handle = session_handle
+        self._lock = threading.Lock()
+        self._content: bytes | None = None
+        self._is_owner = False
+        self._offered_mime_types: tuple[str, ...] = ()
+        self._expecting_transfer = False
+        self._uncounted_transfer = False
+        self._transfer_served = threading.Event()
+        self._receiver = None
+        self._connect_signals()
+
+    def paste(self) -> str:
+        with self._lock:
+            if self._is_owner and self._content is not None:
+                return self._content.decode("utf-8", errors="replace")
+            offered = self._offered_mime_types
+        mime_type = next(
+            (candidate for candidate in PORTAL_CLIPBOARD_TEXT_MIME_TYPES if candidate in offered),
+            PORTAL_CLIPBOARD_TEXT_MIME_TYPES[0],
+        )
+        reply = self._portal._clipboard_interface().call(
+            "SelectionRead",
+            self._portal._dbus_object_path(self._session_handle),
+            mime_type,
+        )
+        if reply.errorMessage() or not reply.arguments():
+            raise RuntimeError(f"RemoteDesktop portal SelectionRead 失败: {reply.errorMessage()}")
+        fd = os.dup(reply.arguments()[0].fileDescriptor())
+        try:
+            return _read_fd_until_eof(fd, PORTAL_CLIPBOARD_READ_TIMEOUT_SEC).decode("utf-8", errors="replace")
+        finally:
+            os.close(fd)
+
+    def copy(self, text: str) -> None:
+        with self._lock:
+            self._content = text.encode("utf-8")
+            self._is_owner = True
+            self._expecting_transfer = False
+            self._uncounted_transfer = False
+        reply = self._portal._clipboard_interface().call(
+            "SetSelection",
+            self._portal._dbus_object_path(self._session_handle),
+            {"mime_types": _dbus_string_list_variant(list(PORTAL_CLIPBOARD_TEXT_MIME_TYPES))},
+        )
+        if reply.errorMessage():
+            with self._lock:
+                self._is_owner = False
+            raise RuntimeError(f"RemoteDesktop portal SetSelection 失败: {reply.errorMessage()}")
+
+    def expect_transfer(self) -> None:
+        """Count transfers from now on; call right after the paste keystroke.
+
+        The portal does not say who reads the selection, so transfers served
+        before this point (clipboard managers react to the owner change) are
+        the only ones that can be told apart from the paste target.
+        """
+        with self._lock:
+            self._expecting_transfer = True
+            self._transfer_served.clear()
+
+    def wait_for_transfer(self, timeout_sec: float) -> bool | None:
+        """Block until the current content was fetched after ``expect_transfer``.
+
+        Returns ``None`` instead of ``False`` on timeout when only uncounted
+        transfers were served, since then the miss cannot be told apart.
+        """
+        if self._transfer_served.wait(timeout_sec):
+            return True
+        with self._lock:
+            return None if self._uncounted_transfer else False
+
+    def close(self) -> None:
+        with self._lock:
+            self._content = None
+            self._is_owner = False
+        receiver = self._receiver
+        self._receiver = None
+        if receiver is None:
+            return
+        try:
+            from PyQt5.QtDBus import QDBusConnection
+
+            bus = QDBusConnection.sessionBus()
+            for name in ("SelectionTransfer", "SelectionOwnerChanged"):
+                bus.disconnect(
+                    "",
+                    "/org/freedesktop/portal/desktop",
+                    "org.freedesktop.portal.Clipboard",
+                    name,
+                    receiver.on_signal,
+                )
+            receiver.deleteLater()
+        except Exception:
+            pass
+
+    def _connect_signals(self) -> None:
+        app, _event_loop, _timer, qobject, pyqt_slot, qdbus_connection, _qdbus_interface = self._portal._qt_imports()
+        from PyQt5.QtDBus import QDBusMessage
+
+        backend = self
+
+        class ClipboardReceiver(qobject):
+            @pyqt_slot(QDBusMessage)
+            def on_signal(self, message):
+                backend._handle_signal(message.member(), list(message.arguments()))
+
+        receiver = ClipboardReceiver()
+        receiver.moveToThread(app.thread())
+        bus = qdbus_connection.sessionBus()
+        for name in ("SelectionTransfer", "SelectionOwnerChanged"):
+            bus.connect(
+                "",
+                "/org/freedesktop/portal/desktop",
+                "org.freedesktop.portal.Clipboard",
+                name,
+                receiver.on_signal,
+            )
+        self._receiver = receiver
+
+    def _handle_signal(self, member: str, arguments: list) -> None:
+        if not arguments or _dbus_path_str(arguments[0]) != self._session_handle:
+            return
+        if member == "SelectionOwnerChanged" and len(arguments) >= 2:
+            options = dict(arguments[1] or {})
+            with self._lock:
+                self._offered_mime_types = tuple(str(value) for value in options.get("mime_types", ()) or ())
+                self._is_owner = bool(options.get("session_is_owner", False))
+        elif member == "SelectionTransfer" and len(arguments) >= 3:
+            self._serve_transfer(int(arguments[2]))
+
+    def _serve_transfer(self, serial: int) -> None:
+        with self._lock:
+            content = self._content if self._is_owner else None
+        iface = self._portal._clipboard_interface()
+        session_path = self._portal._dbus_object_path(self._session_handle)
+        success = False
+        if content is not None:
+            reply = iface.call("SelectionWrite", session_path, _dbus_uint(serial))
+            if not reply.errorMessage() and reply.arguments():
+                fd = os.dup(reply.arguments()[0].fileDescriptor())
+                try:
+                    view = memoryview(content)
+                    while view:
+                        written = os.write(fd, view)
+                        view = view[written:]
+                    success = True
+                except OSError:
+                    success = False
+                finally:
+                    os.close(fd)
+        iface.call("SelectionWriteDone", session_path, _dbus_uint(serial), success)
+        with self._lock:
+            if success and self._expecting_transfer:
+                self._transfer_served.set()
+            elif success:
+                self._uncounted_transfer = True
+
+
+def _dbus_path_str(value) -> str:
+    path = getattr(value, "path", None)
+    return str(path() if callable(path) else value)
+
+
+def _read_fd_until_eof(fd: int, timeout_sec: float) -> bytes:
+    chunks: list[bytes] = []
+    deadline = time.monotonic() + timeout_sec
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError("读取剪贴板内容超时。")
+        readable, _writable, _errors = select.select([fd], [], [], remaining)
+        if not readable:
+            continue
+        chunk = os.read(fd, 65536)
+        if not chunk:
+            return b"".join(chunks)
+        chunks.append(chunk)
+
+
+def _resolve_wayland_paste_sequence() -> tuple[tuple[int, int], ...]:
+    mode = get_paste_mode()
+    if mode == PasteMode.AUTO:
+        mode = _resolve_auto_paste_mode()
+    return _paste_sequence_for_mode(mode)
+
+
+def _paste_sequence_for_mode(mode: PasteMode) -> tuple[tuple[int, int], ...]:
+    if mode == PasteMode.TERMINAL:
+        return _ctrl_shift_v_sequence()
+    if mode == PasteMode.COMPAT:
+        return _shift_insert_sequence()
+    return _ctrl_v_sequence()
+
+
+class _PasteSequencePrefetch:
+    """A Wayland paste key sequence resolved on its own thread.
+
+    Auto paste may sample focus for up to half a second before it knows which
+    keys to send. Resolving on a side thread lets that overlap clipboard
+    staging, or start as soon as the phone begins streaming an utterance.
+    """
+
+    def __init__(self, mode: PasteMode):
+        self.mode = mode
+        self._sequence: tuple[tuple[int, int], ...] | None = None
+        self._error: Exception | None = None
+        self._finished_at: float | None = None
+        self._thread = threading.Thread(target=self._run, name="voicing-paste-prefetch", daemon=True)
+        self._thread.start()
+
+    def is_fresh(self, now: float) -> bool:
+        finished_at = self._finished_at
+        return finished_at is None or now - finished_at <= PASTE_SEQUENCE_PREFETCH_MAX_AGE_SEC
+
+    def result(self) -> tuple[tuple[int, int], ...]:
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+        return self._sequence
+
+    def _run(self) -> None:
+        try:
+            self._sequence = _resolve_wayland_paste_sequence()
+        except Exception as exc:
+            self._error = exc
+        finally:
+            self._finished_at = time.monotonic()
+
+
+def prefetch_paste_sequence() -> None:
+    """Start resolving the Auto paste keys in the background, if that is slow here.
+
+    The next Wayland paste picks the result up instead of sampling focus
+    itself. A result older than ``PASTE_SEQUENCE_PREFETCH_MAX_AGE_SEC`` is
+    dropped, since focus may have moved since; one still running is reused.
+    """
+    global _PASTE_SEQUENCE_PREFETCH
+    mode = get_paste_mode()
+    if mode != PasteMode.AUTO or not _is_linux_wayland():
+        return
+    with _PASTE_SEQUENCE_PREFETCH_LOCK:
+        prefetch = _PASTE_SEQUENCE_PREFETCH
+        if prefetch is not None and prefetch.mode == mode and prefetch.is_fresh(time.monotonic()):
+            return
+        _PASTE_SEQUENCE_PREFETCH = _PasteSequencePrefetch(mode)
+
+
+def _take_wayland_paste_sequence() -> tuple[tuple[int, int], ...]:
+    global _PASTE_SEQUENCE_PREFETCH
+    with _PASTE_SEQUENCE_PREFETCH_LOCK:
+        prefetch = _PASTE_SEQUENCE_PREFETCH
+        _PASTE_SEQUENCE_PREFETCH = None
+    if prefetch is not None and prefetch.mode == get_paste_mode():
+        try:
+            sequence = prefetch.result()
+        except Exception as exc:
+            logging.debug(f"预解析粘贴按键失败，改为当场解析: {exc}")
+        else:
+            if prefetch.is_fresh(time.monotonic()):
+                return sequence
+    return _resolve_wayland_paste_sequence()
+
+
+def _ctrl_v_sequence() -> tuple[tuple[int, int], ...]:
+    return (
+        (KEYSYM_CTRL_L, KEY_STATE_PRESSED),
+        (KEYSYM_V, KEY_STATE_PRESSED),
+        (KEYSYM_V, KEY_STATE_RELEASED),
+        (KEYSYM_CTRL_L, KEY_STATE_RELEASED),
+    )
+
+
+def _ctrl_shift_v_sequence() -> tuple[tuple[int, int], ...]:
+    return (
+        (KEYSYM_CTRL_L, KEY_STATE_PRESSED),
+        (KEYSYM_SHIFT_L, KEY_STATE_PRESSED),
+        (KEYSYM_V, KEY_STATE_PRESSED),
+        (KEYSYM_V, KEY_STATE_RELEASED),
+        (KEYSYM_SHIFT_L, KEY_STATE_RELEASED),
+        (KEYSYM_CTRL_L, KEY_STATE_RELEASED),
+    )
+
+
+def _shift_insert_sequence() -> tuple[tuple[int, int], ...]:
+    return (
+        (KEYSYM_SHIFT_L, KEY_STATE_PRESSED),
+        (KEYSYM_INSERT, KEY_STATE_PRESSED),
+        (KEYSYM_INSERT, KEY_STATE_RELEASED),
+        (KEYSYM_SHIFT_L, KEY_STATE_RELEASED),
+    )
+
+
+def _resolve_x11_paste_mode() -> PasteMode:
+    mode = get_paste_mode()
+    if mode == PasteMode.AUTO:
+        terminal = _classify_x11_focus() == _FocusKind.TERMINAL
+        mode = PasteMode.TERMINAL if terminal else PasteMode.NORMAL
+    return mode
+
+
+def _resolve_x11_paste_hotkey() -> tuple[str, ...]:
+    mode = _resolve_x11_paste_mode()
+    if mode == PasteMode.TERMINAL:
+        return ("ctrl", "shift", "v")
+    if mode == PasteMode.COMPAT:
+        return ("shift", "insert")
+    return get_paste_hotkey()
+
+
+class XTestKeyboardBackend:
+    """Paste and Enter on X11 through XTest over one long-lived Xlib connection.
+
+    Each key sequence is a run of ``fake_input`` requests followed by a single
+    flush, so there are no per-key sleeps and no pyautogui import. Keycodes are
+    looked up once per keysym from the server's keyboard mapping.
+
+    :meth:`type_text` types text without the clipboard by pointing keycodes
+    that the layout leaves empty at the keysyms it needs. The remap is
+    temporary: the keycodes are emptied again before the call returns, so a
+    crash cannot leave the user's keymap changed. Every remap waits a short
+    settle delay, so clients have read the previous press of that keycode.
+    """
+
+    def __init__(self, display):
+        self._display = display
+        self._keycodes: dict[int, int] = {}
+        self._lock = threading.Lock()
+        # keysym -> spare keycode currently mapped to it, least recently used first.
+        self._spare_assignments: OrderedDict[int, int] = OrderedDict()
+        self._spare_pressed_at: dict[int, float] = {}
+
+    @classmethod
+    def connect(cls, display_name: str | None = None) -> XTestKeyboardBackend:
+        from Xlib import display
+
+        connection = display.Display(display_name)
+        if not connection.has_extension("XTEST"):
+            connection.close()
+            raise RuntimeError("X 服务器不支持 XTEST 扩展。")
+        return cls(connection)
+
+    def is_available(self) -> bool:
+        return self._display is not None
+
+    def paste_from_clipboard(self) -> None:
+        self._send_key_sequence(_paste_sequence_for_mode(_resolve_x11_paste_mode()))
+
+    def press_enter(self) -> None:
+        self._send_key_sequence(
+            (
+                (KEYSYM_RETURN, KEY_STATE_PRESSED),
+                (KEYSYM_RETURN, KEY_STATE_RELEASED),
+            )
+        )
+
+    def can_type(self, text: str) -> bool:
+        return bool(text) and all(_keysym_for_char(char) is not None for char in text)
+
+    def type_text(self, text: str, keys_per_sec: float = 0.0) -> None:
+        keysyms = [_keysym_for_char(char) for char in text]
+        governor = _KeyRateGovernor(keys_per_sec)
+        if None in keysyms:
+            raise ValueError("文本包含无法直接输入的字符。")
+        with self._lock:
+            if self._display is None:
+                raise RuntimeError("XTest 键盘连接已关闭。")
+            spare_keycodes = self._find_spare_keycodes()
+            if not spare_keycodes:
+                raise RuntimeError("键盘布局中没有空闲 keycode，无法直接输入。")
+            try:
+                for batch in _split_keysym_batches(keysyms, len(spare_keycodes)):
+                    self._assign_spare_keycodes(batch, spare_keycodes)
+                    keycodes = [self._spare_assignments[keysym] for keysym in batch]
+                    if governor.enabled:
+                        for keycode in keycodes:
+                            governor.wait()
+                            self._send_keycodes([keycode])
+                    else:
+                        self._send_keycodes(keycodes)
+                    pressed_at = time.monotonic()
+                    for keycode in keycodes:
+                        self._spare_pressed_at[keycode] = pressed_at
+            finally:
+                self._release_spare_keycodes()
+
+    def close(self) -> None:
+        with self._lock:
+            display = self._display
+            self._display = None
+            assigned = list(self._spare_assignments.values())
+            self._spare_assignments.clear()
+        if display is not None:
+            try:
+                for keycode in assigned:
+                    display.change_keyboard_mapping(keycode, [(0, 0)])
+                display.close()
+            except Exception:
+                pass
+
+    def _send_key_sequence(self, sequence: tuple[tuple[int, int], ...]) -> None:
+        from Xlib import X
+
+        with self._lock:
+            if self._display is None:
+                raise RuntimeError("XTest 键盘连接已关闭。")
+            events = [
+                (X.KeyPress if state == KEY_STATE_PRESSED else X.KeyRelease, self._keycode(keysym))
+                for keysym, state in sequence
+            ]
+            self._send_events(events)
+
+    def _send_keycodes(self, keycodes: list[int]) -> None:
+        from Xlib import X
+
+        self._send_events([(event_type, keycode) for keycode in keycodes for event_type in (X.KeyPress, X.KeyRelease)])
+
+    def _send_events(self, events: list[tuple[int, int]]) -> None:
+        from Xlib.ext import xtest
+
+        try:
+            for event_type, keycode in events:
+                xtest.fake_input(self._display, event_type, keycode)
+            self._display.flush()
+        except Exception as exc:
+            # The connection is unusable; the next paste opens a new one.
+            self._drop_display()
+            raise RuntimeError(f"XTest 按键发送失败: {exc}") from exc
+
+    def _drop_display(self) -> None:
+        display = self._display
+        self._display = None
+        self._spare_assignments.clear()
+        try:
+            display.close()
+        except Exception:
+            pass
+
+    def _find_spare_keycodes(self) -> list[int]:
+        """Keycodes the current layout leaves without keysyms."""
+        info = self._display.display.info
+        first = info.min_keycode
+        try:
+            mapping = self._display.get_keyboard_mapping(first, info.max_keycode - first + 1)
+        except Exception as exc:
+            self._drop_display()
+            raise RuntimeError(f"读取 X11 键盘映射失败: {exc}") from exc
+        empty = [first + offset for offset, row in enumerate(mapping) if not any(row)]
+        return empty[:XTEST_MAX_SPARE_KEYCODES]
+
+    def _release_spare_keycodes(self) -> None:
+        """Empty the keycodes this call remapped, once clients have read the last presses."""
+        assigned = list(self._spare_assignments.values())
+        self._spare_assignments.clear()
+        if not assigned or self._display is None:
+            return
+        self._wait_for_spare_keycodes_read(assigned)
+        try:
+            for keycode in assigned:
+                self._display.change_keyboard_mapping(keycode, [(0, 0)])
+            self._display.sync()
+        except Exception as exc:
+            self._drop_display()
+            raise RuntimeError(f"XTest 键盘映射恢复失败: {exc}") from exc
+
+    def _wait_for_spare_keycodes_read(self, keycodes: list[int]) -> None:
+        # A client that has not yet read an earlier press of this keycode would
+        # look it up in the new mapping and type the wrong character.
+        settle_until = max(self._spare_pressed_at.get(keycode, 0.0) + XTEST_REMAP_SETTLE_SEC for keycode in keycodes)
+        remaining = settle_until - time.monotonic()
+        if remaining > 0:
+            threading.Event().wait(remaining)
+
+    def _assign_spare_keycodes(self, batch: list[int], spare_keycodes: list[int]) -> None:
+        needed = list(dict.fromkeys(batch))
+        for keysym in needed:
+            if keysym in self._spare_assignments:
+                self._spare_assignments.move_to_end(keysym)
+        used = set(self._spare_assignments.values())
+        free = [keycode for keycode in spare_keycodes if keycode not in used]
+        remaps = []
+        for keysym in needed:
+            if keysym in self._spare_assignments:
+                continue
+            if free:
+                keycode = free.pop(0)
+            else:
+                victim = next(old for old in self._spare_assignments if old not in needed)
+                keycode = self._spare_assignments.pop(victim)
+            self._spare_assignments[keysym] = keycode
+            remaps.append((keycode, keysym))
+        if not remaps:
+            return
+        self._wait_for_spare_keycodes_read([keycode for keycode, _keysym in remaps])
+        try:
+            for keycode, keysym in remaps:
+                self._display.change_keyboard_mapping(keycode, [(keysym, keysym)])
+            self._display.sync()
+        except Exception as exc:
+            self._drop_display()
+            raise RuntimeError(f"XTest 键盘映射修改失败: {exc}") from exc
+
+    def _keycode(self, keysym: int) -> int:
+        keycode = self._keycodes.get(keysym)
+        if keycode is None:
+            keycode = self._display.keysym_to_keycode(keysym)
+            if not keycode:
+                raise RuntimeError(f"当前键盘布局没有 keysym 0x{keysym:x} 对应的按键。")
+            self._keycodes[keysym] = keycode
+        return keycode
+
+
+def _keysym_for_char(char: str) -> int | None:
+    """X keysym that types ``char``, or ``None`` when it should go through the clipboard.
+
+    Newlines and tabs are left to the clipboard: typed as Return or Tab they
+    would send a chat message or move focus instead of inserting text.
+    """
+    codepoint = ord(char)
+    if 0x20 <= codepoint <= 0x7E or 0xA0 <= codepoint <= 0xFF:
+        return codepoint
+    if codepoint > 0xFF and char.isprintable():
+        return 0x01000000 + codepoint
+    return None
+
+
+def _split_keysym_batches(keysyms: list[int], max_distinct: int) -> list[list[int]]:
+    """Split keysyms into runs that each need at most ``max_distinct`` keycodes."""
+    batches: list[list[int]] = []
+    batch: list[int] = []
+    distinct: set[int] = set()
+    for keysym in keysyms:
+        if keysym not in distinct and len(distinct) >= max_distinct:
+            batches.append(batch)
+            batch, distinct = [], set()
+        batch.append(keysym)
+        distinct.add(keysym)
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def _keysym_tap_sequence(keysyms: list[int]) -> tuple[tuple[int, int], ...]:
+    return tuple(
+        (keysym, state) for keysym in keysyms for state in (KEY_STATE_PRESSED, KEY_STATE_RELEASED)
+    )
+
+
+class _KeyRateGovernor:
+    """Spaces typed characters at most ``keys_per_sec`` apart; 0 means no limit."""
+
+    def __init__(self, keys_per_sec: float):
+        self._interval = 1.0 / keys_per_sec if keys_per_sec > 0 else 0.0
+        self._next_at = time.monotonic()
+
+    @property
+    def enabled(self) -> bool:
+        return self._interval > 0
+
+    def wait(self) -> None:
+        remaining = self._next_at - time.monotonic()
+        if remaining > 0:
+            threading.Event().wait(remaining)
+        self._next_at = max(self._next_at, time.monotonic()) + self._interval
+
+
+def _type_text_directly(text: str, keys_per_sec: float = 0.0) -> bool:
+    """Type ``text`` key by key without the clipboard; ``False`` if not possible here."""
+    if get_text_injection_strategy() != TextInjectionStrategy.DIRECT:
+        return False
+    if _is_linux_wayland():
+        return _get_remote_desktop_portal_backend().type_text(text, keys_per_sec)
+    if not _is_linux_x11():
+        return False
+    xtest = _get_xtest_keyboard_backend()
+    if xtest is None or not xtest.can_type(text):
+        return False
+    xtest.type_text(text, keys_per_sec)
+    return True
+
+
+def warm_up_injection_stack() -> dict[str, float]:
+    """Create the lazily built injection backends before the first text arrives.
+
+    Meant to run on the injection thread, which then owns the backends just as
+    if the first paste had created them. Returns the seconds each component
+    took. A failing step is logged and skipped; the first paste retries it.
+    """
+    steps: list[tuple[str, Any]] = [("runtime", ensure_runtime_supported)]
+    auto_paste = get_paste_mode() == PasteMode.AUTO
+    if _is_linux_wayland():
+        steps.append(("portal", lambda: _get_remote_desktop_portal_backend().ensure_clipboard()))
+        steps.append(("clipboard", _get_clipboard_backend))
+        if auto_paste:
+            steps.append(("focus_tracker", _get_focus_tracker))
+            steps.append(("shell_focus", _get_shell_focus_info))
+            steps.append(("atspi_python", _find_system_python_with_atspi))
+    elif _is_linux_x11():
+        steps.append(("xtest", _get_xtest_keyboard_backend))
+        steps.append(("clipboard", _get_clipboard_backend))
+        if auto_paste:
+            steps.append(("x11_focus", _get_x11_focus_classifier))
+        # pyautogui is only the fallback when XTEST is missing.
+        steps.append(("pyautogui_fallback", lambda: _get_xtest_keyboard_backend() or _get_pyautogui()))
+    else:
+        steps.append(("pyautogui", _get_pyautogui))
+
+    timings: dict[str, float] = {}
+    for name, step in steps:
+        started_at = time.perf_counter()
+        try:
+            step()
+        except Exception as exc:
+            logging.warning(f"输入注入预热 {name} 失败: {exc}")
+        timings[name] = time.perf_counter() - started_at
+    return timings
+
+
+def _get_xtest_keyboard_backend() -> XTestKeyboardBackend | None:
+    """Return the shared XTest backend, or ``None`` to fall back to pyautogui."""
+    global _XTEST_BACKEND, _XTEST_BACKEND_FAILED_AT
+    with _XTEST_BACKEND_LOCK:
+        if _XTEST_BACKEND is not None and _XTEST_BACKEND.is_available():
+            return _XTEST_BACKEND
+        _XTEST_BACKEND = None
+        if time.monotonic() - _XTEST_BACKEND_FAILED_AT < X11_FOCUS_RECONNECT_BACKOFF_SEC:
+            return None
+        try:
+            _XTEST_BACKEND = XTestKeyboardBackend.connect()
+        except Exception as exc:
+            _XTEST_BACKEND_FAILED_AT = time.monotonic()
+            logging.warning(f"XTest 键盘不可用，改用 pyautogui: {exc}")
+            return None
+        return _XTEST_BACKEND
+
+
+class _X11FocusClassifier:
+    """Classifies the active X11 window from its ``WM_CLASS``.
+
+    Reads ``_NET_ACTIVE_WINDOW`` from the root window and ``WM_CLASS`` from the
+    window it names, over one Xlib connection kept open for the process. That
+    is two property reads per paste, so X11 needs neither AT-SPI nor sampling.
+    """
+
+    def __init__(self, display):
+        self._display = display
+        self._root = display.screen().root
+        self._net_active_window = display.intern_atom("_NET_ACTIVE_WINDOW")
+        self._lock = threading.Lock()
+
+    @classmethod
+    def connect(cls, display_name: str | None = None) -> _X11FocusClassifier:
+        from Xlib import display
+
+        return cls(display.Display(display_name))
+
+    def active_window_class(self) -> tuple[str, ...] | None:
+        from Xlib import Xatom, error
+
+        with self._lock:
+            active = self._root.get_full_property(self._net_active_window, Xatom.WINDOW)
+            if active is None or len(active.value) == 0 or not int(active.value[0]):
+                return None
+            window = self._display.create_resource_object("window", int(active.value[0]))
+            try:
+                wm_class = window.get_wm_class()
+            except error.BadWindow:
+                # The window went away between the two reads.
+                return None
+        return tuple(wm_class) if wm_class else None
+
+    def classify(self) -> _FocusKind:
+        wm_class = self.active_window_class()
+        if not wm_class:
+            return _FocusKind.UNCERTAIN
+        if any(_normalize_terminal_app_name(name) in TERMINAL_APP_NAMES for name in wm_class):
+            return _FocusKind.TERMINAL
+        return _FocusKind.NORMAL
+
+    def close(self) -> None:
+        with self._lock:
+            try:
+                self._display.close()
+            except Exception:
+                pass
+
+
+def _get_x11_focus_classifier() -> _X11FocusClassifier | None:
+    """Return the shared X11 classifier, reconnecting at most every few seconds."""
+    global _X11_FOCUS_CLASSIFIER, _X11_FOCUS_CLASSIFIER_FAILED_AT
+    with _X11_FOCUS_CLASSIFIER_LOCK:
+        if _X11_FOCUS_CLASSIFIER is not None:
+            return _X11_FOCUS_CLASSIFIER
+        if time.monotonic() - _X11_FOCUS_CLASSIFIER_FAILED_AT < X11_FOCUS_RECONNECT_BACKOFF_SEC:
+            return None
+        try:
+            _X11_FOCUS_CLASSIFIER = _X11FocusClassifier.connect()
+        except Exception as exc:
+            _X11_FOCUS_CLASSIFIER_FAILED_AT = time.monotonic()
+            logging.warning(f"无法连接 X11 显示，自动粘贴改用 Ctrl+V: {exc}")
+            return None
+        return _X11_FOCUS_CLASSIFIER
+
+
+def _classify_x11_focus() -> _FocusKind:
+    global _X11_FOCUS_CLASSIFIER, _X11_FOCUS_CLASSIFIER_FAILED_AT
+    classifier = _get_x11_focus_classifier()
+    if classifier is None:
+        return _FocusKind.UNCERTAIN
+    try:
+        return classifier.classify()
+    except Exception as exc:
+        # A dead connection is dropped and reopened on a later paste.
+        logging.warning(f"读取 X11 活动窗口失败: {exc}")
+        with _X11_FOCUS_CLASSIFIER_LOCK:
+            if _X11_FOCUS_CLASSIFIER is classifier:
+                _X11_FOCUS_CLASSIFIER = None
+                _X11_FOCUS_CLASSIFIER_FAILED_AT = time.monotonic()
+        classifier.close()
+        return _FocusKind.UNCERTAIN
+
+
+class _X11ClipboardBackend:
+    """CLIPBOARD selection owned in-process over its own Xlib connection.
+
+    The text is served from memory: a reader thread answers ``SelectionRequest``
+    from the paste target, so the moment the target fetched the data is known
+    and Enter and the clipboard restore no longer wait out fixed delays.
+    """
+
+    def __init__(self, display):
+        from Xlib import X, Xatom
+
+        self._display = display
+        self._root = display.screen().root
+        # PropertyChangeMask lets paste() follow INCR transfers into our property.
+        self._window = self._root.create_window(
+            0, 0, 1, 1, 0, X.CopyFromParent, event_mask=X.PropertyChangeMask
+        )
+        self._clipboard = display.intern_atom("CLIPBOARD")
+        self._targets = display.intern_atom("TARGETS")
+        self._incr = display.intern_atom("INCR")
+        self._clipboard_manager = display.intern_atom("CLIPBOARD_MANAGER")
+        self._save_targets = display.intern_atom("SAVE_TARGETS")
+        self._property = display.intern_atom("VOICING_CLIPBOARD")
+        self._active_window = display.intern_atom("_NET_ACTIVE_WINDOW")
+        # XIDs of one client share the bits outside the server's resource id mask.
+        self._client_mask = ~display.info.resource_id_mask
+        self._text_targets = {display.intern_atom(name): name for name in X11_CLIPBOARD_TEXT_TARGETS}
+        self._text_targets[Xatom.STRING] = "STRING"
+        # Leave room for the ChangeProperty header; dictated text never gets near it.
+        self._max_content_bytes = display.info.max_request_length * 4 - 64
+        self._lock = threading.Lock()
+        self._read_lock = threading.Lock()
+        self._content: bytes | None = None
+        self._is_owner = False
+        self._closed = threading.Event()
+        self._expecting_transfer = False
+        self._uncounted_transfer = False
+        self._transfer_clients: frozenset[int] | None = None
+        self._transfer_served = threading.Event()
+        self._replies: queue.Queue = queue.Queue()
+        self._property_events: queue.Queue = queue.Queue()
+        self._thread = threading.Thread(target=self._read_events, name="voicing-x11-clipboard", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def connect(cls, display_name: str | None = None) -> _X11ClipboardBackend:
+        # The reader thread blocks in next_event while copy/paste send requests.
+        import Xlib.threaded  # noqa: F401
+        from Xlib import display
+
+        return cls(display.Display(display_name))
+
+    def is_available(self) -> bool:
+        return not self._closed.is_set()
+
+    def paste(self) -> str:
+        with self._lock:
+            if self._is_owner and self._content is not None:
+                return self._content.decode("utf-8", errors="replace")
+        from Xlib import X
+
+        with self._read_lock:
+            _drain_queue(self._replies)
+            utf8_string = next(atom for atom, name in self._text_targets.items() if name == "UTF8_STRING")
+            self._window.convert_selection(self._clipboard, utf8_string, self._property, X.CurrentTime)
+            self._display.flush()
+            try:
+                notify = self._replies.get(timeout=X11_CLIPBOARD_READ_TIMEOUT_SEC)
+            except queue.Empty:
+                raise TimeoutError("读取 X11 CLIPBOARD 超时") from None
+            if notify.property == X.NONE:
+                # No owner, or the owner has no text.
+                return ""
+            _drain_queue(self._property_events)
+            value = self._window.get_full_property(self._property, X.AnyPropertyType)
+            self._window.delete_property(self._property)
+            self._display.flush()
+            if value is None:
+                return ""
+            if value.property_type == self._incr:
+                data = self._read_incr_chunks()
+            else:
+                data = _x11_property_bytes(value.value)
+        return data.decode("utf-8", errors="replace")
+
+    def _read_incr_chunks(self) -> bytes:
+        """Read an INCR transfer; deleting the INCR property has asked for the first chunk."""
+        from Xlib import X
+
+        chunks: list[bytes] = []
+        while True:
+            try:
+                event = self._property_events.get(timeout=X11_CLIPBOARD_READ_TIMEOUT_SEC)
+            except queue.Empty:
+                raise TimeoutError("读取 X11 CLIPBOARD 超时（INCR）") from None
+            if event.atom != self._property or event.state != X.PropertyNewValue:
+                continue
+            value = self._window.get_full_property(self._property, X.AnyPropertyType)
+            self._window.delete_property(self._property)
+            self._display.flush()
+            chunk = _x11_property_bytes(value.value) if value is not None else b""
+            if not chunk:
+                return b"".join(chunks)
+            chunks.append(chunk)
+
+    def fits(self, text: str) -> bool:
+        """Whether ``text`` can be served in one reply; larger text would need INCR."""
+        return len(text.encode("utf-8")) <= self._max_content_bytes
+
+    def copy(self, text: str) -> None:
+        from Xlib import X
+
+        content = text.encode("utf-8")
+        if len(content) > self._max_content_bytes:
+            raise RuntimeError("文本过长，超出 X11 CLIPBOARD 单次传输上限")
+        with self._lock:
+            self._content = content
+            self._is_owner = True
+            self._expecting_transfer = False
+            self._uncounted_transfer = False
+        self._window.set_selection_owner(self._clipboard, X.CurrentTime)
+        owner = self._display.get_selection_owner(self._clipboard)
+        if getattr(owner, "id", owner) != self._window.id:
+            with self._lock:
+                self._is_owner = False
+            raise RuntimeError("无法获取 X11 CLIPBOARD 所有权")
+
+    def expect_transfer(self) -> None:
+        """Count fetches from now on; call right after the paste keystroke.
+
+        Clipboard managers fetch the text as soon as the owner changes, so only
+        requests from the client owning the focused window are counted.
+        """
+        clients = self._focused_clients()
+        with self._lock:
+            self._transfer_clients = clients
+            self._expecting_transfer = True
+            self._transfer_served.clear()
+
+    def wait_for_transfer(self, timeout_sec: float) -> bool | None:
+        """Block until the focused client fetched the content after ``expect_transfer``.
+
+        Returns ``None`` instead of ``False`` on timeout when only uncounted
+        fetches were served: the focus match is a heuristic, so the target may
+        have been among them.
+        """
+        if self._transfer_served.wait(timeout_sec):
+            return True
+        with self._lock:
+            return None if self._uncounted_transfer else False
+
+    def hand_off(self) -> bool:
+        """Keep owned text on the clipboard after Voicing exits; call before ``close``.
+
+        A selection dies with its owner's connection, so the text is given to the
+        clipboard manager (``SAVE_TARGETS``) or, without one, to xclip/xsel the
+        way the pyperclip path left it. Returns whether someone took it.
+        """
+        from Xlib import X, Xatom
+
+        with self._lock:
+            content = self._content if self._is_owner else None
+        if not content or self._closed.is_set():
+            return False
+        try:
+            manager = self._display.get_selection_owner(self._clipboard_manager)
+            if getattr(manager, "id", manager) != X.NONE:
+                with self._read_lock:
+                    _drain_queue(self._replies)
+                    # The property lists the targets the manager should save.
+                    self._window.change_property(self._property, Xatom.ATOM, 32, list(self._text_targets))
+                    self._window.convert_selection(
+                        self._clipboard_manager, self._save_targets, self._property, X.CurrentTime
+                    )
+                    self._display.flush()
+                    notify = self._replies.get(timeout=X11_CLIPBOARD_HANDOFF_TIMEOUT_SEC)
+                if notify.property != X.NONE:
+                    return True
+        except Exception as exc:
+            logging.debug(f"剪贴板管理器未接管 X11 CLIPBOARD: {exc}")
+        for command in (["xclip", "-selection", "clipboard"], ["xsel", "--clipboard", "--input"]):
+            if not which_cached(command[0]):
+                continue
+            try:
+                # Both fork a child that keeps owning the selection after we exit.
+                subprocess.run(command, input=content, env=system_subprocess_env(), check=True, timeout=2)
+                return True
+            except (OSError, subprocess.SubprocessError) as exc:
+                logging.debug(f"{command[0]} 接管 X11 CLIPBOARD 失败: {exc}")
+        logging.warning("退出后 X11 CLIPBOARD 内容将丢失：没有剪贴板管理器，也没有 xclip/xsel")
+        return False
+
+    def _focused_clients(self) -> frozenset[int] | None:
+        """Client id bits of the input focus and the active toplevel, ``None`` if unknown."""
+        from Xlib import X, Xatom
+
+        windows: list[int] = []
+        try:
+            focus = self._display.get_input_focus().focus
+            windows.append(int(getattr(focus, "id", focus)))
+            active = self._root.get_full_property(self._active_window, Xatom.WINDOW)
+            if active is not None and len(active.value):
+                windows.append(int(active.value[0]))
+        except Exception as exc:
+            logging.debug(f"读取 X11 焦点窗口失败: {exc}")
+        clients = frozenset(
+            window & self._client_mask for window in windows if window not in (X.NONE, X.PointerRoot)
+        )
+        return clients or None
+
+    def close(self) -> None:
+        self._closed.set()
+        with self._lock:
+            self._content = None
+            self._is_owner = False
+        try:
+            self._display.close()
+        except Exception:
+            pass
+        if self._thread is not threading.current_thread():
+            self._thread.join(1.0)
+
+    def _read_events(self) -> None:
+        from Xlib import X
+
+        while not self._closed.is_set():
+            try:
+                event = self._display.next_event()
+            except Exception as exc:
+                if not self._closed.is_set():
+                    logging.warning(f"X11 剪贴板连接已断开: {exc}")
+                self._closed.set()
+                return
+            if event.type == X.SelectionRequest:
+                self._serve_request(event)
+            elif event.type == X.SelectionClear:
+                with self._lock:
+                    self._is_owner = False
+            elif event.type == X.SelectionNotify:
+                self._replies.put(event)
+            elif event.type == X.PropertyNotify:
+                self._property_events.put(event)
+
+    def _serve_request(self, event) -> None:
+        from Xlib import X, Xatom, error
+        from Xlib.protocol import event as xevent
+
+        with self._lock:
+            content = self._content if self._is_owner else None
+        # Obsolete clients pass no property and expect the target name to be used.
+        prop = event.property if event.property != X.NONE else event.target
+        served_text = False
+        catch = error.CatchError()
+        if content is None:
+            prop = X.NONE
+        elif event.target == self._targets:
+            event.requestor.change_property(
+                prop, Xatom.ATOM, 32, [self._targets, *self._text_targets], onerror=catch
+            )
+        elif event.target in self._text_targets:
+            if self._text_targets[event.target] == "STRING":
+                data = content.decode("utf-8").encode("latin-1", errors="replace")
+            else:
+                data = content
+            event.requestor.change_property(prop, event.target, 8, data, onerror=catch)
+            served_text = True
+        else:
+            prop = X.NONE
+        notify = xevent.SelectionNotify(
+            time=event.time,
+            requestor=event.requestor,
+            selection=event.selection,
+            target=event.target,
+            property=prop,
+        )
+        event.requestor.send_event(notify, onerror=catch)
+        self._display.flush()
+        if not served_text:
+            return
+        requestor = int(getattr(event.requestor, "id", event.requestor))
+        with self._lock:
+            clients = self._transfer_clients
+            if self._expecting_transfer and (clients is None or requestor & self._client_mask in clients):
+                self._transfer_served.set()
+            else:
+                self._uncounted_transfer = True
+
+
+def _drain_queue(pending: queue.Queue) -> None:
+    while True:
+        try:
+            pending.get_nowait()
+        except queue.Empty:
+            return
+
+
+def _x11_property_bytes(data) -> bytes:
+    if isinstance(data, str):
+        return data.encode("utf-8")
+    return bytes(data)
+
+
+def _get_x11_clipboard_backend() -> _X11ClipboardBackend | None:
+    """Return the shared X11 clipboard, or ``None`` to fall back to pyperclip."""
+    global _X11_CLIPBOARD, _X11_CLIPBOARD_FAILED_AT
+    with _X11_CLIPBOARD_LOCK:
+        if _X11_CLIPBOARD is not None and _X11_CLIPBOARD.is_available():
+            return _X11_CLIPBOARD
+        _X11_CLIPBOARD = None
+        if time.monotonic() - _X11_CLIPBOARD_FAILED_AT < X11_FOCUS_RECONNECT_BACKOFF_SEC:
+            return None
+        try:
+            _X11_CLIPBOARD = _X11ClipboardBackend.connect()
+        except Exception as exc:
+            _X11_CLIPBOARD_FAILED_AT = time.monotonic()
+            logging.warning(f"X11 剪贴板不可用，改用 pyperclip: {exc}")
+            return None
+        return _X11_CLIPBOARD
+
+
+@dataclass(frozen=True)
+class PasteModeCacheStats:
+    hits: int
+    misses: int
+    invalidations: int
+    size: int
+
+
+class _PasteModeCache:
+    """LRU of paste modes confirmed by a full focus vote, keyed by (app, role).
+
+    Only consulted once the focus tracker and GNOME Shell have no answer; both
+    already classify focus without a scan, so no cheaper identity is left to
+    key on and a lookup still costs one AT-SPI probe. What a hit saves is the
+    vote: up to ``ATSPI_FOCUS_MAX_SAMPLES`` probes over
+    ``ATSPI_FOCUS_SAMPLE_WINDOW_SEC``. A single probe is too flaky to trust on
+    its own (focus briefly lands on GNOME Shell, popups, ...), so an identity
+    is cached only after a vote agrees with the probe taken alongside it.
+    """
+
+    def __init__(self, ttl_sec: float = PASTE_MODE_CACHE_TTL_SEC, max_entries: int = PASTE_MODE_CACHE_MAX_ENTRIES):
+        self._ttl_sec = ttl_sec
+        self._max_entries = max_entries
+        self._entries: OrderedDict[tuple[str, str], tuple[PasteMode, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+
+    def get(self, key: tuple[str, str]) -> PasteMode | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[1] > self._ttl_sec:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[0]
+
+    def put(self, key: tuple[str, str], mode: PasteMode) -> None:
+        with self._lock:
+            self._entries[key] = (mode, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_app(self, app_name: str) -> None:
+        app_name = _normalize_terminal_app_name(app_name)
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == app_name]:
+                del self._entries[key]
+                self._invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> PasteModeCacheStats:
+        with self._lock:
+            return PasteModeCacheStats(self._hits, self._misses, self._invalidations, len(self._entries))
 
 
-def _shift_insert_sequence() -> tuple[tuple[int, int], ...]:
+_PASTE_MODE_CACHE = _PasteModeCache()
+
+
+def get_paste_mode_cache_stats() -> PasteModeCacheStats:
+    return _PASTE_MODE_CACHE.stats()
+
+
+def _paste_mode_cache_key(info: dict[str, str] | None) -> tuple[str, str] | None:
+    if _classify_focus_info(info) == _FocusKind.UNCERTAIN:
+        return None
     return (
-        (KEYSYM_SHIFT_L, KEY_STATE_PRESSED),
-        (KEYSYM_INSERT, KEY_STATE_PRESSED),
-        (KEYSYM_INSERT, KEY_STATE_RELEASED),
-        (KEYSYM_SHIFT_L, KEY_STATE_RELEASED),
+        _normalize_terminal_app_name(str(info.get("app_name", ""))),
+        str(info.get("role", "")).strip().lower(),
     )
 
 
+def _probe_focus_info() -> dict[str, str] | None:
+    """One cheap focus scan, without starting any helper process."""
+    info = _get_focused_accessible_info_in_process()
+    if info is not None:
+        return info
+    helper = _ATSPI_HELPER
+    if helper is None or not helper.is_running():
+        return None
+    try:
+        return helper.scan()
+    except Exception:
+        return None
+
+
+class _GnomeShellWindowIntrospector:
+    """Focused window's app id and ``WM_CLASS`` from GNOME Shell's Introspect API.
+
+    ``GetWindows`` is a single D-Bus round trip instead of an AT-SPI tree walk.
+    Its reply is cached until Shell emits ``WindowsChanged`` or
+    ``RunningApplicationsChanged`` (the latter fires on focus changes), so
+    repeated pastes into one window cost nothing. Shell refuses callers it has
+    not allowed; such an error disables the introspector for the process.
+    """
+
+    def __init__(self, bus=None):
+        self._bus = bus
+        self._lock = threading.Lock()
+        self._receiver = None
+        self._generation = 0
+        self._cached_generation: int | None = None
+        self._cached_info: dict[str, str] | None = None
+        self._disabled = False
+
+    @property
+    def disabled(self) -> bool:
+        return self._disabled
+
+    def focused_window_info(self) -> dict[str, str] | None:
+        with self._lock:
+            if self._disabled:
+                return None
+            if self._receiver is None:
+                self._connect_signals()
+            generation = self._generation
+            if self._cached_generation == generation:
+                return self._cached_info
+
+            from PyQt5.QtDBus import QDBusInterface
+
+            iface = QDBusInterface(
+                GNOME_SHELL_INTROSPECT_SERVICE,
+                GNOME_SHELL_INTROSPECT_PATH,
+                GNOME_SHELL_INTROSPECT_INTERFACE,
+                self._get_bus(),
+            )
+            reply = iface.call("GetWindows")
+            if reply.errorMessage():
+                if reply.errorName() in GNOME_SHELL_INTROSPECT_UNAVAILABLE_ERRORS:
+                    self._disabled = True
+                    logging.info(f"GNOME Shell 窗口内省不可用，改用 AT-SPI 判断焦点: {reply.errorMessage()}")
+                return None
+            arguments = reply.arguments()
+            info = _focused_shell_window_info(arguments[0] if arguments else {})
+            # Only cache when a change signal can invalidate the entry.
+            if self._receiver is not None:
+                self._cached_generation = generation
+                self._cached_info = info
+            return info
+
+    def invalidate(self) -> None:
+        self._generation += 1
+
+    def close(self) -> None:
+        receiver = self._receiver
+        self._receiver = None
+        self._cached_generation = None
+        if receiver is None:
+            return
+        try:
+            bus = self._get_bus()
+            for name in ("WindowsChanged", "RunningApplicationsChanged"):
+                bus.disconnect(
+                    GNOME_SHELL_INTROSPECT_SERVICE,
+                    GNOME_SHELL_INTROSPECT_PATH,
+                    GNOME_SHELL_INTROSPECT_INTERFACE,
+                    name,
+                    receiver.on_signal,
+                )
+            receiver.deleteLater()
+        except Exception:
+            pass
+
+    def _get_bus(self):
+        if self._bus is not None:
+            return self._bus
+        from PyQt5.QtDBus import QDBusConnection
+
+        return QDBusConnection.sessionBus()
+
+    def _connect_signals(self) -> None:
+        from PyQt5.QtCore import QCoreApplication, QObject, pyqtSlot
+        from PyQt5.QtDBus import QDBusMessage
+
+        app = QCoreApplication.instance()
+        if app is None:
+            return
+        introspector = self
+
+        class WindowsChangedReceiver(QObject):
+            @pyqtSlot(QDBusMessage)
+            def on_signal(self, message):
+                introspector.invalidate()
+
+        receiver = WindowsChangedReceiver()
+        receiver.moveToThread(app.thread())
+        bus = self._get_bus()
+        for name in ("WindowsChanged", "RunningApplicationsChanged"):
+            if not bus.connect(
+                GNOME_SHELL_INTROSPECT_SERVICE,
+                GNOME_SHELL_INTROSPECT_PATH,
+                GNOME_SHELL_INTROSPECT_INTERFACE,
+                name,
+                receiver.on_signal,
+            ):
+                return
+        self._receiver = receiver
+
+
+def _focused_shell_window_info(windows: dict) -> dict[str, str] | None:
+    """Map the focused ``GetWindows`` entry to the AT-SPI style focus info."""
+    for properties in dict(windows or {}).values():
+        properties = dict(properties or {})
+        if not properties.get("has-focus"):
+            continue
+        names = [
+            _normalize_terminal_app_name(str(properties.get(key, "") or ""))
+            for key in ("app-id", "wm-class")
+        ]
+        names = [name for name in names if name]
+        app_name = next((name for name in names if name in TERMINAL_APP_NAMES), names[0] if names else "")
+        return {"app_name": app_name, "role": "frame", "name": str(properties.get("title", "") or "")}
+    return None
+
+
+def _get_shell_focus_info() -> dict[str, str] | None:
+    """Focused window from GNOME Shell, or ``None`` when Shell will not tell us."""
+    global _SHELL_INTROSPECTOR
+    if not _is_linux_wayland():
+        return None
+    with _SHELL_INTROSPECTOR_LOCK:
+        if _SHELL_INTROSPECTOR is None:
+            _SHELL_INTROSPECTOR = _GnomeShellWindowIntrospector()
+        introspector = _SHELL_INTROSPECTOR
+    try:
+        return introspector.focused_window_info()
+    except Exception:
+        return None
+
+
 def is_current_focus_terminal() -> bool:
     return _resolve_auto_paste_mode() == PasteMode.TERMINAL
 
 
 def _resolve_auto_paste_mode() -> PasteMode:
+    # A paste prefetch thread and the injection thread can both land here, and
+    # libatspi is not thread-safe; only one of them scans focus at a time.
+    with _AUTO_PASTE_MODE_LOCK:
+        return _resolve_auto_paste_mode_locked()
+
+
+def _resolve_auto_paste_mode_locked() -> PasteMode:
+    tracker = _get_focus_tracker()
+    tracked_info = tracker.current_focus_info() if tracker is not None else None
+    tracked_kind = _classify_focus_info(tracked_info)
+    if tracked_kind == _FocusKind.TERMINAL:
+        _remember_terminal_focus(tracked_info)
+        return PasteMode.TERMINAL
+    if tracked_kind == _FocusKind.NORMAL:
+        _clear_terminal_focus_cache()
+        return PasteMode.NORMAL
+
+    shell_info = _get_shell_focus_info()
+    shell_kind = _classify_focus_info(shell_info)
+    if shell_kind == _FocusKind.TERMINAL:
+        _remember_terminal_focus(shell_info)
+        return PasteMode.TERMINAL
+    if shell_kind == _FocusKind.NORMAL:
+        _clear_terminal_focus_cache()
+        return PasteMode.NORMAL
+
+    # The tracker and Shell answered above whenever they could; the cache key
+    # needs this one scan, which a hit trades for the whole sampling vote.
+    probe_info = _probe_focus_info()
+    cache_key = _paste_mode_cache_key(probe_info)
+    cached_mode = _PASTE_MODE_CACHE.get(cache_key) if cache_key is not None else None
+    if cached_mode == PasteMode.TERMINAL:
+        _remember_terminal_focus(probe_info)
+        return PasteMode.TERMINAL
+    if cached_mode == PasteMode.NORMAL:
+        _clear_terminal_focus_cache()
+        return PasteMode.NORMAL
+
     samples = _sample_focus_infos()
     terminal_votes = 0
     normal_votes = 0
@@ -560,13 +2716,18 @@ def _resolve_auto_paste_mode() -> PasteMode:
         elif kind == _FocusKind.NORMAL:
             normal_votes += 1
 
+    probe_kind = _classify_focus_info(probe_info)
     if terminal_votes > normal_votes:
         if terminal_info:
             _remember_terminal_focus(terminal_info)
+        if probe_kind == _FocusKind.TERMINAL:
+            _PASTE_MODE_CACHE.put(cache_key, PasteMode.TERMINAL)
         return PasteMode.TERMINAL
 
     if normal_votes > terminal_votes:
         _clear_terminal_focus_cache()
+        if probe_kind == _FocusKind.NORMAL:
+            _PASTE_MODE_CACHE.put(cache_key, PasteMode.NORMAL)
         return PasteMode.NORMAL
 
     if terminal_votes == normal_votes:
@@ -577,8 +2738,339 @@ def _resolve_auto_paste_mode() -> PasteMode:
     return PasteMode.NORMAL
 
 
+class _AtspiFocusTracker:
+    """Keeps the focused accessible current from AT-SPI focus/window events.
+
+    The listener runs in a long-lived helper process (the same interpreter when
+    it has ``gi``, otherwise the system Python) that prints one JSON line per
+    event, so answering the paste-mode question is a dict lookup instead of a
+    desktop scan. ``current_focus_info`` returns None whenever the tracker has
+    nothing trustworthy and callers fall back to sampling.
+    """
+
+    def __init__(self, python: str):
+        self._python = python
+        self._lock = threading.Lock()
+        self._info: dict[str, str] | None = None
+        self._process: subprocess.Popen | None = None
+        self._reader: threading.Thread | None = None
+        self._stopped_at = 0.0
+
+    def start(self) -> bool:
+        with self._lock:
+            if self._process is not None and self._process.poll() is None:
+                return True
+            if self._stopped_at and time.monotonic() - self._stopped_at < FOCUS_TRACKER_RESTART_BACKOFF_SEC:
+                return False
+            self._info = None
+            try:
+                process = subprocess.Popen(
+                    [self._python, "-c", _ATSPI_FOCUS_EVENT_HELPER],
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.DEVNULL,
+                    text=True,
+                    env=system_subprocess_env(),
+                )
+            except Exception:
+                self._stopped_at = time.monotonic()
+                return False
+            self._process = process
+            self._reader = threading.Thread(
+                target=self._read_events,
+                args=(process,),
+                name="voicing-atspi-focus",
+                daemon=True,
+            )
+            self._reader.start()
+            return True
+
+    def stop(self) -> None:
+        with self._lock:
+            process = self._process
+            self._process = None
+            self._info = None
+        if process is not None and process.poll() is None:
+            process.terminate()
+            try:
+                process.wait(1)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    def is_running(self) -> bool:
+        process = self._process
+        return process is not None and process.poll() is None
+
+    def current_focus_info(self) -> dict[str, str] | None:
+        with self._lock:
+            if self._process is None or self._process.poll() is not None:
+                return None
+            return dict(self._info) if self._info is not None else None
+
+    def handle_event(self, event: dict[str, Any]) -> None:
+        kind = str(event.get("event", ""))
+        info = _normalize_accessible_info(event)
+        with self._lock:
+            if kind.startswith("window:deactivate"):
+                # Focus may move to an app that emits no AT-SPI events at all;
+                # forget the old window instead of reporting it as still focused.
+                if self._info is not None and self._info.get("app_name") == info["app_name"]:
+                    self._info = None
+                _PASTE_MODE_CACHE.invalidate_app(info["app_name"])
+                return
+            if kind == "scan" and not any(info.values()):
+                self._info = None
+                return
+            self._info = info
+
+    def _read_events(self, process: subprocess.Popen) -> None:
+        try:
+            for line in process.stdout:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(event, dict):
+                    self.handle_event(event)
+        except Exception:
+            pass
+        finally:
+            process.stdout.close()
+        with self._lock:
+            if self._process is process:
+                self._process = None
+                self._info = None
+                self._stopped_at = time.monotonic()
+
+
+def _get_focus_tracker() -> _AtspiFocusTracker | None:
+    """Return the running focus tracker, starting it on first use."""
+    global _FOCUS_TRACKER
+    with _FOCUS_TRACKER_LOCK:
+        if _FOCUS_TRACKER is None:
+            python = _find_atspi_event_python()
+            if python is None:
+                return None
+            _FOCUS_TRACKER = _AtspiFocusTracker(python)
+        tracker = _FOCUS_TRACKER
+    if not tracker.start():
+        return None
+    return tracker
+
+
+def stop_focus_helpers() -> None:
+    """Stop the focus tracker, the AT-SPI helper and the X11/Shell connections.
+
+    Also writes out the learned settle delays, since this runs at shutdown.
+    """
+    global _FOCUS_TRACKER, _ATSPI_HELPER, _X11_FOCUS_CLASSIFIER, _SHELL_INTROSPECTOR, _XTEST_BACKEND
+    global _X11_CLIPBOARD
+    with _FOCUS_TRACKER_LOCK:
+        tracker = _FOCUS_TRACKER
+        _FOCUS_TRACKER = None
+    if tracker is not None:
+        tracker.stop()
+    with _ATSPI_HELPER_LOCK:
+        helper = _ATSPI_HELPER
+        _ATSPI_HELPER = None
+    if helper is not None:
+        helper.stop()
+    with _X11_FOCUS_CLASSIFIER_LOCK:
+        classifier = _X11_FOCUS_CLASSIFIER
+        _X11_FOCUS_CLASSIFIER = None
+    if classifier is not None:
+        classifier.close()
+    with _SHELL_INTROSPECTOR_LOCK:
+        introspector = _SHELL_INTROSPECTOR
+        _SHELL_INTROSPECTOR = None
+    if introspector is not None:
+        introspector.close()
+    with _XTEST_BACKEND_LOCK:
+        xtest = _XTEST_BACKEND
+        _XTEST_BACKEND = None
+    if xtest is not None:
+        xtest.close()
+    with _X11_CLIPBOARD_LOCK:
+        x11_clipboard = _X11_CLIPBOARD
+        _X11_CLIPBOARD = None
+    if x11_clipboard is not None:
+        x11_clipboard.hand_off()
+        x11_clipboard.close()
+    _SETTLE_DELAYS.save()
+
+
+def _find_atspi_event_python() -> str | None:
+    if not getattr(sys, "frozen", False):
+        try:
+            import importlib.util
+
+            if importlib.util.find_spec("gi") is not None:
+                return sys.executable
+        except Exception:
+            pass
+    return _find_system_python_with_atspi()
+
+
+class _AtspiHelperProcess:
+    """Long-lived system-Python AT-SPI helper speaking line-delimited JSON.
+
+    Used when this interpreter cannot import ``gi`` (the frozen app). The helper
+    pays interpreter start-up, the ``gi`` import and the AT-SPI bus connect once;
+    each ``scan`` request then costs a single desktop scan. A request that does
+    not answer within ``timeout_sec`` kills the helper, and the next request
+    after ``ATSPI_HELPER_MIN_RESTART_INTERVAL_SEC`` starts a fresh one.
+    """
+
+    def __init__(self, python: str, timeout_sec: float = ATSPI_FOCUS_TIMEOUT_SEC):
+        self._python = python
+        self._timeout_sec = timeout_sec
+        self._lock = threading.Lock()
+        self._process: subprocess.Popen | None = None
+        self._responses: queue.Queue = queue.Queue()
+        self._next_id = 0
+        self._started_at = 0.0
+        self.restarts = 0
+
+    def is_running(self) -> bool:
+        process = self._process
+        return process is not None and process.poll() is None
+
+    def ensure_running(self) -> bool:
+        with self._lock:
+            if self.is_running():
+                return True
+            now = time.monotonic()
+            if self._started_at and now - self._started_at < ATSPI_HELPER_MIN_RESTART_INTERVAL_SEC:
+                return False
+            if self._started_at:
+                self.restarts += 1
+            self._started_at = now
+            try:
+                process = subprocess.Popen(
+                    [self._python, "-c", _ATSPI_FOCUS_SERVICE_HELPER],
+                    stdin=subprocess.PIPE,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.DEVNULL,
+                    text=True,
+                    bufsize=1,
+                    env=system_subprocess_env(),
+                )
+            except Exception:
+                return False
+            self._process = process
+            self._responses = queue.Queue()
+            threading.Thread(
+                target=self._read_responses,
+                args=(process, self._responses),
+                name="voicing-atspi-helper",
+                daemon=True,
+            ).start()
+            return True
+
+    def scan(self) -> dict[str, str] | None:
+        result = self.request("scan")
+        if not isinstance(result, dict):
+            return None
+        _record_helper_focus_scan(result)
+        return _normalize_accessible_info(result)
+
+    def request(self, command: str) -> Any:
+        with self._lock:
+            process = self._process
+            if process is None or process.poll() is not None:
+                raise RuntimeError("AT-SPI 辅助进程未运行。")
+            self._next_id += 1
+            request_id = self._next_id
+            responses = self._responses
+            try:
+                process.stdin.write(json.dumps({"id": request_id, "command": command}) + "\n")
+                process.stdin.flush()
+            except (OSError, ValueError) as exc:
+                self._discard(process)
+                raise RuntimeError(f"AT-SPI 辅助进程写入失败: {exc}") from exc
+
+            deadline = time.monotonic() + self._timeout_sec
+            while True:
+                remaining = deadline - time.monotonic()
+                try:
+                    response = responses.get(timeout=max(0.0, remaining))
+                except queue.Empty:
+                    self._discard(process)
+                    raise TimeoutError("AT-SPI 辅助进程响应超时。") from None
+                if response is None:
+                    self._discard(process)
+                    raise RuntimeError("AT-SPI 辅助进程已退出。")
+                if response.get("id") != request_id:
+                    continue
+                if "error" in response:
+                    raise RuntimeError(f"AT-SPI 辅助进程出错: {response['error']}")
+                return response.get("result")
+
+    def stop(self) -> None:
+        with self._lock:
+            process = self._process
+            self._process = None
+        if process is not None:
+            self._kill(process)
+
+    def _discard(self, process: subprocess.Popen) -> None:
+        if self._process is process:
+            self._process = None
+        self._kill(process)
+
+    def _kill(self, process: subprocess.Popen) -> None:
+        try:
+            process.kill()
+            process.wait(1)
+            process.stdin.close()
+        except Exception:
+            pass
+
+    def _read_responses(self, process: subprocess.Popen, responses: queue.Queue) -> None:
+        try:
+            for line in process.stdout:
+                try:
+                    response = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(response, dict):
+                    responses.put(response)
+        except Exception:
+            pass
+        finally:
+            process.stdout.close()
+        responses.put(None)
+
+
+def _get_atspi_helper() -> _AtspiHelperProcess | None:
+    global _ATSPI_HELPER
+    with _ATSPI_HELPER_LOCK:
+        if _ATSPI_HELPER is None:
+            python = _find_system_python_with_atspi()
+            if python is None:
+                return None
+            _ATSPI_HELPER = _AtspiHelperProcess(python)
+        helper = _ATSPI_HELPER
+    if not helper.ensure_running():
+        return None
+    return helper
+
+
+def _sample_focus_infos_from_helper() -> list[dict[str, str] | None]:
+    helper = _get_atspi_helper()
+    if helper is None:
+        return []
+    samples = _collect_focus_samples(helper.scan)
+    if not helper.is_running():
+        # Crashed or timed out mid-window; let the one-shot helper answer.
+        return []
+    return samples
+
+
 def _sample_focus_infos() -> list[dict[str, str] | None]:
     samples = _sample_focus_infos_in_process()
+    if samples:
+        return samples
+    samples = _sample_focus_infos_from_helper()
     if samples:
         return samples
     samples = _sample_focus_infos_from_system_python()
@@ -601,15 +3093,26 @@ def _sample_focus_infos_in_process() -> list[dict[str, str] | None]:
 def _collect_focus_samples(probe) -> list[dict[str, str] | None]:
     samples: list[dict[str, str] | None] = []
     deadline = time.monotonic() + ATSPI_FOCUS_SAMPLE_WINDOW_SEC
+    terminal_votes = 0
+    normal_votes = 0
 
     while len(samples) < ATSPI_FOCUS_MAX_SAMPLES:
         try:
-            samples.append(probe())
+            sample = probe()
         except Exception:
-            samples.append(None)
+            sample = None
+        samples.append(sample)
+        kind = _classify_focus_info(sample)
+        if kind == _FocusKind.TERMINAL:
+            terminal_votes += 1
+        elif kind == _FocusKind.NORMAL:
+            normal_votes += 1
 
         if len(samples) >= ATSPI_FOCUS_MAX_SAMPLES:
             break
+        # Stop once the remaining samples can no longer change the majority.
+        if abs(terminal_votes - normal_votes) > ATSPI_FOCUS_MAX_SAMPLES - len(samples):
+            break
         remaining = deadline - time.monotonic()
         if remaining <= 0:
             break
@@ -708,6 +3211,9 @@ def _sample_focus_infos_from_system_python(
             timeout=timeout_sec,
             check=False,
         )
+    except OSError:
+        invalidate_capability("system_python_atspi")
+        return []
     except Exception:
         return []
     if result.returncode != 0 or not result.stdout.strip():
@@ -719,10 +3225,18 @@ def _sample_focus_infos_from_system_python(
     if single_sample:
         if not isinstance(data, dict):
             return []
+        _record_helper_focus_scan(data)
         return [_normalize_accessible_info(data)]
     if not isinstance(data, list):
         return []
-    return [_normalize_accessible_info(item) if isinstance(item, dict) else None for item in data]
+    samples = []
+    for item in data:
+        if isinstance(item, dict):
+            _record_helper_focus_scan(item)
+            samples.append(_normalize_accessible_info(item))
+        else:
+            samples.append(None)
+    return samples
 
 
 def _normalize_accessible_info(data: dict[str, Any]) -> dict[str, str]:
@@ -734,6 +3248,10 @@ def _normalize_accessible_info(data: dict[str, Any]) -> dict[str, str]:
 
 
 def _find_system_python_with_atspi() -> str | None:
+    return get_capability("system_python_atspi", _probe_system_python_with_atspi)
+
+
+def _probe_system_python_with_atspi() -> str | None:
     current_executable = os.path.abspath(sys.executable)
     for candidate in ("/usr/bin/python3", shutil.which("python3")):
         if not candidate:
@@ -747,17 +3265,33 @@ def _find_system_python_with_atspi() -> str | None:
 
 
 def _scan_atspi_desktop(Atspi) -> dict[str, str] | None:
-    desktop = Atspi.get_desktop(0)
-    focused = _find_focused_accessible(Atspi, desktop)
-    focused_info = _accessible_info(Atspi, focused) if focused is not None else None
-    if focused_info and _is_terminal_accessible_info(focused_info):
+    scan = _FocusScan()
+    try:
+        desktop = Atspi.get_desktop(0)
+        focused = _find_focused_accessible(Atspi, desktop, scan=scan)
+        focused_info = _accessible_info(Atspi, focused) if focused is not None else None
+        if focused_info and _is_terminal_accessible_info(focused_info):
+            return focused_info
+
+        if _should_scan_active_fallback(focused_info):
+            active = _find_active_accessible(Atspi, desktop, scan=scan)
+            if active is not None:
+                return _accessible_info(Atspi, active)
         return focused_info
+    finally:
+        _record_focus_scan(scan.nodes_visited)
 
-    if _should_scan_active_fallback(focused_info):
-        active = _find_active_accessible(Atspi, desktop)
-        if active is not None:
-            return _accessible_info(Atspi, active)
-    return focused_info
+
+def _record_helper_focus_scan(data: dict[str, Any]) -> None:
+    nodes_visited = data.get("nodes_visited")
+    if isinstance(nodes_visited, int):
+        _record_focus_scan(nodes_visited)
+
+
+def _record_focus_scan(nodes_visited: int) -> None:
+    global _LAST_FOCUS_SCAN_NODES_VISITED
+    _LAST_FOCUS_SCAN_NODES_VISITED = int(nodes_visited)
+    logging.debug(f"AT-SPI 焦点扫描访问 {_LAST_FOCUS_SCAN_NODES_VISITED} 个节点")
 
 
 def _is_terminal_accessible_info(info: dict[str, str]) -> bool:
@@ -784,41 +3318,91 @@ def _should_scan_active_terminal_fallback(info: dict[str, str] | None) -> bool:
     return _should_scan_active_fallback(info)
 
 
-def _find_focused_accessible(Atspi, root, max_depth: int = 7):
-    stack = [(root, 0)]
-    while stack:
-        accessible, depth = stack.pop()
-        try:
-            state_set = accessible.get_state_set()
-            if state_set.contains(Atspi.StateType.FOCUSED):
-                return accessible
-            child_count = accessible.get_child_count()
-        except Exception:
-            continue
-        if depth >= max_depth:
-            continue
-        for index in range(min(child_count, 120) - 1, -1, -1):
+class _FocusScan:
+    """Per-scan state: node visit count and the active top-level window."""
+
+    _UNKNOWN = object()
+
+    def __init__(self):
+        self.nodes_visited = 0
+        self.active_window = self._UNKNOWN
+
+
+def _find_active_window(Atspi, desktop, scan: _FocusScan | None = None):
+    """Top-level window with ACTIVE state, reading only applications and their windows."""
+    if scan is not None and scan.active_window is not _FocusScan._UNKNOWN:
+        return scan.active_window
+    active_window = None
+    for app in _accessible_children(desktop, 120):
+        for window in _accessible_children(app, 40):
+            if scan is not None:
+                scan.nodes_visited += 1
             try:
-                stack.append((accessible.get_child_at_index(index), depth + 1))
+                if window.get_state_set().contains(Atspi.StateType.ACTIVE):
+                    active_window = window
+                    break
             except Exception:
-                pass
-    return None
+                continue
+        if active_window is not None:
+            break
+    if scan is not None:
+        scan.active_window = active_window
+    return active_window
 
 
-def _find_active_accessible(Atspi, root, max_depth: int = 4):
+def _accessible_children(accessible, limit: int) -> list:
+    try:
+        child_count = accessible.get_child_count()
+    except Exception:
+        return []
+    children = []
+    for index in range(min(child_count, limit)):
+        try:
+            children.append(accessible.get_child_at_index(index))
+        except Exception:
+            pass
+    return children
+
+
+def _find_accessible_with_state(
+    Atspi,
+    root,
+    state,
+    max_depth: int,
+    child_limit: int,
+    scan: _FocusScan | None = None,
+    prune_from_depth: int = 0,
+    skip=None,
+):
+    """Depth-first search for ``state``, pruning subtrees that cannot hold it.
+
+    Below ``prune_from_depth`` (applications carry no states) a node that is not
+    SHOWING cannot contain the focus, and the children of a MANAGES_DESCENDANTS
+    container are transient (huge lists, tables, terminals' scrollback), so
+    neither is descended into.
+    """
     stack = [(root, 0)]
     while stack:
         accessible, depth = stack.pop()
+        if skip is not None and accessible == skip:
+            continue
+        if scan is not None:
+            scan.nodes_visited += 1
         try:
             state_set = accessible.get_state_set()
-            if state_set.contains(Atspi.StateType.ACTIVE):
+            if state_set.contains(state):
                 return accessible
+            if depth >= max_depth:
+                continue
+            if depth >= prune_from_depth and (
+                not state_set.contains(Atspi.StateType.SHOWING)
+                or state_set.contains(Atspi.StateType.MANAGES_DESCENDANTS)
+            ):
+                continue
             child_count = accessible.get_child_count()
         except Exception:
             continue
-        if depth >= max_depth:
-            continue
-        for index in range(min(child_count, 80) - 1, -1, -1):
+        for index in range(min(child_count, child_limit) - 1, -1, -1):
             try:
                 stack.append((accessible.get_child_at_index(index), depth + 1))
             except Exception:
@@ -826,6 +3410,48 @@ def _find_active_accessible(Atspi, root, max_depth: int = 4):
     return None
 
 
+def _find_focused_accessible(Atspi, root, max_depth: int = 7, scan: _FocusScan | None = None):
+    # The focused widget almost always lives in the active window; search it
+    # first and only then the rest of the desktop (skipping that window).
+    active_window = _find_active_window(Atspi, root, scan)
+    if active_window is not None:
+        focused = _find_accessible_with_state(
+            Atspi,
+            active_window,
+            Atspi.StateType.FOCUSED,
+            max_depth - 2,
+            120,
+            scan,
+        )
+        if focused is not None:
+            return focused
+    return _find_accessible_with_state(
+        Atspi,
+        root,
+        Atspi.StateType.FOCUSED,
+        max_depth,
+        120,
+        scan,
+        prune_from_depth=2,
+        skip=active_window,
+    )
+
+
+def _find_active_accessible(Atspi, root, max_depth: int = 4, scan: _FocusScan | None = None):
+    active_window = _find_active_window(Atspi, root, scan)
+    if active_window is not None:
+        return active_window
+    return _find_accessible_with_state(
+        Atspi,
+        root,
+        Atspi.StateType.ACTIVE,
+        max_depth,
+        80,
+        scan,
+        prune_from_depth=2,
+    )
+
+
 def _find_active_terminal_accessible(Atspi, root, max_depth: int = 4):
     active = _find_active_accessible(Atspi, root, max_depth=max_depth)
     if active is None:
@@ -868,6 +3494,7 @@ from gi.repository import Atspi
 SAMPLE_WINDOW_SEC = 0.5
 SAMPLE_INTERVAL_SEC = 0.04
 MAX_SAMPLES = 8
+""" + f"TERMINAL_APP_NAMES = set({sorted(TERMINAL_APP_NAMES)!r})\n" + r"""
 
 def info(accessible):
     app_name = ""
@@ -887,86 +3514,121 @@ def info(accessible):
         name = ""
     return {"app_name": app_name, "role": role, "name": name}
 
-def find_focused(root, max_depth=7):
+class Scan:
+    UNKNOWN = object()
+
+    def __init__(self):
+        self.nodes_visited = 0
+        self.active_window = Scan.UNKNOWN
+
+def children(accessible, limit):
+    try:
+        child_count = accessible.get_child_count()
+    except Exception:
+        return []
+    result = []
+    for index in range(min(child_count, limit)):
+        try:
+            result.append(accessible.get_child_at_index(index))
+        except Exception:
+            pass
+    return result
+
+def find_active_window(desktop, scan):
+    if scan.active_window is not Scan.UNKNOWN:
+        return scan.active_window
+    scan.active_window = None
+    for app in children(desktop, 120):
+        for window in children(app, 40):
+            scan.nodes_visited += 1
+            try:
+                if window.get_state_set().contains(Atspi.StateType.ACTIVE):
+                    scan.active_window = window
+                    return window
+            except Exception:
+                continue
+    return None
+
+def find_with_state(root, state, max_depth, child_limit, scan, prune_from_depth=0, skip=None):
     stack = [(root, 0)]
     while stack:
         accessible, depth = stack.pop()
+        if skip is not None and accessible == skip:
+            continue
+        scan.nodes_visited += 1
         try:
             state_set = accessible.get_state_set()
-            if state_set.contains(Atspi.StateType.FOCUSED):
+            if state_set.contains(state):
                 return accessible
+            if depth >= max_depth:
+                continue
+            if depth >= prune_from_depth and (
+                not state_set.contains(Atspi.StateType.SHOWING)
+                or state_set.contains(Atspi.StateType.MANAGES_DESCENDANTS)
+            ):
+                continue
             child_count = accessible.get_child_count()
         except Exception:
             continue
-        if depth >= max_depth:
-            continue
-        for index in range(min(child_count, 120) - 1, -1, -1):
+        for index in range(min(child_count, child_limit) - 1, -1, -1):
             try:
                 stack.append((accessible.get_child_at_index(index), depth + 1))
             except Exception:
                 pass
     return None
 
+def find_focused(root, scan, max_depth=7):
+    active_window = find_active_window(root, scan)
+    if active_window is not None:
+        focused = find_with_state(active_window, Atspi.StateType.FOCUSED, max_depth - 2, 120, scan)
+        if focused is not None:
+            return focused
+    return find_with_state(
+        root, Atspi.StateType.FOCUSED, max_depth, 120, scan, prune_from_depth=2, skip=active_window
+    )
+
 def is_terminal(info):
     role = str(info.get("role", "")).lower()
     app_name = str(info.get("app_name", "")).strip().lower()
     if app_name.endswith(".desktop"):
         app_name = app_name[:-8]
-    terminals = {
-        "alacritty", "blackbox", "com.mitchellh.ghostty",
-        "com.raggesilver.blackbox", "console", "foot", "ghostty",
-        "gnome-console", "gnome-terminal", "gnome-terminal-server",
-        "io.elementary.terminal", "kitty", "kgx", "konsole",
-        "org.gnome.console", "org.gnome.ptyxis", "org.gnome.terminal",
-        "org.gnome.terminal.legacy", "org.kde.konsole",
-        "org.wezfurlong.wezterm", "ptyxis", "qterminal", "rio",
-        "tabby", "terminal", "terminator", "tilix", "wezterm",
-        "xfce4-terminal",
-    }
-    return role == "terminal" or app_name in terminals
+    return role == "terminal" or app_name in TERMINAL_APP_NAMES
 
-def find_active(root, max_depth=4):
-    stack = [(root, 0)]
-    while stack:
-        accessible, depth = stack.pop()
-        try:
-            state_set = accessible.get_state_set()
-            if state_set.contains(Atspi.StateType.ACTIVE):
-                return accessible
-            child_count = accessible.get_child_count()
-        except Exception:
-            continue
-        if depth >= max_depth:
-            continue
-        for index in range(min(child_count, 80) - 1, -1, -1):
-            try:
-                stack.append((accessible.get_child_at_index(index), depth + 1))
-            except Exception:
-                pass
-    return None
+def find_active(root, scan, max_depth=4):
+    active_window = find_active_window(root, scan)
+    if active_window is not None:
+        return active_window
+    return find_with_state(root, Atspi.StateType.ACTIVE, max_depth, 80, scan, prune_from_depth=2)
+
+def is_uncertain(info):
+    if not info:
+        return True
+    app_name = str(info.get("app_name", "")).strip().lower()
+    if app_name.endswith(".desktop"):
+        app_name = app_name[:-8]
+    role = str(info.get("role", "")).strip().lower()
+    return (
+        not app_name
+        or app_name in {"gnome-shell", "org.gnome.shell"}
+        or role in {"desktop frame", "desktop icon"}
+    )
 
 def scan_desktop():
+    scan = Scan()
+    result = scan_desktop_with(scan)
+    if result is not None:
+        result["nodes_visited"] = scan.nodes_visited
+    return result
+
+def scan_desktop_with(scan):
     desktop = Atspi.get_desktop(0)
-    focused = find_focused(desktop)
+    focused = find_focused(desktop, scan)
     focused_info = info(focused) if focused is not None else None
     if focused_info and is_terminal(focused_info):
         return focused_info
 
-    app_name = ""
-    role = ""
-    if focused_info:
-        app_name = str(focused_info.get("app_name", "")).strip().lower()
-        if app_name.endswith(".desktop"):
-            app_name = app_name[:-8]
-        role = str(focused_info.get("role", "")).strip().lower()
-    use_active_fallback = (
-        focused_info is None
-        or not app_name
-        or app_name in {"gnome-shell", "org.gnome.shell"}
-        or role in {"desktop frame", "desktop icon"}
-    )
-    if use_active_fallback:
-        active = find_active(desktop)
+    if is_uncertain(focused_info):
+        active = find_active(desktop, scan)
         if active is not None:
             return info(active)
         return focused_info
@@ -983,11 +3645,19 @@ if result is not None:
 
 _ATSPI_FOCUS_SAMPLE_HELPER = _ATSPI_FOCUS_HELPER_COMMON + r"""
 samples = []
+votes = {"terminal": 0, "normal": 0}
 deadline = time.monotonic() + SAMPLE_WINDOW_SEC
 while len(samples) < MAX_SAMPLES:
-    samples.append(scan_desktop())
+    sample = scan_desktop()
+    samples.append(sample)
+    if sample is not None and is_terminal(sample):
+        votes["terminal"] += 1
+    elif not is_uncertain(sample):
+        votes["normal"] += 1
     if len(samples) >= MAX_SAMPLES:
         break
+    if abs(votes["terminal"] - votes["normal"]) > MAX_SAMPLES - len(samples):
+        break
     remaining = deadline - time.monotonic()
     if remaining <= 0:
         break
@@ -996,6 +3666,64 @@ print(json.dumps(samples))
 """
 
 
+_ATSPI_FOCUS_EVENT_HELPER = _ATSPI_FOCUS_HELPER_COMMON + r"""
+import sys
+
+def emit(kind, data):
+    data = dict(data or {})
+    data["event"] = kind
+    sys.stdout.write(json.dumps(data) + "\n")
+    sys.stdout.flush()
+
+def on_event(event):
+    try:
+        if event.type.startswith("object:state-changed:focused") and not event.detail1:
+            return
+        emit(event.type, info(event.source))
+    except Exception:
+        pass
+
+listener = Atspi.EventListener.new(on_event)
+for event_type in ("focus:", "object:state-changed:focused", "window:activate", "window:deactivate"):
+    listener.register(event_type)
+emit("scan", scan_desktop())
+Atspi.event_main()
+"""
+
+
+_ATSPI_FOCUS_SERVICE_HELPER = _ATSPI_FOCUS_HELPER_COMMON + r"""
+import sys
+from gi.repository import GLib
+
+def drain_events():
+    # Cached states are only refreshed by dispatched AT-SPI signals.
+    context = GLib.MainContext.default()
+    while context.pending():
+        context.iteration(False)
+
+Atspi.get_desktop(0)
+for line in sys.stdin:
+    try:
+        request = json.loads(line)
+    except Exception:
+        continue
+    response = {"id": request.get("id")}
+    try:
+        command = request.get("command")
+        if command == "scan":
+            drain_events()
+            response["result"] = scan_desktop()
+        elif command == "ping":
+            response["result"] = "pong"
+        else:
+            response["error"] = f"unknown command: {command}"
+    except Exception as exc:
+        response["error"] = str(exc)
+    sys.stdout.write(json.dumps(response) + "\n")
+    sys.stdout.flush()
+"""
+
+
 def _press_enter_windows() -> None:
     input_keyboard = 1
     keyeventf_keyup = 0x0002
@@ -3,7 +3,9 @@ import re
 import shutil
 import subprocess
 import sys
+import threading
 from pathlib import Path
+from typing import Any, Callable
 
 
 APP_NAME = "Voicing"
@@ -12,6 +14,12 @@ WINDOWS_HOTSPOT_PREFIXES = ("192.168.137.",)
 MACOS_HOTSPOT_PREFIXES = ("192.168.2.",)
 LINUX_HOTSPOT_PREFIXES = ("10.42.0.",)
 
+CAPABILITY_REMOTE_DESKTOP_KEYBOARD = "remote_desktop_keyboard_portal"
+
+_CAPABILITIES: dict[str, Any] = {}
+_CAPABILITIES_SESSION: tuple[str, ...] | None = None
+_CAPABILITIES_LOCK = threading.Lock()
+
 
 def get_platform() -> str:
     if sys.platform.startswith("win"):
@@ -118,7 +126,7 @@ def has_remote_desktop_keyboard_portal() -> bool:
 
 
 def _get_remote_desktop_available_device_types() -> int:
-    gdbus = shutil.which("gdbus")
+    gdbus = which_cached("gdbus")
     if gdbus:
         return _get_remote_desktop_available_device_types_with_gdbus(gdbus)
     return _get_remote_desktop_available_device_types_with_qtdbus()
@@ -189,8 +197,72 @@ def _get_remote_desktop_available_device_types_with_qtdbus() -> int:
     return int(reply.arguments()[0])
 
 
+def _capability_session() -> tuple[str, ...]:
+    return tuple(
+        os.environ.get(name, "")
+        for name in ("XDG_SESSION_TYPE", "WAYLAND_DISPLAY", "DISPLAY", "DBUS_SESSION_BUS_ADDRESS")
+    )
+
+
+def get_capability(name: str, probe: Callable[[], Any]) -> Any:
+    """Return the cached result of ``probe``, running it on first use.
+
+    Results stay cached until ``invalidate_capability`` drops them or the
+    session environment changes. A probe that raises is not cached.
+    """
+    global _CAPABILITIES_SESSION
+    session = _capability_session()
+    with _CAPABILITIES_LOCK:
+        if session != _CAPABILITIES_SESSION:
+            _CAPABILITIES.clear()
+            _CAPABILITIES_SESSION = session
+        if name in _CAPABILITIES:
+            return _CAPABILITIES[name]
+    value = probe()
+    with _CAPABILITIES_LOCK:
+        if session == _CAPABILITIES_SESSION:
+            _CAPABILITIES[name] = value
+    return value
+
+
+def invalidate_capability(*names: str) -> None:
+    """Forget the given capabilities, or all of them, after a backend failure."""
+    with _CAPABILITIES_LOCK:
+        if not names:
+            _CAPABILITIES.clear()
+        for name in names:
+            _CAPABILITIES.pop(name, None)
+
+
+def which_cached(command: str) -> str | None:
+    return get_capability(f"which:{command}", lambda: shutil.which(command))
+
+
+def probe_runtime_capabilities() -> dict[str, Any]:
+    """Probe the host tools the Linux backends look up, and return the report."""
+    if get_platform() == "linux":
+        for command in ("gdbus", "wl-copy", "wl-paste"):
+            which_cached(command)
+    return get_capability_report()
+
+
+def get_capability_report() -> dict[str, Any]:
+    """Snapshot of the capabilities probed so far, for diagnostics."""
+    with _CAPABILITIES_LOCK:
+        report = dict(sorted(_CAPABILITIES.items()))
+    report["session"] = "wayland" if is_wayland_session() else get_platform()
+    return report
+
+
+def format_capability_report() -> str:
+    return ", ".join(f"{name}={value}" for name, value in get_capability_report().items())
+
+
 def ensure_runtime_supported() -> None:
-    if is_wayland_session() and not has_remote_desktop_keyboard_portal():
+    if is_wayland_session() and not get_capability(
+        CAPABILITY_REMOTE_DESKTOP_KEYBOARD,
+        has_remote_desktop_keyboard_portal,
+    ):
         raise RuntimeError(
             "当前检测到 Wayland 会话，但没有可用的 RemoteDesktop portal 键盘能力。"
             "请确认 xdg-desktop-portal 与 GNOME portal 正在运行，或切换到 Ubuntu on Xorg 后再启动。"
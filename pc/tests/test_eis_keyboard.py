@@ -0,0 +1,270 @@
+import ctypes
+import os
+import socket
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import eis_keyboard
+from eis_keyboard import EisKeyboard, EisUnavailableError
+
+
+KEYBOARD = "keyboard-device"
+SEAT = 0x5EA7
+
+
+class FakeLibei:
+    """Scripted stand-in for libei backed by a socketpair, like a local EIS server."""
+
+    def __init__(self, events=None, setup_result=0):
+        self.server, self.client = socket.socketpair()
+        self.pending = []
+        self.queued = []
+        self.setup_result = setup_result
+        self.calls = []
+        self.keys = []
+        self.frames = 0
+        self.bound = []
+        self.unref_ei = 0
+        self.keymap = None
+        for event in events or ():
+            self.push(*event)
+
+    def push(self, event_type, device=None):
+        self.pending.append((event_type, device))
+        self.server.send(b"x")
+
+    def close(self):
+        self.server.close()
+        self.client.close()
+
+    def ei_new_sender(self, user_data):
+        return "ei"
+
+    def ei_configure_name(self, ei, name):
+        self.calls.append(("name", name))
+
+    def ei_setup_backend_fd(self, ei, fd):
+        self.calls.append(("fd", fd))
+        return self.setup_result
+
+    def ei_get_fd(self, ei):
+        return self.client.fileno()
+
+    def ei_dispatch(self, ei):
+        self.client.setblocking(False)
+        try:
+            self.client.recv(4096)
+        except BlockingIOError:
+            pass
+        self.queued.extend(self.pending)
+        self.pending.clear()
+
+    def ei_get_event(self, ei):
+        return self.queued.pop(0) if self.queued else None
+
+    def ei_event_get_type(self, event):
+        return event[0]
+
+    def ei_event_get_seat(self, event):
+        return SEAT
+
+    def ei_event_get_device(self, event):
+        return event[1]
+
+    def ei_event_unref(self, event):
+        return None
+
+    def ei_seat_bind_capabilities(self, seat, capability, terminator):
+        self.bound.append((seat.value, capability.value, terminator.value))
+
+    def ei_device_has_capability(self, device, capability):
+        return device == KEYBOARD and capability == eis_keyboard.EI_DEVICE_CAP_KEYBOARD
+
+    def ei_device_ref(self, device):
+        return device
+
+    def ei_device_unref(self, device):
+        return None
+
+    def ei_device_start_emulating(self, device, sequence):
+        self.calls.append(("start", sequence))
+
+    def ei_device_stop_emulating(self, device):
+        self.calls.append(("stop",))
+
+    def ei_device_keyboard_key(self, device, keycode, is_press):
+        self.keys.append((keycode, is_press))
+
+    def ei_device_frame(self, device, timestamp):
+        self.frames += 1
+
+    def ei_device_keyboard_get_keymap(self, device):
+        return self.keymap
+
+    def ei_keymap_get_type(self, keymap):
+        return eis_keyboard.EI_KEYMAP_TYPE_XKB
+
+    def ei_keymap_get_fd(self, keymap):
+        return keymap.fileno()
+
+    def ei_keymap_get_size(self, keymap):
+        return os.fstat(keymap.fileno()).st_size
+
+    def ei_now(self, ei):
+        return 1
+
+    def ei_unref(self, ei):
+        self.unref_ei += 1
+
+
+def handshake_events():
+    return [
+        (eis_keyboard.EI_EVENT_CONNECT,),
+        (eis_keyboard.EI_EVENT_SEAT_ADDED,),
+        (eis_keyboard.EI_EVENT_DEVICE_ADDED, "pointer-device"),
+        (eis_keyboard.EI_EVENT_DEVICE_ADDED, KEYBOARD),
+        (eis_keyboard.EI_EVENT_DEVICE_RESUMED, KEYBOARD),
+    ]
+
+
+CTRL_V = ((0xFFE3, 1), (0x0076, 1), (0x0076, 0), (0xFFE3, 0))
+
+
+class XkbRuleNames(ctypes.Structure):
+    _fields_ = [(name, ctypes.c_char_p) for name in ("rules", "model", "layout", "variant", "options")]
+
+
+def xkb_keymap_text(layout, variant=""):
+    """Compile a keymap from the system XKB data, as an EIS server would send it."""
+    try:
+        xkb = eis_keyboard.load_xkbcommon()
+    except EisUnavailableError as exc:
+        raise unittest.SkipTest(str(exc))
+    xkb.xkb_keymap_new_from_names.restype = ctypes.c_void_p
+    xkb.xkb_keymap_new_from_names.argtypes = [ctypes.c_void_p, ctypes.POINTER(XkbRuleNames), ctypes.c_int]
+    xkb.xkb_keymap_get_as_string.restype = ctypes.c_void_p
+    xkb.xkb_keymap_get_as_string.argtypes = [ctypes.c_void_p, ctypes.c_int]
+    context = xkb.xkb_context_new(0)
+    names = XkbRuleNames(b"evdev", b"pc105", layout.encode(), variant.encode(), b"")
+    keymap = xkb.xkb_keymap_new_from_names(context, ctypes.byref(names), 0)
+    try:
+        if not keymap:
+            raise unittest.SkipTest(f"XKB data for {layout} not installed")
+        return ctypes.string_at(xkb.xkb_keymap_get_as_string(keymap, eis_keyboard.XKB_KEYMAP_FORMAT_TEXT_V1))
+    finally:
+        if keymap:
+            xkb.xkb_keymap_unref(keymap)
+        xkb.xkb_context_unref(context)
+
+
+class EisKeyboardTests(unittest.TestCase):
+    def make_lib(self, events=None, **kwargs):
+        lib = FakeLibei(events, **kwargs)
+        self.addCleanup(lib.close)
+        return lib
+
+    def test_binds_keyboard_and_sends_evdev_keycodes(self):
+        lib = self.make_lib(handshake_events())
+        keyboard = EisKeyboard(7, lib=lib, connect_timeout_sec=1)
+
+        self.assertTrue(keyboard.is_ready)
+        self.assertEqual(lib.bound, [(SEAT, eis_keyboard.EI_DEVICE_CAP_KEYBOARD, None)])
+        keyboard.send_key_sequence(CTRL_V)
+        keyboard.send_key_sequence(((0xFF0D, 1), (0xFF0D, 0)))
+
+        self.assertEqual(
+            lib.keys,
+            [(29, True), (47, True), (47, False), (29, False), (28, True), (28, False)],
+        )
+        self.assertEqual(lib.frames, 6)
+        self.assertEqual([call for call in lib.calls if call[0] == "start"], [("start", 1)])
+
+        keyboard.close()
+        self.assertIn(("stop",), lib.calls)
+        self.assertEqual(lib.unref_ei, 1)
+
+    def test_paused_device_rejects_keys_until_resumed(self):
+        lib = self.make_lib(handshake_events())
+        keyboard = EisKeyboard(7, lib=lib, connect_timeout_sec=1)
+        keyboard.send_key_sequence(CTRL_V)
+
+        lib.push(eis_keyboard.EI_EVENT_DEVICE_PAUSED, KEYBOARD)
+        with self.assertRaises(RuntimeError):
+            keyboard.send_key_sequence(CTRL_V)
+
+        lib.push(eis_keyboard.EI_EVENT_DEVICE_RESUMED, KEYBOARD)
+        keyboard.send_key_sequence(CTRL_V)
+        self.assertEqual([call for call in lib.calls if call[0] == "start"], [("start", 1), ("start", 2)])
+
+    def test_times_out_without_keyboard_device(self):
+        lib = self.make_lib([(eis_keyboard.EI_EVENT_CONNECT,), (eis_keyboard.EI_EVENT_SEAT_ADDED,)])
+        with self.assertRaises(TimeoutError):
+            EisKeyboard(7, lib=lib, connect_timeout_sec=0.05)
+        self.assertEqual(lib.unref_ei, 1)
+
+    def test_disconnect_during_handshake_is_reported(self):
+        lib = self.make_lib([(eis_keyboard.EI_EVENT_DISCONNECT,)])
+        with self.assertRaises(EisUnavailableError):
+            EisKeyboard(7, lib=lib, connect_timeout_sec=1)
+
+    def test_failed_backend_setup_closes_fd(self):
+        lib = self.make_lib(setup_result=-1)
+        read_fd, write_fd = os.pipe()
+        self.addCleanup(os.close, read_fd)
+        with self.assertRaises(EisUnavailableError):
+            EisKeyboard(write_fd, lib=lib, connect_timeout_sec=1)
+        with self.assertRaises(OSError):
+            os.fstat(write_fd)
+
+    def test_unsupported_keysym_is_rejected_before_sending(self):
+        lib = self.make_lib(handshake_events())
+        keyboard = EisKeyboard(7, lib=lib, connect_timeout_sec=1)
+        with self.assertRaises(RuntimeError):
+            keyboard.send_key_sequence(((0xFFE3, 1), (0x0061, 1)))
+        self.assertEqual(lib.keys, [])
+
+    def make_keymap_file(self, text):
+        keymap = tempfile.TemporaryFile()
+        self.addCleanup(keymap.close)
+        keymap.write(text + b"\0")
+        keymap.flush()
+        return keymap
+
+    def test_keys_follow_the_device_keymap(self):
+        lib = self.make_lib(handshake_events())
+        lib.keymap = self.make_keymap_file(xkb_keymap_text("us", "dvorak"))
+        keyboard = EisKeyboard(7, lib=lib, connect_timeout_sec=1)
+
+        keyboard.send_key_sequence(CTRL_V)
+
+        # Dvorak types "v" on the key QWERTY calls ".", so Ctrl+V stays Ctrl+V.
+        self.assertEqual(lib.keys, [(29, True), (52, True), (52, False), (29, False)])
+
+    def test_layout_without_latin_keys_falls_back_to_qwerty_positions(self):
+        lib = self.make_lib(handshake_events())
+        lib.keymap = self.make_keymap_file(xkb_keymap_text("ru"))
+        keyboard = EisKeyboard(7, lib=lib, connect_timeout_sec=1)
+
+        keyboard.send_key_sequence(CTRL_V)
+
+        self.assertEqual(lib.keys, [(29, True), (47, True), (47, False), (29, False)])
+
+    def test_keymap_without_xkbcommon_falls_back_to_qwerty_positions(self):
+        lib = self.make_lib(handshake_events())
+        lib.keymap = self.make_keymap_file(b"xkb_keymap {};")
+        with patch("eis_keyboard.load_xkbcommon", side_effect=EisUnavailableError("missing")):
+            with self.assertLogs(level="WARNING"):
+                keyboard = EisKeyboard(7, lib=lib, connect_timeout_sec=1)
+
+        keyboard.send_key_sequence(CTRL_V)
+
+        self.assertEqual(lib.keys, [(29, True), (47, True), (47, False), (29, False)])
+
+
+if __name__ == "__main__":
+    unittest.main()
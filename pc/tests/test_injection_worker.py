@@ -0,0 +1,138 @@
+import asyncio
+import sys
+import threading
+import unittest
+from concurrent.futures import CancelledError
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from injection_worker import InjectionQueueFullError, InjectionWorker
+
+
+class InjectionWorkerTests(unittest.TestCase):
+    def setUp(self):
+        self.worker = InjectionWorker(max_queue_size=4)
+
+    def tearDown(self):
+        self.worker.stop()
+
+    def test_calls_run_in_submission_order_on_one_thread(self):
+        calls = []
+        threads = set()
+
+        def record(value):
+            calls.append(value)
+            threads.add(threading.get_ident())
+            return value
+
+        futures = [self.worker.submit(record, index) for index in range(4)]
+        self.assertEqual([future.result(timeout=2) for future in futures], [0, 1, 2, 3])
+        self.assertEqual(calls, [0, 1, 2, 3])
+        self.assertEqual(len(threads), 1)
+        self.assertNotIn(threading.get_ident(), threads)
+
+    def test_run_awaits_result_from_asyncio(self):
+        async def main():
+            return await self.worker.run(lambda left, right: left + right, 2, 3)
+
+        self.assertEqual(asyncio.run(main()), 5)
+
+    def test_exception_is_propagated_and_counted(self):
+        def boom():
+            raise RuntimeError("boom")
+
+        future = self.worker.submit(boom)
+        with self.assertRaises(RuntimeError):
+            future.result(timeout=2)
+        stats = self.worker.stats()
+        self.assertEqual(stats.completed, 1)
+        self.assertEqual(stats.failed, 1)
+
+    def test_full_queue_rejects_new_items(self):
+        release = threading.Event()
+        started = threading.Event()
+
+        def block():
+            started.set()
+            release.wait(2)
+
+        first = self.worker.submit(block)
+        self.assertTrue(started.wait(2))
+        queued = [self.worker.submit(lambda: None) for _ in range(4)]
+        self.assertEqual(self.worker.queue_depth(), 4)
+        with self.assertRaises(InjectionQueueFullError):
+            self.worker.submit(lambda: None)
+
+        release.set()
+        first.result(timeout=2)
+        for future in queued:
+            future.result(timeout=2)
+        stats = self.worker.stats()
+        self.assertEqual(stats.rejected, 1)
+        self.assertEqual(stats.submitted, 5)
+        self.assertEqual(stats.completed, 5)
+        self.assertGreater(stats.max_wait_sec, 0.0)
+        self.assertEqual(stats.queue_depth, 0)
+
+    def test_idle_callback_runs_after_requested_delay_and_on_stop(self):
+        calls = []
+        ran_idle = threading.Event()
+
+        def idle_callback(force):
+            calls.append(force)
+            if len(calls) == 1:
+                return 0.01
+            ran_idle.set()
+            return None
+
+        worker = InjectionWorker(idle_callback=idle_callback)
+        worker.submit(lambda: None).result(timeout=2)
+        self.assertTrue(ran_idle.wait(2))
+        worker.stop()
+        self.assertEqual(calls, [False, False, True])
+
+    def test_stop_with_full_queue_cancels_backlog_instead_of_blocking(self):
+        release = threading.Event()
+        started = threading.Event()
+
+        def block():
+            started.set()
+            release.wait(2)
+
+        first = self.worker.submit(block)
+        self.assertTrue(started.wait(2))
+        queued = [self.worker.submit(lambda: None) for _ in range(4)]
+
+        stopper = threading.Thread(target=self.worker.stop, kwargs={"timeout": 0.1})
+        stopper.start()
+        stopper.join(1)
+        self.assertFalse(stopper.is_alive())
+
+        release.set()
+        first.result(timeout=2)
+        for future in queued:
+            with self.assertRaises(CancelledError):
+                future.result(timeout=2)
+
+    def test_stop_processes_caller_events_while_final_flush_waits_on_them(self):
+        served = threading.Event()
+        flushed = []
+
+        def idle_callback(force):
+            if force:
+                # Stands in for a blocking call into the caller's (GUI) thread.
+                flushed.append(served.wait(2))
+            return None
+
+        worker = InjectionWorker(idle_callback=idle_callback)
+        worker.submit(lambda: None).result(timeout=2)
+
+        worker.stop(timeout=2, process_events=served.set)
+
+        self.assertEqual(flushed, [True])
+        self.assertFalse(worker.is_running())
+
+
+if __name__ == "__main__":
+    unittest.main()
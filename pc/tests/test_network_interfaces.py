@@ -1,6 +1,8 @@
+import asyncio
 import sys
 import unittest
 from pathlib import Path
+from unittest.mock import MagicMock, patch
 
 sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
 
@@ -8,16 +10,21 @@ import socket
 import voice_coding
 from voice_coding import (
     NetworkInterfaceCandidate,
+    NetworkSnapshot,
     calculate_broadcast_addresses,
     extract_command_interface_candidates,
     extract_command_interfaces,
     get_advertised_server_ips,
     get_bound_server_ips,
+    get_network_snapshot,
     get_primary_server_ip,
     get_psutil_network_candidates,
     get_qr_advertised_server_ips,
+    get_server_interfaces,
+    reconcile_websocket_listeners,
     refresh_server_interfaces,
     set_bound_server_ips,
+    subscribe_network_snapshot,
 )
 
 
@@ -172,90 +179,263 @@ en5: flags=8863<UP,BROADCAST,SMART,RUNNING,SIMPLEX,MULTICAST> mtu 1500
             ],
         )
 
+    def stale_snapshot(self):
+        original_snapshot = voice_coding.NETWORK_SNAPSHOT
+        original_subscribers = list(voice_coding.NETWORK_SNAPSHOT_SUBSCRIBERS)
+
+        def restore():
+            voice_coding.NETWORK_SNAPSHOT = original_snapshot
+            voice_coding.NETWORK_SNAPSHOT_SUBSCRIBERS[:] = original_subscribers
+
+        self.addCleanup(restore)
+        voice_coding.NETWORK_SNAPSHOT = NetworkSnapshot(
+            generation=4,
+            interfaces=(("192.168.1.23", "192.168.1.255"),),
+            advertised_ips=("192.168.1.23",),
+        )
+
     def test_refresh_server_interfaces_replaces_stale_cached_ips(self):
-        original_get_all_network_candidates = voice_coding.get_all_network_candidates
-        original_server_interfaces = voice_coding.SERVER_INTERFACES
-        original_initialized = voice_coding.SERVER_INTERFACES_INITIALIZED
-        try:
-            voice_coding.SERVER_INTERFACES = [("192.168.1.23", "192.168.1.255")]
-            voice_coding.SERVER_INTERFACES_INITIALIZED = True
-            voice_coding.get_all_network_candidates = lambda: [
-                NetworkInterfaceCandidate(
-                    ip="10.16.177.83",
-                    prefix_length=18,
-                    name="WLAN",
-                    interface_type="wifi",
-                )
-            ]
-
-            self.assertEqual(
-                refresh_server_interfaces(log_changes=False),
-                [("10.16.177.83", "10.16.191.255")],
+        self.stale_snapshot()
+        candidates = [
+            NetworkInterfaceCandidate(
+                ip="10.16.177.83",
+                prefix_length=18,
+                name="WLAN",
+                interface_type="wifi",
             )
-            self.assertEqual(get_primary_server_ip(), "10.16.177.83")
-            self.assertEqual(get_advertised_server_ips(), ["10.16.177.83"])
-        finally:
-            voice_coding.get_all_network_candidates = original_get_all_network_candidates
-            voice_coding.SERVER_INTERFACES = original_server_interfaces
-            voice_coding.SERVER_INTERFACES_INITIALIZED = original_initialized
+        ]
+        with patch("voice_coding.get_all_network_candidates", return_value=candidates):
+            snapshot = refresh_server_interfaces(log_changes=False)
+
+        self.assertEqual(
+            snapshot,
+            NetworkSnapshot(
+                generation=5,
+                interfaces=(("10.16.177.83", "10.16.191.255"),),
+                advertised_ips=("10.16.177.83",),
+            ),
+        )
+        self.assertEqual(get_primary_server_ip(), "10.16.177.83")
+        self.assertEqual(get_advertised_server_ips(), ["10.16.177.83"])
 
     def test_qr_advertised_ips_prefer_bound_hosts_without_hiding_fresh_candidates(self):
-        original_get_all_network_candidates = voice_coding.get_all_network_candidates
-        original_server_interfaces = voice_coding.SERVER_INTERFACES
-        original_initialized = voice_coding.SERVER_INTERFACES_INITIALIZED
+        self.stale_snapshot()
         original_bound_ips = get_bound_server_ips()
-        try:
-            voice_coding.SERVER_INTERFACES = [("192.168.1.23", "192.168.1.255")]
-            voice_coding.SERVER_INTERFACES_INITIALIZED = True
-            voice_coding.get_all_network_candidates = lambda: [
-                NetworkInterfaceCandidate(
-                    ip="10.16.177.83",
-                    prefix_length=18,
-                    name="WLAN",
-                    interface_type="wifi",
-                ),
-            ]
-            set_bound_server_ips(["192.168.1.23", "192.168.1.23"])
-
-            self.assertEqual(get_qr_advertised_server_ips(refresh=True), ["192.168.1.23"])
-            self.assertEqual(get_advertised_server_ips(refresh=True), ["10.16.177.83"])
-        finally:
-            voice_coding.get_all_network_candidates = original_get_all_network_candidates
-            voice_coding.SERVER_INTERFACES = original_server_interfaces
-            voice_coding.SERVER_INTERFACES_INITIALIZED = original_initialized
-            set_bound_server_ips(original_bound_ips)
-
-    def test_get_advertised_server_ips_can_force_refresh_current_pool(self):
-        original_get_all_network_candidates = voice_coding.get_all_network_candidates
-        original_server_interfaces = voice_coding.SERVER_INTERFACES
-        original_initialized = voice_coding.SERVER_INTERFACES_INITIALIZED
-        try:
-            voice_coding.SERVER_INTERFACES = [("192.168.1.23", "192.168.1.255")]
-            voice_coding.SERVER_INTERFACES_INITIALIZED = True
-            voice_coding.get_all_network_candidates = lambda: [
-                NetworkInterfaceCandidate(
-                    ip="192.168.137.1",
-                    prefix_length=24,
-                    name="Local Area Connection* 10",
-                    interface_type="wifi",
-                ),
-                NetworkInterfaceCandidate(
-                    ip="10.16.177.83",
-                    prefix_length=18,
-                    name="WLAN",
-                    interface_type="wifi",
-                ),
-            ]
-
-            self.assertEqual(
-                get_advertised_server_ips(refresh=True),
-                ["192.168.137.1", "10.16.177.83"],
+        self.addCleanup(set_bound_server_ips, original_bound_ips)
+        candidates = [
+            NetworkInterfaceCandidate(
+                ip="10.16.177.83",
+                prefix_length=18,
+                name="WLAN",
+                interface_type="wifi",
+            ),
+        ]
+        set_bound_server_ips(["192.168.1.23", "192.168.1.23"])
+        with patch("voice_coding.get_all_network_candidates", return_value=candidates):
+            refresh_server_interfaces(log_changes=False)
+
+        self.assertEqual(get_qr_advertised_server_ips(), ["192.168.1.23"])
+        self.assertEqual(get_advertised_server_ips(), ["10.16.177.83"])
+
+    def test_readers_never_rescan_interfaces(self):
+        self.stale_snapshot()
+        self.addCleanup(set_bound_server_ips, get_bound_server_ips())
+        set_bound_server_ips([])
+        with patch("voice_coding.get_all_network_candidates") as scan:
+            with patch("voice_coding.get_hotspot_ip") as hotspot:
+                self.assertEqual(get_server_interfaces(), [("192.168.1.23", "192.168.1.255")])
+                self.assertEqual(get_advertised_server_ips(), ["192.168.1.23"])
+                self.assertEqual(get_qr_advertised_server_ips(), ["192.168.1.23"])
+                self.assertEqual(get_primary_server_ip(), "192.168.1.23")
+
+        scan.assert_not_called()
+        hotspot.assert_not_called()
+
+    def test_refresh_orders_hotspot_first_and_falls_back_when_empty(self):
+        self.stale_snapshot()
+        candidates = [
+            NetworkInterfaceCandidate(
+                ip="192.168.137.1",
+                prefix_length=24,
+                name="Local Area Connection* 10",
+                interface_type="wifi",
+            ),
+            NetworkInterfaceCandidate(
+                ip="10.16.177.83",
+                prefix_length=18,
+                name="WLAN",
+                interface_type="wifi",
+            ),
+        ]
+        with patch("voice_coding.get_all_network_candidates", return_value=candidates):
+            refresh_server_interfaces(log_changes=False)
+        self.assertEqual(get_advertised_server_ips(), ["192.168.137.1", "10.16.177.83"])
+        self.assertEqual(get_primary_server_ip(), "192.168.137.1")
+
+        with patch("voice_coding.get_all_network_candidates", return_value=[]):
+            with patch("voice_coding.get_hotspot_ip", return_value="192.168.137.1"):
+                snapshot = refresh_server_interfaces(log_changes=False)
+        self.assertEqual(snapshot.interfaces, ())
+        self.assertEqual(snapshot.advertised_ips, ("192.168.137.1",))
+
+    def test_subscribers_are_notified_only_when_the_snapshot_changes(self):
+        self.stale_snapshot()
+        received = []
+        unsubscribe = subscribe_network_snapshot(received.append)
+        subscribe_network_snapshot(MagicMock(side_effect=RuntimeError("deleted")))
+        candidates = [
+            NetworkInterfaceCandidate(
+                ip="10.16.177.83",
+                prefix_length=18,
+                name="WLAN",
+                interface_type="wifi",
             )
-            self.assertEqual(get_primary_server_ip(), "192.168.137.1")
-        finally:
-            voice_coding.get_all_network_candidates = original_get_all_network_candidates
-            voice_coding.SERVER_INTERFACES = original_server_interfaces
-            voice_coding.SERVER_INTERFACES_INITIALIZED = original_initialized
+        ]
+        with patch("voice_coding.get_all_network_candidates", return_value=candidates):
+            with self.assertLogs(level="WARNING"):
+                first = refresh_server_interfaces(log_changes=False)
+            second = refresh_server_interfaces(log_changes=False)
+            unsubscribe()
+            voice_coding.NETWORK_SNAPSHOT_SUBSCRIBERS.clear()
+
+        with patch("voice_coding.get_all_network_candidates", return_value=[]):
+            with patch("voice_coding.get_hotspot_ip", return_value="192.168.137.1"):
+                third = refresh_server_interfaces(log_changes=False)
+
+        self.assertEqual([snapshot.generation for snapshot in (first, second, third)], [5, 5, 6])
+        self.assertEqual(received, [first])
+        self.assertEqual(get_network_snapshot(), third)
+
+
+class WebSocketListenerReconcileTests(unittest.TestCase):
+    def setUp(self):
+        original_bound_ips = get_bound_server_ips()
+        self.addCleanup(set_bound_server_ips, original_bound_ips)
+        self.servers = {}
+
+    async def fake_serve(self, handler, host, port):
+        if host == "10.0.0.9":
+            raise OSError("Cannot assign requested address")
+        server = MagicMock()
+
+        async def wait_closed():
+            return None
+
+        server.wait_closed = wait_closed
+        self.servers.setdefault(host, []).append(server)
+        return server
+
+    def reconcile(self, listeners, hosts, failed_hosts):
+        asyncio.run(reconcile_websocket_listeners(listeners, hosts, failed_hosts))
+
+    def test_only_new_hosts_are_bound_and_only_vanished_hosts_closed(self):
+        listeners = {}
+        failed_hosts = set()
+        with patch("voice_coding.serve", side_effect=self.fake_serve):
+            with self.assertLogs(level="INFO"):
+                self.reconcile(listeners, ["192.168.1.23"], failed_hosts)
+            wifi = listeners["192.168.1.23"]
+
+            with self.assertLogs(level="INFO"):
+                self.reconcile(listeners, ["192.168.137.1", "192.168.1.23"], failed_hosts)
+            self.assertIs(listeners["192.168.1.23"], wifi)
+            self.assertEqual(get_bound_server_ips(), ["192.168.137.1", "192.168.1.23"])
+
+            with self.assertLogs(level="INFO"):
+                self.reconcile(listeners, ["192.168.1.23"], failed_hosts)
+
+        self.assertEqual(list(listeners), ["192.168.1.23"])
+        self.assertEqual(len(self.servers["192.168.1.23"]), 1)
+        wifi.close.assert_not_called()
+        self.servers["192.168.137.1"][0].close.assert_called_once()
+        self.assertEqual(get_bound_server_ips(), ["192.168.1.23"])
+
+    def test_failed_host_is_logged_once_and_retried(self):
+        listeners = {}
+        failed_hosts = set()
+        with patch("voice_coding.serve", side_effect=self.fake_serve) as mock_serve:
+            with self.assertLogs(level="ERROR") as logs:
+                self.reconcile(listeners, ["192.168.1.23", "10.0.0.9"], failed_hosts)
+                self.reconcile(listeners, ["192.168.1.23", "10.0.0.9"], failed_hosts)
+
+        self.assertEqual(sum("10.0.0.9" in line for line in logs.output), 1)
+        self.assertEqual(failed_hosts, {"10.0.0.9"})
+        self.assertEqual([call.args[1] for call in mock_serve.call_args_list].count("10.0.0.9"), 2)
+        self.assertEqual(get_bound_server_ips(), ["192.168.1.23"])
+
+    def test_connection_survives_when_another_interface_appears(self):
+        from websockets.client import connect
+
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            port = probe.getsockname()[1]
+
+        async def scenario():
+            listeners = {}
+            failed_hosts = set()
+            await reconcile_websocket_listeners(listeners, ["127.0.0.1"], failed_hosts)
+            try:
+                async with connect(f"ws://127.0.0.1:{port}") as client:
+                    await client.recv()
+                    await reconcile_websocket_listeners(listeners, ["127.0.0.1", "127.0.0.2"], failed_hosts)
+                    await reconcile_websocket_listeners(listeners, ["127.0.0.1"], failed_hosts)
+                    await client.ping()
+                    return client.open, list(listeners)
+            finally:
+                await reconcile_websocket_listeners(listeners, [], failed_hosts)
+
+        identity = MagicMock()
+        identity.name = "PC"
+        identity.device_id = "device"
+        identity.os = "linux"
+        with patch.object(voice_coding.state, "ws_port", port):
+            with patch("voice_coding.get_or_create_device_identity", return_value=identity):
+                with self.assertLogs(level="INFO"):
+                    still_open, hosts = asyncio.run(scenario())
+
+        self.assertTrue(still_open)
+        self.assertEqual(hosts, ["127.0.0.1"])
+        self.assertEqual(get_bound_server_ips(), [])
+
+    def run_start_server(self, wake_results, *, listener_hosts=()):
+        waits = []
+        wake_results = list(wake_results)
+
+        async def fake_reconcile(listeners, hosts, failed_hosts):
+            listeners.clear()
+            listeners.update({host: MagicMock() for host in listener_hosts if host in hosts})
+
+        async def fake_wait(monitor, timeout):
+            waits.append(timeout)
+            if len(waits) == len(wake_results):
+                voice_coding.state.running = False
+            return wake_results[len(waits) - 1]
+
+        monitor = MagicMock()
+        snapshot = NetworkSnapshot(
+            generation=1,
+            interfaces=(("192.168.1.23", "192.168.1.255"),),
+            advertised_ips=("192.168.1.23",),
+        )
+        with patch.object(voice_coding.state, "running", True):
+            with patch("voice_coding.open_network_change_monitor", return_value=monitor):
+                with patch("voice_coding.reconcile_websocket_listeners", side_effect=fake_reconcile):
+                    with patch("voice_coding.refresh_server_interfaces", return_value=snapshot):
+                        with patch("voice_coding.wait_for_network_change", side_effect=fake_wait):
+                            with self.assertLogs(level="INFO"):
+                                asyncio.run(voice_coding.start_server())
+        monitor.close.assert_called_once()
+        return waits
+
+    def test_start_server_backs_off_while_nothing_can_be_bound(self):
+        waits = self.run_start_server([False, False, False, True, False, False, False, False, False])
+
+        self.assertEqual(waits, [2, 4, 8, 16, 2, 4, 8, 16, 30])
+
+    def test_start_server_waits_for_network_changes_once_bound(self):
+        waits = self.run_start_server([True, False], listener_hosts=["192.168.1.23"])
+
+        self.assertEqual(waits, [voice_coding.NETWORK_CHANGE_FALLBACK_REFRESH_SEC] * 2)
 
 
 if __name__ == "__main__":
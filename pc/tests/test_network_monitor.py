@@ -0,0 +1,121 @@
+import asyncio
+import socket
+import struct
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import network_monitor
+from network_monitor import NetlinkChangeMonitor, open_network_change_monitor
+
+
+def netlink_message(message_type, payload=b""):
+    length = network_monitor.NLMSG_HEADER.size + len(payload)
+    padding = b"\0" * (-length % 4)
+    return network_monitor.NLMSG_HEADER.pack(length, message_type, 0, 0, 0) + payload + padding
+
+
+def link_message(index, flags, message_type=network_monitor.RTM_NEWLINK):
+    return netlink_message(message_type, network_monitor.IFINFO_MESSAGE.pack(0, 1, index, flags, 0))
+
+
+def addr_message(message_type=network_monitor.RTM_NEWADDR):
+    return netlink_message(message_type, struct.pack("=BBBBI", socket.AF_INET, 24, 0, 0, 3))
+
+
+UP = network_monitor.IFF_UP | network_monitor.IFF_RUNNING
+
+
+class NetlinkChangeMonitorTests(unittest.TestCase):
+    def make_monitor(self, **kwargs):
+        kernel, client = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.addCleanup(kernel.close)
+        monitor = NetlinkChangeMonitor(client, **kwargs)
+        self.addCleanup(monitor.close)
+        return kernel, monitor
+
+    def test_address_changes_are_reported(self):
+        kernel, monitor = self.make_monitor()
+        self.assertFalse(monitor.drain())
+
+        kernel.send(addr_message())
+        self.assertTrue(monitor.drain())
+        kernel.send(addr_message(network_monitor.RTM_DELADDR))
+        self.assertTrue(monitor.drain())
+
+    def test_link_messages_only_count_up_running_transitions(self):
+        kernel, monitor = self.make_monitor()
+
+        kernel.send(link_message(3, UP))
+        self.assertTrue(monitor.drain())
+        # Wireless scan/signal updates arrive as RTM_NEWLINK with unchanged flags.
+        kernel.send(link_message(3, UP | 0x1000) + link_message(3, UP))
+        self.assertFalse(monitor.drain())
+
+        kernel.send(link_message(3, network_monitor.IFF_UP))
+        self.assertTrue(monitor.drain())
+        kernel.send(link_message(3, 0, network_monitor.RTM_DELLINK))
+        self.assertTrue(monitor.drain())
+        kernel.send(link_message(9, 0, network_monitor.RTM_DELLINK))
+        self.assertFalse(monitor.drain())
+
+    def test_wait_for_change_coalesces_a_burst(self):
+        kernel, monitor = self.make_monitor(debounce_sec=0.05, max_settle_sec=1)
+
+        async def scenario():
+            loop = asyncio.get_running_loop()
+            for delay in (0.01, 0.03, 0.05):
+                loop.call_later(delay, kernel.send, addr_message())
+            started = loop.time()
+            changed = await monitor.wait_for_change(1)
+            return changed, loop.time() - started
+
+        changed, elapsed = asyncio.run(scenario())
+
+        self.assertTrue(changed)
+        self.assertGreaterEqual(elapsed, 0.1)
+        self.assertLess(elapsed, 0.9)
+        self.assertFalse(monitor.drain())
+
+    def test_wait_for_change_ignores_irrelevant_messages_until_timeout(self):
+        kernel, monitor = self.make_monitor(debounce_sec=0.01)
+        kernel.send(link_message(3, UP))
+        monitor.drain()
+
+        async def scenario():
+            asyncio.get_running_loop().call_later(0.01, kernel.send, link_message(3, UP))
+            return await monitor.wait_for_change(0.1)
+
+        self.assertFalse(asyncio.run(scenario()))
+
+    def test_queued_change_wakes_the_next_wait_immediately(self):
+        kernel, monitor = self.make_monitor(debounce_sec=0.01)
+        kernel.send(addr_message())
+
+        self.assertTrue(asyncio.run(monitor.wait_for_change(5)))
+
+    def test_polling_fallback_sleeps_for_the_whole_timeout(self):
+        async def scenario():
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            changed = await network_monitor.wait_for_network_change(None, 0.05)
+            return changed, loop.time() - started
+
+        changed, elapsed = asyncio.run(scenario())
+
+        self.assertFalse(changed)
+        self.assertGreaterEqual(elapsed, 0.04)
+
+    @unittest.skipUnless(hasattr(socket, "AF_NETLINK"), "rtnetlink is Linux-only")
+    def test_opens_real_rtnetlink_socket(self):
+        monitor = open_network_change_monitor()
+        if monitor is None:
+            self.skipTest("rtnetlink socket not permitted here")
+        self.addCleanup(monitor.close)
+        self.assertGreaterEqual(monitor.fileno(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import asyncio
+import sys
+import unittest
+from collections import deque
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from pending_text_queue import PendingText, PendingTextQueue, take_text_batch
+from voicing_protocol import TEXT_SEND_MODE_COMMIT, TEXT_SEND_MODE_SHADOW, TEXT_SEND_MODE_SUBMIT
+
+
+class TakeTextBatchTests(unittest.TestCase):
+    def test_shadow_frames_are_concatenated(self):
+        pending = deque([
+            PendingText("你好", TEXT_SEND_MODE_SHADOW),
+            PendingText("，世界", TEXT_SEND_MODE_SHADOW),
+        ])
+        batch = take_text_batch(pending)
+        self.assertEqual(batch.text, "你好，世界")
+        self.assertFalse(batch.auto_enter)
+        self.assertFalse(pending)
+
+    def test_commit_is_a_barrier(self):
+        pending = deque([
+            PendingText("a", TEXT_SEND_MODE_SHADOW),
+            PendingText("", TEXT_SEND_MODE_COMMIT, auto_enter=True),
+            PendingText("b", TEXT_SEND_MODE_SHADOW),
+        ])
+        self.assertEqual(take_text_batch(pending).text, "a")
+        commit = take_text_batch(pending)
+        self.assertTrue(commit.is_commit)
+        self.assertEqual(len(commit.messages), 1)
+        self.assertEqual(take_text_batch(pending).text, "b")
+
+    def test_auto_enter_submit_closes_the_batch(self):
+        pending = deque([
+            PendingText("a", TEXT_SEND_MODE_SHADOW),
+            PendingText("b", TEXT_SEND_MODE_SUBMIT, auto_enter=True),
+            PendingText("c", TEXT_SEND_MODE_SUBMIT),
+        ])
+        batch = take_text_batch(pending)
+        self.assertEqual(batch.text, "ab")
+        self.assertTrue(batch.auto_enter)
+        self.assertEqual(take_text_batch(pending).text, "c")
+
+
+class PendingTextQueueTests(unittest.TestCase):
+    def test_next_batch_waits_for_put_and_returns_none_after_close(self):
+        async def main():
+            pending = PendingTextQueue()
+            waiter = asyncio.create_task(pending.next_batch())
+            await asyncio.sleep(0)
+            pending.put(PendingText("hello"))
+            batch = await waiter
+            pending.close()
+            return batch, await pending.next_batch()
+
+        batch, closed = asyncio.run(main())
+        self.assertEqual(batch.text, "hello")
+        self.assertIsNone(closed)
+
+    def test_close_still_drains_queued_messages(self):
+        async def main():
+            pending = PendingTextQueue()
+            pending.put(PendingText("hello"))
+            pending.close()
+            return await pending.next_batch(), await pending.next_batch()
+
+        batch, closed = asyncio.run(main())
+        self.assertEqual(batch.text, "hello")
+        self.assertIsNone(closed)
+
+
+if __name__ == "__main__":
+    unittest.main()
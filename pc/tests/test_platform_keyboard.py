@@ -1,6 +1,15 @@
+import json
+import os
+import queue
+import shutil
+import subprocess
 import sys
+import tempfile
+import threading
+import time
 import unittest
 from pathlib import Path
+from types import SimpleNamespace
 from unittest.mock import MagicMock, patch
 
 sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
@@ -8,9 +17,214 @@ sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
 import platform_keyboard
 
 
+class FakeStateType:
+    FOCUSED = "focused"
+    ACTIVE = "active"
+    SHOWING = "showing"
+    MANAGES_DESCENDANTS = "manages-descendants"
+
+
+class FakeStateSet:
+    def __init__(self, states):
+        self._states = set(states)
+
+    def contains(self, state):
+        return state in self._states
+
+
+class FakeAccessible:
+    def __init__(self, name, role="panel", states=("showing",), children=(), app=None):
+        self.name = name
+        self.role = role
+        self.states = states
+        self.children = list(children)
+        self.app = app
+        self.state_reads = 0
+
+    def get_state_set(self):
+        self.state_reads += 1
+        return FakeStateSet(self.states)
+
+    def get_child_count(self):
+        return len(self.children)
+
+    def get_child_at_index(self, index):
+        return self.children[index]
+
+    def get_application(self):
+        return self.app
+
+    def get_role_name(self):
+        return self.role
+
+    def get_name(self):
+        return self.name
+
+
+def fake_app(name, *windows):
+    app = FakeAccessible(name, role="application", states=(), children=windows)
+    for window in windows:
+        _set_app(window, app)
+    return app
+
+
+def _set_app(accessible, app):
+    accessible.app = app
+    for child in accessible.children:
+        _set_app(child, app)
+
+
+def fake_desktop():
+    """Chrome (many tabs, one hidden) in the background, kitty active and focused."""
+    hidden_tabs = [
+        FakeAccessible(f"tab {index}", states=(), children=[FakeAccessible("hidden entry", "entry", ("focused",))])
+        for index in range(50)
+    ]
+    chrome = fake_app(
+        "Google Chrome",
+        FakeAccessible("Chrome", "frame", ("showing",), children=hidden_tabs),
+    )
+    scrollback = FakeAccessible(
+        "scrollback",
+        "table",
+        ("showing", "manages-descendants"),
+        children=[FakeAccessible(f"row {index}", "table cell") for index in range(50)],
+    )
+    prompt = FakeAccessible("bash", "terminal", ("showing", "focused"))
+    kitty = fake_app(
+        "kitty",
+        FakeAccessible("kitty", "frame", ("showing", "active"), children=[scrollback, prompt]),
+    )
+    return FakeAccessible("main", "desktop frame", (), children=[chrome, kitty])
+
+
+class FakeXServer:
+    """Keyboard mapping plus an XTest recorder that resolves keycodes at press time."""
+
+    def __init__(self, mapping):
+        self.mapping = {keycode: list(row) for keycode, row in mapping.items()}
+        self.typed = []
+        self.flushes = 0
+        self.remaps = 0
+        self.display = MagicMock()
+        self.display.display.info.min_keycode = min(self.mapping)
+        self.display.display.info.max_keycode = max(self.mapping)
+        self.display.get_keyboard_mapping.side_effect = self.get_keyboard_mapping
+        self.display.change_keyboard_mapping.side_effect = self.change_keyboard_mapping
+        self.display.flush.side_effect = self.flush
+
+    def get_keyboard_mapping(self, first, count):
+        return [list(self.mapping[keycode]) for keycode in range(first, first + count)]
+
+    def change_keyboard_mapping(self, keycode, rows):
+        self.mapping[keycode] = list(rows[0])
+        self.remaps += 1
+
+    def flush(self):
+        self.flushes += 1
+
+    def fake_input(self, display, event_type, keycode):
+        from Xlib import X
+
+        if event_type == X.KeyPress:
+            self.typed.append(self.mapping[keycode][0])
+
+    def typed_text(self):
+        return "".join(chr(keysym & 0xFFFFFF) for keysym in self.typed)
+
+
+class FakeXSelectionServer:
+    """Display stand-in whose event queue is fed by the test, for selection traffic."""
+
+    def __init__(self):
+        self.events = queue.Queue()
+        self.atoms = {}
+        self.window = MagicMock(id=0x400001)
+        self.display = MagicMock()
+        self.display.info.max_request_length = 65535
+        self.display.info.resource_id_mask = 0x1FFFFF
+        # The focused app's client owns XIDs 0x600000..0x7FFFFF.
+        self.display.get_input_focus.return_value = SimpleNamespace(focus=SimpleNamespace(id=0x600010))
+        root = self.display.screen.return_value.root
+        root.get_full_property.return_value = None
+        root.create_window.return_value = self.window
+        self.display.intern_atom.side_effect = lambda name: self.atoms.setdefault(name, 100 + len(self.atoms))
+        self.display.get_selection_owner.return_value = self.window
+        self.display.next_event.side_effect = self.next_event
+        self.display.close.side_effect = lambda: self.events.put(None)
+
+    def next_event(self):
+        event = self.events.get()
+        if event is None:
+            raise ConnectionError("display closed")
+        return event
+
+    def selection_request(self, target, prop=None, requestor_id=0x600042):
+        from Xlib import X
+
+        requestor = MagicMock(id=requestor_id)
+        return SimpleNamespace(
+            type=X.SelectionRequest,
+            time=1,
+            requestor=requestor,
+            selection=self.atoms["CLIPBOARD"],
+            target=target,
+            property=prop or self.atoms["VOICING_CLIPBOARD"] + 50,
+        )
+
+
 class PlatformKeyboardTests(unittest.TestCase):
     def setUp(self):
         platform_keyboard._clear_terminal_focus_cache()
+        platform_keyboard._CLIPBOARD_BURST = None
+        platform_keyboard._LAST_PASTE_SETTLE = None
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.data_dir = Path(temp_dir.name)
+        data_dir_patcher = patch("platform_keyboard.get_data_dir", return_value=self.data_dir)
+        data_dir_patcher.start()
+        self.addCleanup(data_dir_patcher.stop)
+        # Paste-mode tests drive the sampling path unless they opt into the tracker.
+        focus_tracker_patcher = patch("platform_keyboard._get_focus_tracker", return_value=None)
+        self.mock_get_focus_tracker = focus_tracker_patcher.start()
+        self.addCleanup(focus_tracker_patcher.stop)
+        shell_patcher = patch("platform_keyboard._get_shell_focus_info", return_value=None)
+        self.mock_get_shell_focus_info = shell_patcher.start()
+        self.addCleanup(shell_patcher.stop)
+        probe_patcher = patch("platform_keyboard._probe_focus_info", return_value=None)
+        self.mock_probe_focus_info = probe_patcher.start()
+        self.addCleanup(probe_patcher.stop)
+        platform_keyboard._PASTE_MODE_CACHE = platform_keyboard._PasteModeCache()
+        platform_keyboard._SETTLE_DELAYS = platform_keyboard._SettleDelayProfiles()
+        # Capability probes are cached per process; tests patch what they probe.
+        platform_keyboard.invalidate_capability()
+        self.addCleanup(platform_keyboard.invalidate_capability)
+        # Clipboard tests must not start background focus resolution; prefetch tests call this.
+        self.prefetch_paste_sequence = platform_keyboard.prefetch_paste_sequence
+        prefetch_patcher = patch("platform_keyboard.prefetch_paste_sequence")
+        self.mock_prefetch_paste_sequence = prefetch_patcher.start()
+        self.addCleanup(prefetch_patcher.stop)
+        platform_keyboard._PASTE_SEQUENCE_PREFETCH = None
+        xtest_patcher = patch("platform_keyboard._get_xtest_keyboard_backend", return_value=None)
+        self.mock_get_xtest_keyboard_backend = xtest_patcher.start()
+        self.addCleanup(xtest_patcher.stop)
+        x11_patcher = patch("platform_keyboard._get_x11_focus_classifier", return_value=None)
+        self.mock_get_x11_focus_classifier = x11_patcher.start()
+        self.addCleanup(x11_patcher.stop)
+        x11_clipboard_patcher = patch("platform_keyboard._get_x11_clipboard_backend", return_value=None)
+        self.mock_get_x11_clipboard_backend = x11_clipboard_patcher.start()
+        self.addCleanup(x11_clipboard_patcher.stop)
+        qt_clipboard_patcher = patch("platform_keyboard._get_qt_clipboard_backend", return_value=None)
+        self.mock_get_qt_clipboard_backend = qt_clipboard_patcher.start()
+        self.addCleanup(qt_clipboard_patcher.stop)
+        self.addCleanup(
+            setattr,
+            platform_keyboard,
+            "_WAYLAND_KEYBOARD_BACKEND",
+            platform_keyboard._WAYLAND_KEYBOARD_BACKEND,
+        )
+        self.addCleanup(platform_keyboard.set_text_injection_strategy, platform_keyboard.get_text_injection_strategy())
+        platform_keyboard.set_text_injection_strategy(platform_keyboard.TextInjectionStrategy.AUTO)
 
     def test_get_paste_hotkey_macos_uses_command(self):
         with patch("platform_keyboard.get_platform", return_value="darwin"):
@@ -37,6 +251,736 @@ class PlatformKeyboardTests(unittest.TestCase):
                     platform_keyboard.paste_from_clipboard()
         backend.paste_from_clipboard.assert_called_once()
 
+    def test_failed_portal_paste_invalidates_cached_portal_capability(self):
+        backend = MagicMock()
+        backend.paste_from_clipboard.side_effect = RuntimeError("session closed")
+        with patch("platform_keyboard.ensure_runtime_supported"):
+            with patch("platform_keyboard._is_linux_wayland", return_value=True):
+                with patch("platform_keyboard._get_remote_desktop_portal_backend", return_value=backend):
+                    with patch("platform_keyboard.invalidate_capability") as mock_invalidate:
+                        with self.assertRaises(RuntimeError):
+                            platform_keyboard.paste_from_clipboard()
+        mock_invalidate.assert_called_once_with(platform_keyboard.CAPABILITY_REMOTE_DESKTOP_KEYBOARD)
+
+    def test_paste_from_clipboard_x11_follows_paste_mode(self):
+        backend = MagicMock()
+        classifier = MagicMock()
+        classifier.classify.return_value = platform_keyboard._FocusKind.TERMINAL
+        self.mock_get_x11_focus_classifier.return_value = classifier
+        cases = [
+            (platform_keyboard.PasteMode.AUTO, ("ctrl", "shift", "v")),
+            (platform_keyboard.PasteMode.NORMAL, ("ctrl", "v")),
+            (platform_keyboard.PasteMode.TERMINAL, ("ctrl", "shift", "v")),
+            (platform_keyboard.PasteMode.COMPAT, ("shift", "insert")),
+        ]
+        with patch("platform_keyboard.ensure_runtime_supported"):
+            with patch("platform_keyboard.get_platform", return_value="linux"):
+                with patch("platform_keyboard.is_wayland_session", return_value=False):
+                    with patch("platform_keyboard._get_pyautogui", return_value=backend):
+                        for mode, hotkey in cases:
+                            with self.subTest(mode=mode):
+                                backend.reset_mock()
+                                with patch("platform_keyboard.get_paste_mode", return_value=mode):
+                                    platform_keyboard.paste_from_clipboard()
+                                backend.hotkey.assert_called_once_with(*hotkey, interval=0.02)
+
+    def test_x11_paste_and_enter_prefer_xtest_backend(self):
+        xtest = MagicMock()
+        pyautogui = MagicMock()
+        self.mock_get_xtest_keyboard_backend.return_value = xtest
+        with patch("platform_keyboard.ensure_runtime_supported"):
+            with patch("platform_keyboard.get_platform", return_value="linux"):
+                with patch("platform_keyboard.is_wayland_session", return_value=False):
+                    with patch("platform_keyboard._get_pyautogui", return_value=pyautogui):
+                        platform_keyboard.paste_from_clipboard()
+                        platform_keyboard.press_enter()
+
+        xtest.paste_from_clipboard.assert_called_once_with()
+        xtest.press_enter.assert_called_once_with()
+        pyautogui.hotkey.assert_not_called()
+        pyautogui.press.assert_not_called()
+
+    def test_xtest_backend_sends_sequence_with_one_flush(self):
+        from Xlib import X
+
+        display = MagicMock()
+        display.keysym_to_keycode.side_effect = {
+            platform_keyboard.KEYSYM_CTRL_L: 37,
+            platform_keyboard.KEYSYM_SHIFT_L: 50,
+            platform_keyboard.KEYSYM_V: 55,
+            platform_keyboard.KEYSYM_RETURN: 36,
+        }.get
+        backend = platform_keyboard.XTestKeyboardBackend(display)
+        with patch("Xlib.ext.xtest.fake_input") as fake_input:
+            with patch("platform_keyboard.get_paste_mode", return_value=platform_keyboard.PasteMode.TERMINAL):
+                backend.paste_from_clipboard()
+            self.assertEqual(display.flush.call_count, 1)
+            backend.press_enter()
+            backend.press_enter()
+
+        self.assertEqual(
+            [call.args[1:] for call in fake_input.call_args_list],
+            [
+                (X.KeyPress, 37),
+                (X.KeyPress, 50),
+                (X.KeyPress, 55),
+                (X.KeyRelease, 55),
+                (X.KeyRelease, 50),
+                (X.KeyRelease, 37),
+                (X.KeyPress, 36),
+                (X.KeyRelease, 36),
+                (X.KeyPress, 36),
+                (X.KeyRelease, 36),
+            ],
+        )
+        self.assertEqual(display.flush.call_count, 3)
+        self.assertEqual(display.keysym_to_keycode.call_count, 4)
+
+    def test_xtest_backend_rejects_unmapped_keysym_before_sending(self):
+        display = MagicMock()
+        display.keysym_to_keycode.return_value = 0
+        backend = platform_keyboard.XTestKeyboardBackend(display)
+        with patch("Xlib.ext.xtest.fake_input") as fake_input:
+            with self.assertRaises(RuntimeError):
+                backend.press_enter()
+        fake_input.assert_not_called()
+        self.assertTrue(backend.is_available())
+
+    def test_xtest_backend_drops_connection_when_sending_fails(self):
+        display = MagicMock()
+        display.keysym_to_keycode.return_value = 36
+        display.flush.side_effect = ConnectionResetError("gone")
+        backend = platform_keyboard.XTestKeyboardBackend(display)
+        with patch("Xlib.ext.xtest.fake_input"):
+            with self.assertRaises(RuntimeError):
+                backend.press_enter()
+        display.close.assert_called_once()
+        self.assertFalse(backend.is_available())
+
+    def test_xtest_type_text_uses_spare_keycodes(self):
+        server = FakeXServer({8: [0x61, 0x41], 9: [0, 0], 10: [0xFF0D, 0], 11: [0, 0], 12: [0, 0], 13: [0, 0]})
+        backend = platform_keyboard.XTestKeyboardBackend(server.display)
+        with patch("Xlib.ext.xtest.fake_input", side_effect=server.fake_input):
+            backend.type_text("你好a!")
+            self.assertEqual(server.typed_text(), "你好a!")
+            self.assertEqual(server.flushes, 1)
+            self.assertEqual(server.mapping[8], [0x61, 0x41])
+            self.assertEqual(server.mapping[10], [0xFF0D, 0])
+
+    def test_xtest_type_text_restores_spare_keycodes_after_each_call(self):
+        server = FakeXServer({8: [0x61, 0x41], 9: [0, 0], 10: [0, 0], 11: [0, 0]})
+        backend = platform_keyboard.XTestKeyboardBackend(server.display)
+        with patch("Xlib.ext.xtest.fake_input", side_effect=server.fake_input):
+            with patch("platform_keyboard.threading.Event") as event_factory:
+                backend.type_text("你好")
+                self.assertTrue(all(server.mapping[keycode] == [0, 0] for keycode in (9, 10, 11)))
+                # The release waits until clients have read the last presses.
+                event_factory.return_value.wait.assert_called()
+
+                server.typed.clear()
+                backend.type_text("好a")
+
+        self.assertEqual(server.typed_text(), "好a")
+        self.assertEqual(server.mapping[8], [0x61, 0x41])
+        self.assertTrue(all(server.mapping[keycode] == [0, 0] for keycode in (9, 10, 11)))
+
+    def test_xtest_type_text_remaps_in_batches_after_settling(self):
+        server = FakeXServer({8: [0x61, 0x41], 9: [0, 0], 10: [0, 0]})
+        backend = platform_keyboard.XTestKeyboardBackend(server.display)
+        with patch("Xlib.ext.xtest.fake_input", side_effect=server.fake_input):
+            with patch("platform_keyboard.threading.Event") as event_factory:
+                backend.type_text("xyzxy")
+
+        self.assertEqual(server.typed_text(), "xyzxy")
+        self.assertEqual(server.flushes, 3)
+        event_factory.return_value.wait.assert_called()
+        self.assertLessEqual(
+            max(call.args[0] for call in event_factory.return_value.wait.call_args_list),
+            platform_keyboard.XTEST_REMAP_SETTLE_SEC,
+        )
+
+    def test_xtest_type_text_forgets_assignments_reset_by_layout_change(self):
+        server = FakeXServer({8: [0, 0], 9: [0, 0]})
+        backend = platform_keyboard.XTestKeyboardBackend(server.display)
+        with patch("Xlib.ext.xtest.fake_input", side_effect=server.fake_input):
+            backend.type_text("é")
+            server.mapping = {8: [0x71, 0x51], 9: [0, 0]}
+            backend.type_text("é")
+
+        self.assertEqual(server.typed_text(), "éé")
+        self.assertEqual(server.mapping[8], [0x71, 0x51])
+
+    def make_x11_clipboard(self):
+        server = FakeXSelectionServer()
+        clipboard = platform_keyboard._X11ClipboardBackend(server.display)
+        self.addCleanup(clipboard.close)
+        return server, clipboard
+
+    def test_x11_clipboard_serves_selection_requests_and_reports_transfer(self):
+        from Xlib import Xatom
+
+        server, clipboard = self.make_x11_clipboard()
+        clipboard.copy("你好 voicing")
+        server.window.set_selection_owner.assert_called_once_with(server.atoms["CLIPBOARD"], 0)
+
+        targets = server.selection_request(server.atoms["TARGETS"])
+        clipboard._serve_request(targets)
+        prop, prop_type, prop_format, offered = targets.requestor.change_property.call_args.args
+        self.assertEqual((prop_type, prop_format), (Xatom.ATOM, 32))
+        self.assertIn(server.atoms["UTF8_STRING"], offered)
+        clipboard.expect_transfer()
+        self.assertFalse(clipboard.wait_for_transfer(0))
+
+        request = server.selection_request(server.atoms["UTF8_STRING"])
+        server.events.put(request)
+        self.assertTrue(clipboard.wait_for_transfer(1))
+        self.assertEqual(
+            request.requestor.change_property.call_args.args[2:],
+            (8, "你好 voicing".encode("utf-8")),
+        )
+        notify = request.requestor.send_event.call_args.args[0]
+        self.assertEqual(notify.property, request.property)
+        self.assertEqual(clipboard.paste(), "你好 voicing")
+
+        clipboard.copy("next")
+        clipboard.expect_transfer()
+        self.assertFalse(clipboard.wait_for_transfer(0))
+
+    def test_x11_clipboard_ignores_fetches_before_paste_and_from_other_clients(self):
+        server, clipboard = self.make_x11_clipboard()
+        clipboard.copy("hello")
+        # A clipboard manager copies the text as soon as the owner changes.
+        early = server.selection_request(server.atoms["UTF8_STRING"], requestor_id=0x800005)
+        clipboard._serve_request(early)
+        self.assertEqual(early.requestor.change_property.call_args.args[3], b"hello")
+
+        clipboard.expect_transfer()
+        self.assertFalse(clipboard.wait_for_transfer(0))
+        clipboard._serve_request(server.selection_request(server.atoms["UTF8_STRING"], requestor_id=0x800005))
+        self.assertFalse(clipboard.wait_for_transfer(0))
+
+        # The focused app asks through its own hidden requestor window.
+        clipboard._serve_request(server.selection_request(server.atoms["UTF8_STRING"], requestor_id=0x600099))
+        self.assertTrue(clipboard.wait_for_transfer(0))
+
+    def test_x11_clipboard_counts_any_requestor_when_focus_is_unknown(self):
+        from Xlib import X
+
+        server, clipboard = self.make_x11_clipboard()
+        server.display.get_input_focus.return_value = SimpleNamespace(focus=X.PointerRoot)
+        clipboard.copy("hello")
+        clipboard._serve_request(server.selection_request(server.atoms["UTF8_STRING"], requestor_id=0x800005))
+        self.assertFalse(clipboard.wait_for_transfer(0))
+
+        clipboard.expect_transfer()
+        clipboard._serve_request(server.selection_request(server.atoms["UTF8_STRING"], requestor_id=0x800005))
+        self.assertTrue(clipboard.wait_for_transfer(0))
+
+    def test_x11_clipboard_refuses_requests_after_losing_ownership(self):
+        from Xlib import X
+
+        server, clipboard = self.make_x11_clipboard()
+        clipboard.copy("hello")
+        server.events.put(SimpleNamespace(type=X.SelectionClear))
+        deadline = time.monotonic() + 1
+        while clipboard._is_owner and time.monotonic() < deadline:
+            time.sleep(0.001)
+        # Nobody owns CLIPBOARD now, so the server answers the conversion with no property.
+        server.window.convert_selection.side_effect = lambda *args: server.events.put(
+            SimpleNamespace(type=X.SelectionNotify, property=X.NONE)
+        )
+        self.assertEqual(clipboard.paste(), "")
+
+        clipboard.expect_transfer()
+        request = server.selection_request(server.atoms["UTF8_STRING"])
+        clipboard._serve_request(request)
+        request.requestor.change_property.assert_not_called()
+        self.assertEqual(request.requestor.send_event.call_args.args[0].property, X.NONE)
+        self.assertFalse(clipboard.wait_for_transfer(0))
+
+    def test_x11_clipboard_copy_fails_when_ownership_is_not_granted(self):
+        server, clipboard = self.make_x11_clipboard()
+        server.display.get_selection_owner.return_value = MagicMock(id=0x500001)
+        with self.assertRaises(RuntimeError):
+            clipboard.copy("hello")
+
+    def test_x11_clipboard_reads_incr_transfers_in_chunks(self):
+        from Xlib import X
+
+        server, clipboard = self.make_x11_clipboard()
+        prop = server.atoms["VOICING_CLIPBOARD"]
+        values = [
+            SimpleNamespace(property_type=server.atoms["INCR"], value=[300000]),
+            SimpleNamespace(property_type=server.atoms["UTF8_STRING"], value="大".encode("utf-8") * 2),
+            SimpleNamespace(property_type=server.atoms["UTF8_STRING"], value=b"tail"),
+            SimpleNamespace(property_type=server.atoms["UTF8_STRING"], value=b""),
+        ]
+        server.window.get_full_property.side_effect = lambda *args: values.pop(0)
+        server.window.convert_selection.side_effect = lambda *args: server.events.put(
+            SimpleNamespace(type=X.SelectionNotify, property=prop)
+        )
+
+        def owner_writes_next_chunk(atom):
+            # The owner answers each delete with the next chunk; other atoms are noise.
+            server.events.put(SimpleNamespace(type=X.PropertyNotify, atom=prop + 1, state=X.PropertyNewValue))
+            if values:
+                server.events.put(SimpleNamespace(type=X.PropertyNotify, atom=prop, state=X.PropertyDelete))
+                server.events.put(SimpleNamespace(type=X.PropertyNotify, atom=prop, state=X.PropertyNewValue))
+
+        server.window.delete_property.side_effect = owner_writes_next_chunk
+
+        self.assertEqual(clipboard.paste(), "大大tail")
+        self.assertEqual(values, [])
+        self.assertEqual(server.window.delete_property.call_count, 4)
+
+    def test_x11_clipboard_hands_owned_text_to_clipboard_manager(self):
+        from Xlib import X
+
+        server, clipboard = self.make_x11_clipboard()
+        manager = MagicMock(id=0x900001)
+        server.display.get_selection_owner.side_effect = lambda atom: (
+            manager if atom == server.atoms["CLIPBOARD_MANAGER"] else server.window
+        )
+        server.window.convert_selection.side_effect = lambda selection, target, prop, time: server.events.put(
+            SimpleNamespace(type=X.SelectionNotify, property=prop)
+        )
+        self.assertFalse(clipboard.hand_off())
+
+        clipboard.copy("keep me")
+        with patch("platform_keyboard.subprocess.run") as mock_run:
+            self.assertTrue(clipboard.hand_off())
+        selection, target = server.window.convert_selection.call_args.args[:2]
+        self.assertEqual((selection, target), (server.atoms["CLIPBOARD_MANAGER"], server.atoms["SAVE_TARGETS"]))
+        mock_run.assert_not_called()
+
+    def test_x11_clipboard_hands_owned_text_to_xclip_without_manager(self):
+        server, clipboard = self.make_x11_clipboard()
+        server.display.get_selection_owner.side_effect = lambda atom: (
+            0 if atom == server.atoms["CLIPBOARD_MANAGER"] else server.window
+        )
+        clipboard.copy("keep me")
+        with patch("platform_keyboard.which_cached", side_effect=lambda name: name == "xclip"):
+            with patch("platform_keyboard.subprocess.run") as mock_run:
+                self.assertTrue(clipboard.hand_off())
+
+        self.assertEqual(mock_run.call_args.args[0], ["xclip", "-selection", "clipboard"])
+        self.assertEqual(mock_run.call_args.kwargs["input"], b"keep me")
+
+    def test_x11_clipboard_close_stops_reader_thread(self):
+        server, clipboard = self.make_x11_clipboard()
+        clipboard.close()
+        self.assertFalse(clipboard.is_available())
+        self.assertFalse(clipboard._thread.is_alive())
+
+    def test_snapshot_too_large_for_x11_owner_is_restored_through_qt_clipboard(self):
+        server, clipboard = self.make_x11_clipboard()
+        large = "x" * (server.display.info.max_request_length * 4)
+        self.assertFalse(clipboard.fits(large))
+        qt_clipboard = MagicMock()
+        self.mock_get_qt_clipboard_backend.return_value = qt_clipboard
+        with patch("platform_keyboard.ensure_runtime_supported"):
+            with patch("platform_keyboard._get_clipboard_backend", return_value=clipboard):
+                with patch.object(clipboard, "paste", return_value=large):
+                    with patch("platform_keyboard._paste_primary_selection_if_supported", return_value=None):
+                        with patch("platform_keyboard.paste_from_clipboard"):
+                            with patch("platform_keyboard.threading.Event"):
+                                with self.assertLogs(level="WARNING"):
+                                    platform_keyboard.type_text_at_cursor("hello")
+
+        self.assertEqual([call.args for call in qt_clipboard.copy.call_args_list], [("hello",), (large,)])
+        server.window.set_selection_owner.assert_not_called()
+
+    def test_type_text_at_cursor_skips_fixed_delays_once_target_fetched_paste(self):
+        class TransferClipboard:
+            def __init__(self):
+                self.copied = []
+                self.waits = []
+
+            def paste(self):
+                return "old"
+
+            def copy(self, text):
+                self.copied.append(text)
+
+            def wait_for_transfer(self, timeout_sec):
+                self.waits.append(timeout_sec)
+                return True
+
+        clipboard = TransferClipboard()
+        with patch("platform_keyboard.ensure_runtime_supported"):
+            with patch("platform_keyboard._get_clipboard_backend", return_value=clipboard):
+                with patch("platform_keyboard.paste_from_clipboard"):
+                    with patch("platform_keyboard.press_enter") as mock_enter:
+                        with patch("platform_keyboard.threading.Event") as event_factory:
+                            platform_keyboard.type_text_at_cursor(
+                                "hello",
+                                auto_enter=True,
+                                enter_delay_sec=0.3,
+                                restore_delay_sec=0.4,
+                            )
+
+        mock_enter.assert_called_once()
+        self.assertEqual(clipboard.copied, ["hello", "old"])
+        self.assertEqual(clipboard.waits, [0.3, 0.4])
+        event_factory.return_value.wait.assert_not_called()
+
+    def test_settle_delays_adapt_per_app_within_bounds(self):
+        delays = platform_keyboard._SettleDelayProfiles()
+        for _ in range(2):
+            delays.record("kitty", 0.01, 0.35)
+        self.assertEqual(delays.delay_for("kitty", 0.35), 0.35)
+        delays.record("kitty", 0.01, 0.35)
+        # Fast fetches never shorten the caller's default.
+        self.assertEqual(delays.delay_for("kitty", 0.35), 0.35)
+
+        for _ in range(3):
+            delays.record("code", 0.2, 0.35)
+        self.assertAlmostEqual(delays.delay_for("code", 0.35), 0.4)
+        for _ in range(10):
+            delays.record("code", None, 0.4)
+        self.assertEqual(delays.delay_for("code", 0.35), platform_keyboard.SETTLE_DELAY_MAX_SEC)
+        self.assertEqual(delays.delay_for("firefox", 0.35), 0.35)
+        self.assertEqual(delays.delay_for(None, 0.35), 0.35)
+
+    def test_settle_delays_persist_under_data_dir(self):
+        delays = platform_keyboard._SettleDelayProfiles()
+        for _ in range(3):
+            delays.record("code", 0.2, 0.35)
+        delays.save()
+
+        saved = json.loads((self.data_dir / platform_keyboard.SETTLE_PROFILE_FILE_NAME).read_text(encoding="utf-8"))
+        self.assertEqual(saved["code"]["samples"], 3)
+        self.assertAlmostEqual(platform_keyboard._SettleDelayProfiles().delay_for("code", 0.35), 0.4)
+
+        (self.data_dir / platform_keyboard.SETTLE_PROFILE_FILE_NAME).write_text("not json", encoding="utf-8")
+        self.assertEqual(platform_keyboard._SettleDelayProfiles().delay_for("code", 0.35), 0.35)
+
+    def test_type_text_at_cursor_learns_fetch_latency_for_target_app(self):
+        class TransferClipboard:
+            def __init__(self, fetched):
+                self.fetched = fetched
+                self.waits = []
+
+            def paste(self):
+                return "old"
+
+            def copy(self, text):
+                pass
+
+            def wait_for_transfer(self, timeout_sec):
+                self.waits.append(timeout_sec)
+                return self.fetched
+
+        delays = platform_keyboard._SETTLE_DELAYS
+        for _ in range(3):
+            delays.record("code", 0.1, 0.35)
+        clipboard = TransferClipboard(fetched=False)
+        with patch("platform_keyboard.ensure_runtime_supported"):
+            with patch("platform_keyboard._get_clipboard_backend", return_value=clipboard):
+                with patch("platform_keyboard._paste_target_app", return_value="code"):
+                    with patch("platform_keyboard.paste_from_clipboard"):
+                        with patch("platform_keyboard.press_enter"):
+                            with patch.object(delays, "record", wraps=delays.record) as mock_record:
+                                platform_keyboard.type_text_at_cursor("hello", auto_enter=True)
+
+        # The miss is recorded once and already lengthens the restore wait.
+        self.assertEqual([round(wait, 3) for wait in clipboard.waits], [0.2, 0.38])
+        mock_record.assert_called_once_with("code", None, 0.2)
+
+    def test_slow_paste_after_fast_ones_still_gets_the_default_wait(self):
+        class SlowClipboard:
+            def __init__(self):
+                self.waits = []
+
+            def paste(self):
+                return "old"
+
+            def copy(self, text):
+                pass
+
+            def wait_for_transfer(self, timeout_sec):
+                self.waits.append(timeout_sec)
+                return False
+
+        for _ in range(5):
+            platform_keyboard._SETTLE_DELAYS.record("kitty", 0.01, 0.35)
+        clipboard = SlowClipboard()
+        with patch("platform_keyboard.ensure_runtime_supported"):
+            with patch("platform_keyboard._get_clipboard_backend", return_value=clipboard):
+                with patch("platform_keyboard._paste_target_app", return_value="kitty"):
+                    with patch("platform_keyboard.paste_from_clipboard"):
+                        with patch("platform_keyboard.press_enter"):
+                            platform_keyboard.type_text_at_cursor(
+                                "hello", auto_enter=True, enter_delay_sec=0.35, restore_delay_sec=0.1
+                            )
+
+        self.assertEqual(clipboard.waits[0], 0.35)
+        # The miss lengthens the next wait past its default.
+        self.assertGreater(clipboard.waits[1], 0.1)
+
+    def test_blind_settle_wait_uses_learned_delay(self):
+        for _ in range(3):
+            platform_keyboard._SETTLE_DELAYS.record("code", 0.3, 0.35)
+        # A clipboard that cannot report the fetch sleeps the learned delay instead.
+        settle = platform_keyboard._PasteSettle(object(), "code")
+        settle.pasted()
+        with patch("platform_keyboard.threading.Event") as event_factory:
+            settle.wait(0.35)
+        self.assertAlmostEqual(event_factory.return_value.wait.call_args.args[0], 0.6)
+
+    def test_paste_settle_records_nothing_for_fetch_before_paste(self):
+        server, clipboard = self.make_x11_clipboard()
+        delays = platform_keyboard._SETTLE_DELAYS
+        clipboard.copy("hello")
+        settle = platform_keyboard._PasteSettle(clipboard, "code")
+        clipboard._serve_request(server.selection_request(server.atoms["UTF8_STRING"]))
+        settle.pasted()
+
+        with patch.object(delays, "record") as mock_record:
+            settle.wait(0.01)
+        mock_record.assert_not_called()
+        self.assertIsNone(clipboard.wait_for_transfer(0))
+
+    def test_paste_settle_records_latency_of_fetch_after_paste(self):
+        server, clipboard = self.make_x11_clipboard()
+        delays = platform_keyboard._SETTLE_DELAYS
+        clipboard.copy("hello")
+        settle = platform_keyboard._PasteSettle(clipboard, "code")
+        settle.pasted()
+        clipboard._serve_request(server.selection_request(server.atoms["UTF8_STRING"], requestor_id=0x800005))
+        clipboard._serve_request(server.selection_request(server.atoms["UTF8_STRING"]))
+
+        with patch.object(delays, "record") as mock_record:
+            settle.wait(0.35)
+        app, latency_sec, timeout_sec = mock_record.call_args.args
+        self.assertEqual((app, timeout_sec), ("code", 0.35))
+        self.assertIsNotNone(latency_sec)
+        self.assertLess(latency_sec, 0.35)
+
+    def test_paste_target_app_reads_x11_wm_class(self):
+        classifier = MagicMock()
+        classifier.active_window_class.return_value = ("Navigator", "Firefox")
+        self.mock_get_x11_focus_classifier.return_value = classifier
+        with patch("platform_keyboard._is_linux_wayland", return_value=False), patch(
+            "platform_keyboard._is_linux_x11", return_value=True
+        ):
+            self.assertEqual(platform_keyboard._paste_target_app(), "firefox")
+            classifier.active_window_class.return_value = None
+            self.assertIsNone(platform_keyboard._paste_target_app())
+
+    def test_get_clipboard_backend_on_x11_prefers_in_process_clipboards(self):
+        x11_clipboard = MagicMock()
+        self.mock_get_x11_clipboard_backend.return_value = x11_clipboard
+        with patch("platform_keyboard._is_linux_wayland", return_value=False), patch(
+            "platform_keyboard._is_linux_x11", return_value=True
+        ):
+            self.assertIs(platform_keyboard._get_clipboard_backend(), x11_clipboard)
+            self.mock_get_x11_clipboard_backend.return_value = None
+            qt_clipboard = MagicMock()
+            self.mock_get_qt_clipboard_backend.return_value = qt_clipboard
+            self.assertIs(platform_keyboard._get_clipboard_backend(), qt_clipboard)
+            self.mock_get_qt_clipboard_backend.return_value = None
+            self.assertIsInstance(
+                platform_keyboard._get_clipboard_backend(),
+                platform_keyboard._PyperclipClipboardBackend,
+            )
+
+    def test_x11_primary_selection_is_mirrored_only_for_compat_paste(self):
+        selection = MagicMock()
+        selection.paste.return_value = "old-primary"
+        self.mock_get_qt_clipboard_backend.return_value = selection
+        with patch("platform_keyboard._is_linux_wayland", return_value=False), patch(
+            "platform_keyboard._is_linux_x11", return_value=True
+        ):
+            with patch("platform_keyboard.get_paste_mode", return_value=platform_keyboard.PasteMode.NORMAL):
+                self.assertIsNone(platform_keyboard._paste_primary_selection_if_supported())
+                self.assertFalse(platform_keyboard._copy_to_primary_selection_if_supported("hello"))
+            with patch("platform_keyboard.get_paste_mode", return_value=platform_keyboard.PasteMode.COMPAT):
+                self.assertEqual(platform_keyboard._paste_primary_selection_if_supported(), "old-primary")
+                self.assertTrue(platform_keyboard._copy_to_primary_selection_if_supported("hello"))
+
+        self.mock_get_qt_clipboard_backend.assert_called_with(selection=True)
+        selection.copy.assert_called_once_with("hello")
+
+    def test_warm_up_injection_stack_primes_x11_backends_and_survives_failures(self):
+        self.mock_get_x11_clipboard_backend.side_effect = RuntimeError("no display")
+        with patch("platform_keyboard.ensure_runtime_supported"):
+            with patch("platform_keyboard._is_linux_wayland", return_value=False), patch(
+                "platform_keyboard._is_linux_x11", return_value=True
+            ):
+                with patch("platform_keyboard._get_pyautogui") as mock_pyautogui:
+                    with self.assertLogs(level="WARNING"):
+                        timings = platform_keyboard.warm_up_injection_stack()
+
+        self.assertEqual(
+            list(timings),
+            ["runtime", "xtest", "clipboard", "x11_focus", "pyautogui_fallback"],
+        )
+        self.assertTrue(all(seconds >= 0 for seconds in timings.values()))
+        self.mock_get_x11_focus_classifier.assert_called()
+        # XTEST is unavailable here, so the pyautogui fallback is imported too.
+        mock_pyautogui.assert_called_once()
+
+    def test_warm_up_injection_stack_starts_portal_session_on_wayland(self):
+        portal = MagicMock()
+        platform_keyboard.set_paste_mode(platform_keyboard.PasteMode.NORMAL)
+        self.addCleanup(platform_keyboard.set_paste_mode, platform_keyboard.PasteMode.AUTO)
+        with patch("platform_keyboard.ensure_runtime_supported"):
+            with patch("platform_keyboard._is_linux_wayland", return_value=True):
+                with patch("platform_keyboard._get_remote_desktop_portal_backend", return_value=portal):
+                    with patch("platform_keyboard._get_clipboard_backend"):
+                        timings = platform_keyboard.warm_up_injection_stack()
+
+        portal.ensure_clipboard.assert_called_once()
+        self.assertEqual(list(timings), ["runtime", "portal", "clipboard"])
+        self.mock_get_focus_tracker.assert_not_called()
+
+    def test_keysym_for_char(self):
+        self.assertEqual(platform_keyboard._keysym_for_char("a"), 0x61)
+        self.assertEqual(platform_keyboard._keysym_for_char("é"), 0xE9)
+        self.assertEqual(platform_keyboard._keysym_for_char("中"), 0x01004E2D)
+        self.assertIsNone(platform_keyboard._keysym_for_char("\n"))
+        self.assertIsNone(platform_keyboard._keysym_for_char("\t"))
+        self.assertIsNone(platform_keyboard._keysym_for_char("\r"))
+        self.assertIsNone(platform_keyboard._keysym_for_char("\x1b"))
+
+    def test_type_text_at_cursor_types_short_text_directly_on_x11(self):
+        xtest = MagicMock()
+        xtest.can_type.return_value = True
+        clipboard = MagicMock()
+        self.mock_get_xtest_keyboard_backend.return_value = xtest
+        platform_keyboard.set_text_injection_strategy(platform_keyboard.TextInjectionStrategy.DIRECT)
+        with patch("platform_keyboard.ensure_runtime_supported"):
+            with patch("platform_keyboard._is_linux_wayland", return_value=False), patch(
+                "platform_keyboard._is_linux_x11", return_value=True
+            ):
+                with patch("platform_keyboard._get_clipboard_backend", return_value=clipboard):
+                    with patch("platform_keyboard.paste_from_clipboard") as mock_paste:
+                        with patch("platform_keyboard.press_enter") as mock_enter:
+                            with patch("platform_keyboard.threading.Event"):
+                                platform_keyboard.type_text_at_cursor(
+                                    "short",
+                                    auto_enter=True,
+                                    direct_typing_max_chars=5,
+                                )
+                                xtest.type_text.assert_called_once_with("short", 0.0)
+                                mock_enter.assert_called_once()
+                                clipboard.paste.assert_not_called()
+                                mock_paste.assert_not_called()
+
+                                platform_keyboard.type_text_at_cursor("longer", direct_typing_max_chars=5)
+                                xtest.can_type.return_value = False
+                                platform_keyboard.type_text_at_cursor("tab\r", direct_typing_max_chars=5)
+
+        xtest.type_text.assert_called_once()
+        self.assertEqual(mock_paste.call_count, 2)
+
+    def test_portal_type_text_sends_unicode_keysyms_in_one_sequence(self):
+        backend = platform_keyboard.RemoteDesktopPortalKeyboardBackend()
+        with patch.object(backend, "_ensure_started"):
+            with patch.object(backend, "_send_key_sequence") as mock_send:
+                self.assertTrue(backend.type_text("hé中"))
+                self.assertFalse(backend.type_text("line\nbreak"))
+
+        mock_send.assert_called_once_with(
+            (
+                (0x68, platform_keyboard.KEY_STATE_PRESSED),
+                (0x68, platform_keyboard.KEY_STATE_RELEASED),
+                (0xE9, platform_keyboard.KEY_STATE_PRESSED),
+                (0xE9, platform_keyboard.KEY_STATE_RELEASED),
+                (0x01004E2D, platform_keyboard.KEY_STATE_PRESSED),
+                (0x01004E2D, platform_keyboard.KEY_STATE_RELEASED),
+            )
+        )
+
+    def test_portal_type_text_is_declined_over_eis(self):
+        backend = platform_keyboard.RemoteDesktopPortalKeyboardBackend()
+        backend._eis = MagicMock()
+        with patch.object(backend, "_ensure_started"):
+            with patch.object(backend, "_send_key_sequence") as mock_send:
+                self.assertFalse(backend.type_text("hi"))
+        mock_send.assert_not_called()
+
+    def test_portal_type_text_rate_governor_spaces_characters(self):
+        backend = platform_keyboard.RemoteDesktopPortalKeyboardBackend()
+        clock = [100.0]
+        with patch.object(backend, "_ensure_started"):
+            with patch.object(backend, "_send_key_sequence") as mock_send:
+                with patch("platform_keyboard.time.monotonic", side_effect=lambda: clock[0]):
+                    with patch("platform_keyboard.threading.Event") as event_factory:
+                        event_factory.return_value.wait.side_effect = lambda seconds: clock.__setitem__(
+                            0, clock[0] + seconds
+                        )
+                        backend.type_text("abc", keys_per_sec=20)
+
+        self.assertEqual(mock_send.call_count, 3)
+        self.assertEqual(
+            [round(call.args[0], 3) for call in event_factory.return_value.wait.call_args_list],
+            [0.05, 0.05],
+        )
+
+    def test_text_injection_strategy_picks_direct_typing_per_platform(self):
+        portal = MagicMock()
+        portal.type_text.return_value = True
+        xtest = MagicMock()
+        xtest.can_type.return_value = True
+        self.mock_get_xtest_keyboard_backend.return_value = xtest
+        strategy = platform_keyboard.TextInjectionStrategy
+        with patch("platform_keyboard._get_remote_desktop_portal_backend", return_value=portal):
+            with patch("platform_keyboard._is_linux_wayland", return_value=True):
+                self.assertFalse(platform_keyboard._type_text_directly("hi"))
+                platform_keyboard.set_text_injection_strategy("direct")
+                self.assertTrue(platform_keyboard._type_text_directly("hi", 30))
+                portal.type_text.assert_called_once_with("hi", 30)
+            with patch("platform_keyboard._is_linux_wayland", return_value=False):
+                with patch("platform_keyboard._is_linux_x11", return_value=True):
+                    self.assertTrue(platform_keyboard._type_text_directly("hi"))
+                    # Off by default: an active IME would compose typed keys.
+                    platform_keyboard.set_text_injection_strategy(strategy.AUTO)
+                    self.assertFalse(platform_keyboard._type_text_directly("hi"))
+                    platform_keyboard.set_text_injection_strategy(strategy.CLIPBOARD)
+                    self.assertFalse(platform_keyboard._type_text_directly("hi"))
+        xtest.type_text.assert_called_once_with("hi", 0.0)
+
+    def test_x11_auto_paste_uses_ctrl_v_without_display(self):
+        with patch("platform_keyboard.get_paste_mode", return_value=platform_keyboard.PasteMode.AUTO):
+            self.assertEqual(platform_keyboard._resolve_x11_paste_hotkey(), ("ctrl", "v"))
+
+    def test_x11_focus_classifier_matches_wm_class(self):
+        display = MagicMock()
+        root = display.screen.return_value.root
+        window = display.create_resource_object.return_value
+        classifier = platform_keyboard._X11FocusClassifier(display)
+        cases = [
+            ([0x1400007], ("kitty", "kitty"), platform_keyboard._FocusKind.TERMINAL),
+            ([0x1400007], ("gnome-terminal-server", "Gnome-terminal"), platform_keyboard._FocusKind.TERMINAL),
+            ([0x1400007], ("xterm", "XTerm"), platform_keyboard._FocusKind.TERMINAL),
+            ([0x1400007], ("Navigator", "firefox"), platform_keyboard._FocusKind.NORMAL),
+            ([0x1400007], None, platform_keyboard._FocusKind.UNCERTAIN),
+            ([0], ("kitty", "kitty"), platform_keyboard._FocusKind.UNCERTAIN),
+        ]
+        for active, wm_class, kind in cases:
+            with self.subTest(wm_class=wm_class, active=active):
+                root.get_full_property.return_value = MagicMock(value=active)
+                window.get_wm_class.return_value = wm_class
+                self.assertEqual(classifier.classify(), kind)
+
+        display.intern_atom.assert_called_once_with("_NET_ACTIVE_WINDOW")
+        display.create_resource_object.assert_called_with("window", 0x1400007)
+
+    def test_x11_focus_classifier_is_dropped_when_the_connection_fails(self):
+        classifier = MagicMock()
+        classifier.classify.side_effect = ConnectionError("closed")
+        platform_keyboard._X11_FOCUS_CLASSIFIER = classifier
+        self.addCleanup(setattr, platform_keyboard, "_X11_FOCUS_CLASSIFIER_FAILED_AT", 0.0)
+        self.mock_get_x11_focus_classifier.return_value = classifier
+
+        with self.assertLogs(level="WARNING"):
+            self.assertEqual(platform_keyboard._classify_x11_focus(), platform_keyboard._FocusKind.UNCERTAIN)
+
+        classifier.close.assert_called_once()
+        self.assertIsNone(platform_keyboard._X11_FOCUS_CLASSIFIER)
+
     def test_press_enter_wayland_uses_portal(self):
         backend = MagicMock()
         with patch("platform_keyboard.ensure_runtime_supported"):
@@ -69,6 +1013,18 @@ class PlatformKeyboardTests(unittest.TestCase):
         self.assertEqual(event_factory.return_value.wait.call_args_list[0].args, (0.3,))
         self.assertEqual(event_factory.return_value.wait.call_args_list[1].args, (0.4,))
 
+    def test_type_text_at_cursor_skips_restore_when_snapshot_fails(self):
+        clipboard = MagicMock()
+        clipboard.paste.side_effect = TimeoutError("slow owner")
+        with patch("platform_keyboard.ensure_runtime_supported"):
+            with patch("platform_keyboard._get_clipboard_backend", return_value=clipboard):
+                with patch("platform_keyboard.paste_from_clipboard"):
+                    with patch("platform_keyboard.threading.Event"):
+                        with self.assertLogs(level="WARNING"):
+                            platform_keyboard.type_text_at_cursor("hello")
+
+        self.assertEqual([call.args for call in clipboard.copy.call_args_list], [("hello",)])
+
     def test_type_text_at_cursor_without_auto_enter(self):
         clipboard = MagicMock()
         clipboard.paste.return_value = "old"
@@ -98,6 +1054,117 @@ class PlatformKeyboardTests(unittest.TestCase):
         self.assertEqual(clipboard.copy.call_args_list[1].args, ("old",))
         event_factory.return_value.wait.assert_called_once_with(0.1)
 
+    def test_type_text_at_cursor_burst_snapshots_and_restores_once(self):
+        clipboard = MagicMock()
+        clipboard.paste.side_effect = ["old", "second"]
+        with patch("platform_keyboard.ensure_runtime_supported"):
+            with patch("platform_keyboard._get_clipboard_backend", return_value=clipboard):
+                with patch("platform_keyboard._paste_primary_selection_if_supported", return_value=None):
+                    with patch("platform_keyboard._copy_to_primary_selection_if_supported", return_value=False):
+                        with patch("platform_keyboard.paste_from_clipboard") as mock_paste:
+                            with patch("platform_keyboard.time.monotonic", return_value=10.0):
+                                platform_keyboard.type_text_at_cursor("first", burst_idle_sec=1.5)
+                                platform_keyboard.type_text_at_cursor("second", burst_idle_sec=1.5)
+                                self.assertAlmostEqual(platform_keyboard.flush_clipboard_burst(), 1.5)
+                            with patch("platform_keyboard.time.monotonic", return_value=11.6):
+                                self.assertIsNone(platform_keyboard.flush_clipboard_burst())
+
+        self.assertEqual(mock_paste.call_count, 2)
+        self.assertEqual(clipboard.paste.call_count, 2)
+        self.assertEqual(
+            [call.args for call in clipboard.copy.call_args_list],
+            [("first",), ("second",), ("old",)],
+        )
+        self.assertIsNone(platform_keyboard._CLIPBOARD_BURST)
+
+    def test_type_text_at_cursor_burst_waits_for_each_paste_before_next_copy(self):
+        events = []
+
+        class TransferClipboard:
+            def paste(self):
+                return "old"
+
+            def copy(self, text):
+                events.append(("copy", text))
+
+            def wait_for_transfer(self, timeout_sec):
+                events.append(("wait", timeout_sec))
+                return True
+
+        with patch("platform_keyboard.ensure_runtime_supported"):
+            with patch("platform_keyboard._get_clipboard_backend", return_value=TransferClipboard()):
+                with patch("platform_keyboard._paste_primary_selection_if_supported", return_value=None):
+                    with patch("platform_keyboard._copy_to_primary_selection_if_supported", return_value=False):
+                        with patch("platform_keyboard.paste_from_clipboard"):
+                            for text in ("first", "second"):
+                                platform_keyboard.type_text_at_cursor(
+                                    text, restore_delay_sec=0.4, burst_idle_sec=1.5
+                                )
+
+        self.assertEqual(
+            events,
+            [("copy", "first"), ("wait", 0.4), ("copy", "second"), ("wait", 0.4)],
+        )
+
+    def test_press_enter_after_paste_waits_on_last_burst_paste_fetch(self):
+        events = []
+
+        class TransferClipboard:
+            def paste(self):
+                return "old"
+
+            def copy(self, text):
+                events.append(("copy", text))
+
+            def wait_for_transfer(self, timeout_sec):
+                events.append(("wait", timeout_sec))
+                return True
+
+        with patch("platform_keyboard.ensure_runtime_supported"):
+            with patch("platform_keyboard._get_clipboard_backend", return_value=TransferClipboard()):
+                with patch("platform_keyboard._paste_primary_selection_if_supported", return_value=None):
+                    with patch("platform_keyboard._copy_to_primary_selection_if_supported", return_value=False):
+                        with patch("platform_keyboard.paste_from_clipboard"):
+                            with patch("platform_keyboard.press_enter", side_effect=lambda: events.append("enter")):
+                                with patch("platform_keyboard.threading.Event") as event_factory:
+                                    platform_keyboard.type_text_at_cursor(
+                                        "hello", restore_delay_sec=0.1, burst_idle_sec=1.5
+                                    )
+                                    platform_keyboard.press_enter_after_paste(0.35)
+
+        # The Enter waits on the paste's own fetch instead of sleeping blind.
+        self.assertEqual(events, [("copy", "hello"), ("wait", 0.1), ("wait", 0.35), "enter"])
+        event_factory.return_value.wait.assert_not_called()
+
+    def test_flush_clipboard_burst_keeps_clipboard_changed_by_user(self):
+        clipboard = MagicMock()
+        clipboard.paste.side_effect = ["old", "copied by user"]
+        with patch("platform_keyboard.ensure_runtime_supported"):
+            with patch("platform_keyboard._get_clipboard_backend", return_value=clipboard):
+                with patch("platform_keyboard._paste_primary_selection_if_supported", return_value=None):
+                    with patch("platform_keyboard._copy_to_primary_selection_if_supported", return_value=False):
+                        with patch("platform_keyboard.paste_from_clipboard"):
+                            platform_keyboard.type_text_at_cursor("hello", burst_idle_sec=1.5)
+                            platform_keyboard.flush_clipboard_burst(force=True)
+
+        self.assertEqual([call.args for call in clipboard.copy.call_args_list], [("hello",)])
+
+    def test_type_text_at_cursor_burst_restores_immediately_when_paste_fails(self):
+        clipboard = MagicMock()
+        clipboard.paste.side_effect = ["old", "hello"]
+        with patch("platform_keyboard.ensure_runtime_supported"):
+            with patch("platform_keyboard._get_clipboard_backend", return_value=clipboard):
+                with patch("platform_keyboard._paste_primary_selection_if_supported", return_value=None):
+                    with patch("platform_keyboard._copy_to_primary_selection_if_supported", return_value=False):
+                        with patch("platform_keyboard.paste_from_clipboard", side_effect=RuntimeError("boom")):
+                            with patch("platform_keyboard.threading.Event") as event_factory:
+                                event_factory.return_value.wait = MagicMock()
+                                with self.assertRaises(RuntimeError):
+                                    platform_keyboard.type_text_at_cursor("hello", burst_idle_sec=1.5)
+
+        self.assertEqual(clipboard.copy.call_args_list[-1].args, ("old",))
+        self.assertIsNone(platform_keyboard._CLIPBOARD_BURST)
+
     def test_remote_desktop_portal_availability_checks_keyboard_bit(self):
         backend = platform_keyboard.RemoteDesktopPortalKeyboardBackend()
         with patch.object(backend, "_available_device_types", return_value=7):
@@ -148,6 +1215,98 @@ class PlatformKeyboardTests(unittest.TestCase):
                         backend.paste_from_clipboard()
         mock_send.assert_called_once_with(platform_keyboard._ctrl_v_sequence())
 
+    def test_type_text_at_cursor_starts_paste_prefetch_before_staging_clipboard(self):
+        calls = []
+        clipboard = MagicMock()
+        clipboard.paste.side_effect = lambda: calls.append("snapshot") or "old"
+        self.mock_prefetch_paste_sequence.side_effect = lambda: calls.append("prefetch")
+        with patch("platform_keyboard.ensure_runtime_supported"):
+            with patch("platform_keyboard._get_clipboard_backend", return_value=clipboard):
+                with patch("platform_keyboard.paste_from_clipboard"):
+                    with patch("platform_keyboard.threading.Event"):
+                        platform_keyboard.type_text_at_cursor("hello")
+
+        self.assertEqual(calls[:2], ["prefetch", "snapshot"])
+
+    def test_remote_desktop_portal_paste_uses_prefetched_sequence(self):
+        backend = platform_keyboard.RemoteDesktopPortalKeyboardBackend()
+        with patch("platform_keyboard._is_linux_wayland", return_value=True):
+            with patch("platform_keyboard.get_paste_mode", return_value=platform_keyboard.PasteMode.AUTO):
+                with patch(
+                    "platform_keyboard._sample_focus_infos",
+                    return_value=[{"role": "terminal", "app_name": "kitty"}],
+                ) as mock_sample:
+                    self.prefetch_paste_sequence()
+                    # A second call while the first is in flight or fresh is reused.
+                    self.prefetch_paste_sequence()
+                    with patch.object(backend, "_ensure_started"):
+                        with patch.object(backend, "_send_key_sequence") as mock_send:
+                            backend.paste_from_clipboard()
+
+        mock_sample.assert_called_once()
+        mock_send.assert_called_once_with(platform_keyboard._ctrl_shift_v_sequence())
+        self.assertIsNone(platform_keyboard._PASTE_SEQUENCE_PREFETCH)
+
+    def test_stale_paste_prefetch_is_resolved_again(self):
+        with patch("platform_keyboard._is_linux_wayland", return_value=True):
+            with patch("platform_keyboard.get_paste_mode", return_value=platform_keyboard.PasteMode.AUTO):
+                with patch(
+                    "platform_keyboard._resolve_wayland_paste_sequence",
+                    side_effect=[platform_keyboard._ctrl_shift_v_sequence(), platform_keyboard._ctrl_v_sequence()],
+                ) as mock_resolve:
+                    self.prefetch_paste_sequence()
+                    platform_keyboard._PASTE_SEQUENCE_PREFETCH.result()
+                    later = time.monotonic() + platform_keyboard.PASTE_SEQUENCE_PREFETCH_MAX_AGE_SEC + 1
+                    with patch("platform_keyboard.time.monotonic", return_value=later):
+                        sequence = platform_keyboard._take_wayland_paste_sequence()
+
+        self.assertEqual(mock_resolve.call_count, 2)
+        self.assertEqual(sequence, platform_keyboard._ctrl_v_sequence())
+
+    def test_paste_prefetch_is_dropped_when_paste_mode_changes(self):
+        with patch("platform_keyboard._is_linux_wayland", return_value=True):
+            with patch("platform_keyboard._sample_focus_infos", return_value=[{"role": "terminal", "app_name": "kitty"}]):
+                with patch("platform_keyboard.get_paste_mode", return_value=platform_keyboard.PasteMode.AUTO):
+                    self.prefetch_paste_sequence()
+                    platform_keyboard._PASTE_SEQUENCE_PREFETCH.result()
+                with patch("platform_keyboard.get_paste_mode", return_value=platform_keyboard.PasteMode.COMPAT):
+                    self.assertEqual(
+                        platform_keyboard._take_wayland_paste_sequence(),
+                        platform_keyboard._shift_insert_sequence(),
+                    )
+
+    def test_paste_prefetch_and_injection_thread_do_not_scan_focus_concurrently(self):
+        active = []
+        overlaps = []
+        first_scan_started = threading.Event()
+
+        def sample_focus_infos():
+            active.append(1)
+            overlaps.append(len(active))
+            first_scan_started.set()
+            time.sleep(0.05)
+            active.pop()
+            return [{"role": "terminal", "app_name": "kitty"}]
+
+        with patch("platform_keyboard._is_linux_wayland", return_value=True):
+            with patch("platform_keyboard.get_paste_mode", return_value=platform_keyboard.PasteMode.AUTO):
+                with patch("platform_keyboard._sample_focus_infos", side_effect=sample_focus_infos):
+                    self.prefetch_paste_sequence()
+                    prefetch = platform_keyboard._PASTE_SEQUENCE_PREFETCH
+                    self.assertTrue(first_scan_started.wait(1))
+                    # The injection thread resolves on its own while the prefetch is still scanning.
+                    sequence = platform_keyboard._resolve_wayland_paste_sequence()
+                    prefetch.result()
+
+        self.assertEqual(sequence, platform_keyboard._ctrl_shift_v_sequence())
+        self.assertEqual(overlaps, [1, 1])
+
+    def test_paste_prefetch_is_skipped_outside_auto_mode(self):
+        with patch("platform_keyboard._is_linux_wayland", return_value=True):
+            with patch("platform_keyboard.get_paste_mode", return_value=platform_keyboard.PasteMode.NORMAL):
+                self.prefetch_paste_sequence()
+        self.assertIsNone(platform_keyboard._PASTE_SEQUENCE_PREFETCH)
+
     def test_remote_desktop_portal_terminal_mode_uses_ctrl_shift_v(self):
         with patch("platform_keyboard.get_paste_mode", return_value=platform_keyboard.PasteMode.TERMINAL):
             self.assertEqual(
@@ -187,8 +1346,9 @@ class PlatformKeyboardTests(unittest.TestCase):
                     {},
                 ],
             ) as mock_call:
-                with patch.object(backend, "_dbus_object_path", side_effect=lambda value: f"path:{value}"):
-                    backend._ensure_started()
+                with patch.object(backend, "_has_clipboard_interface", return_value=False):
+                    with patch.object(backend, "_dbus_object_path", side_effect=lambda value: f"path:{value}"):
+                        backend._ensure_started()
 
         self.assertEqual(backend._session_handle, "/org/freedesktop/portal/desktop/session/test")
         self.assertEqual(mock_call.call_args_list[0].args[0], "CreateSession")
@@ -201,6 +1361,216 @@ class PlatformKeyboardTests(unittest.TestCase):
         from PyQt5.QtCore import QVariant
         self.assertIsInstance(select_options["types"], QVariant)
 
+    def test_remote_desktop_portal_ensure_started_requests_clipboard_before_start(self):
+        backend = platform_keyboard.RemoteDesktopPortalKeyboardBackend()
+        calls = []
+        clipboard_iface = MagicMock()
+        clipboard_iface.call.side_effect = lambda *args: calls.append(args[0]) or MagicMock(
+            errorMessage=MagicMock(return_value="")
+        )
+
+        def call_request(method_name, *args):
+            calls.append(method_name)
+            if method_name == "CreateSession":
+                return {"session_handle": "/session"}
+            if method_name == "Start":
+                return {"clipboard_enabled": True}
+            return {}
+
+        with patch.object(backend, "is_available", return_value=True):
+            with patch.object(backend, "_call_request", side_effect=call_request):
+                with patch.object(backend, "_has_clipboard_interface", return_value=True):
+                    with patch.object(backend, "_clipboard_interface", return_value=clipboard_iface):
+                        with patch.object(backend, "_dbus_object_path", side_effect=lambda value: value):
+                            with patch.object(platform_keyboard._PortalClipboardBackend, "_connect_signals"):
+                                backend._ensure_started()
+
+        self.assertEqual(calls, ["CreateSession", "SelectDevices", "RequestClipboard", "Start"])
+        self.assertTrue(backend.clipboard_enabled)
+        self.assertIsInstance(backend._clipboard, platform_keyboard._PortalClipboardBackend)
+
+    def test_remote_desktop_portal_clipboard_disabled_without_interface(self):
+        backend = platform_keyboard.RemoteDesktopPortalKeyboardBackend()
+        with patch.object(backend, "is_available", return_value=True):
+            with patch.object(
+                backend,
+                "_call_request",
+                side_effect=[{"session_handle": "/session"}, {}, {"clipboard_enabled": True}],
+            ):
+                with patch.object(backend, "_has_clipboard_interface", return_value=False):
+                    with patch.object(backend, "_dbus_object_path", side_effect=lambda value: value):
+                        backend._ensure_started()
+
+        self.assertFalse(backend.clipboard_enabled)
+
+    def test_portal_clipboard_serves_selection_transfer_from_memory(self):
+        portal = MagicMock()
+        portal._dbus_object_path.side_effect = lambda value: value
+        read_fd, write_fd = os.pipe()
+        write_reply = MagicMock()
+        write_reply.errorMessage.return_value = ""
+        write_reply.arguments.return_value = [MagicMock(fileDescriptor=MagicMock(return_value=write_fd))]
+        ok_reply = MagicMock()
+        ok_reply.errorMessage.return_value = ""
+        iface = MagicMock()
+        iface.call.side_effect = lambda method, *args: write_reply if method == "SelectionWrite" else ok_reply
+        portal._clipboard_interface.return_value = iface
+
+        with patch.object(platform_keyboard._PortalClipboardBackend, "_connect_signals"):
+            clipboard = platform_keyboard._PortalClipboardBackend(portal, "/session")
+        clipboard.copy("你好 voicing")
+        # Served, but before the paste keystroke: a clipboard manager, not the target.
+        clipboard._handle_signal("SelectionTransfer", ["/session", "text/plain;charset=utf-8", 5])
+        clipboard.expect_transfer()
+        self.assertFalse(clipboard.wait_for_transfer(0))
+        clipboard._handle_signal("SelectionTransfer", ["/other", "text/plain;charset=utf-8", 6])
+        self.assertFalse(clipboard.wait_for_transfer(0))
+        clipboard._handle_signal("SelectionTransfer", ["/session", "text/plain;charset=utf-8", 7])
+        os.close(write_fd)
+
+        with os.fdopen(read_fd, "rb") as reader:
+            self.assertEqual(reader.read().decode("utf-8"), "你好 voicing" * 2)
+        self.assertTrue(clipboard.wait_for_transfer(0))
+        self.assertEqual(iface.call.call_args.args[0], "SelectionWriteDone")
+        self.assertTrue(iface.call.call_args.args[3])
+        self.assertEqual(clipboard.paste(), "你好 voicing")
+
+    def test_portal_clipboard_reads_foreign_selection_through_fd(self):
+        portal = MagicMock()
+        portal._dbus_object_path.side_effect = lambda value: value
+        read_fd, write_fd = os.pipe()
+        os.write(write_fd, "旧内容".encode("utf-8"))
+        os.close(write_fd)
+        reply = MagicMock()
+        reply.errorMessage.return_value = ""
+        reply.arguments.return_value = [MagicMock(fileDescriptor=MagicMock(return_value=read_fd))]
+        portal._clipboard_interface.return_value.call.return_value = reply
+
+        with patch.object(platform_keyboard._PortalClipboardBackend, "_connect_signals"):
+            clipboard = platform_keyboard._PortalClipboardBackend(portal, "/session")
+        clipboard._handle_signal(
+            "SelectionOwnerChanged",
+            ["/session", {"mime_types": ["text/plain"], "session_is_owner": False}],
+        )
+        try:
+            self.assertEqual(clipboard.paste(), "旧内容")
+        finally:
+            os.close(read_fd)
+        self.assertEqual(
+            portal._clipboard_interface.return_value.call.call_args.args,
+            ("SelectionRead", "/session", "text/plain"),
+        )
+
+    def test_remote_desktop_portal_reuses_and_rotates_restore_token(self):
+        (self.data_dir / platform_keyboard.PORTAL_SESSION_FILE_NAME).write_text(
+            json.dumps({"restore_token": "old-token"}),
+            encoding="utf-8",
+        )
+        backend = platform_keyboard.RemoteDesktopPortalKeyboardBackend()
+        with patch.object(backend, "is_available", return_value=True):
+            with patch.object(
+                backend,
+                "_call_request",
+                side_effect=[{"session_handle": "/session"}, {}, {"restore_token": "new-token"}],
+            ) as mock_call:
+                with patch.object(backend, "_has_clipboard_interface", return_value=False):
+                    with patch.object(backend, "_dbus_object_path", side_effect=lambda value: value):
+                        backend._ensure_started()
+
+        select_options = mock_call.call_args_list[1].args[2]
+        self.assertEqual(select_options["restore_token"], "old-token")
+        self.assertIn("persist_mode", select_options)
+        self.assertEqual(platform_keyboard._read_portal_restore_token(), "new-token")
+
+    def test_remote_desktop_portal_falls_back_to_interactive_flow_when_token_rejected(self):
+        platform_keyboard._write_portal_restore_token("stale-token")
+        backend = platform_keyboard.RemoteDesktopPortalKeyboardBackend()
+        select_tokens = []
+
+        def call_request(method_name, *args):
+            if method_name == "CreateSession":
+                return {"session_handle": "/session"}
+            if method_name == "SelectDevices":
+                select_tokens.append(args[1].get("restore_token"))
+                if args[1].get("restore_token"):
+                    raise RuntimeError("RemoteDesktop portal SelectDevices 请求被拒绝或取消。")
+                return {}
+            return {"restore_token": "fresh-token"}
+
+        with patch.object(backend, "is_available", return_value=True):
+            with patch.object(backend, "_call_request", side_effect=call_request):
+                with patch.object(backend, "_has_clipboard_interface", return_value=False):
+                    with patch.object(backend, "_close_session") as mock_close:
+                        with patch.object(backend, "_dbus_object_path", side_effect=lambda value: value):
+                            backend._ensure_started()
+
+        self.assertEqual(select_tokens, ["stale-token", None])
+        mock_close.assert_called_once_with("/session")
+        self.assertEqual(backend._session_handle, "/session")
+        self.assertEqual(platform_keyboard._read_portal_restore_token(), "fresh-token")
+
+    def _start_portal_session(self, backend, connect_eis):
+        with patch.object(backend, "is_available", return_value=True):
+            with patch.object(
+                backend,
+                "_call_request",
+                side_effect=[{"session_handle": "/session"}, {}, {}],
+            ):
+                with patch.object(backend, "_has_clipboard_interface", return_value=False):
+                    with patch.object(backend, "_connect_eis", side_effect=connect_eis) as mock_connect:
+                        with patch.object(backend, "_dbus_object_path", side_effect=lambda value: value):
+                            backend._ensure_started()
+        return mock_connect
+
+    def test_remote_desktop_portal_eis_backend_sends_keys_over_eis(self):
+        platform_keyboard.set_wayland_keyboard_backend("eis")
+        backend = platform_keyboard.RemoteDesktopPortalKeyboardBackend()
+        eis = MagicMock()
+        mock_connect = self._start_portal_session(backend, lambda session_handle: eis)
+
+        mock_connect.assert_called_once_with("/session")
+        self.assertTrue(backend.uses_eis)
+        with patch.object(backend, "_remote_desktop_interface") as mock_iface:
+            backend._send_key_sequence(platform_keyboard._ctrl_v_sequence())
+        eis.send_key_sequence.assert_called_once_with(platform_keyboard._ctrl_v_sequence())
+        mock_iface.assert_not_called()
+
+        eis.send_key_sequence.side_effect = RuntimeError("paused")
+        with self.assertRaises(RuntimeError):
+            backend._send_key_sequence(platform_keyboard._ctrl_v_sequence())
+        eis.close.assert_called_once_with()
+        self.assertIsNone(backend._session_handle)
+
+    def test_remote_desktop_portal_eis_failure_falls_back_to_notify_keysym(self):
+        platform_keyboard.set_wayland_keyboard_backend(platform_keyboard.WaylandKeyboardBackend.EIS)
+        backend = platform_keyboard.RemoteDesktopPortalKeyboardBackend()
+        with self.assertLogs(level="WARNING"):
+            self._start_portal_session(backend, RuntimeError("未找到 libei"))
+
+        self.assertFalse(backend.uses_eis)
+        self.assertEqual(backend._session_handle, "/session")
+        backend._reset_session()
+        mock_connect = self._start_portal_session(backend, RuntimeError("unused"))
+        mock_connect.assert_not_called()
+
+    def test_remote_desktop_portal_default_backend_does_not_connect_eis(self):
+        platform_keyboard.set_wayland_keyboard_backend("portal")
+        backend = platform_keyboard.RemoteDesktopPortalKeyboardBackend()
+        mock_connect = self._start_portal_session(backend, RuntimeError("unused"))
+        mock_connect.assert_not_called()
+
+    def test_set_wayland_keyboard_backend_closes_running_session(self):
+        platform_keyboard.set_wayland_keyboard_backend("portal")
+        portal = MagicMock()
+        with patch("platform_keyboard._PORTAL_BACKEND", portal):
+            platform_keyboard.set_wayland_keyboard_backend("portal")
+            portal.close.assert_not_called()
+            self.assertEqual(
+                platform_keyboard.set_wayland_keyboard_backend("eis"),
+                platform_keyboard.WaylandKeyboardBackend.EIS,
+            )
+        portal.close.assert_called_once_with()
+
     def test_remote_desktop_portal_ensure_started_requires_keyboard_capability(self):
         backend = platform_keyboard.RemoteDesktopPortalKeyboardBackend()
         with patch.object(backend, "is_available", return_value=False):
@@ -210,17 +1580,19 @@ class PlatformKeyboardTests(unittest.TestCase):
     def test_remote_desktop_portal_send_key_sequence_uses_notify_keysym(self):
         backend = platform_keyboard.RemoteDesktopPortalKeyboardBackend()
         backend._session_handle = "/session"
-        reply = MagicMock()
-        reply.errorMessage.return_value = ""
+        pending = MagicMock()
+        pending.isError.return_value = False
         iface = MagicMock()
-        iface.call.return_value = reply
+        iface.asyncCall.return_value = pending
 
         with patch.object(backend, "_remote_desktop_interface", return_value=iface):
             with patch.object(backend, "_dbus_object_path", side_effect=lambda value: f"path:{value}"):
-                backend._send_key_sequence(((1, platform_keyboard.KEY_STATE_PRESSED),))
+                with patch("PyQt5.QtDBus.QDBusPendingReply", side_effect=lambda call: call):
+                    backend._send_key_sequence(((1, platform_keyboard.KEY_STATE_PRESSED),))
 
-        self.assertEqual(iface.call.call_count, 1)
-        call_args = iface.call.call_args.args
+        self.assertEqual(iface.asyncCall.call_count, 1)
+        pending.waitForFinished.assert_called_once_with()
+        call_args = iface.asyncCall.call_args.args
         self.assertEqual(call_args[0], "NotifyKeyboardKeysym")
         self.assertEqual(call_args[1], "path:/session")
         self.assertEqual(call_args[2], {})
@@ -233,16 +1605,53 @@ class PlatformKeyboardTests(unittest.TestCase):
     def test_remote_desktop_portal_send_key_sequence_resets_session_on_error(self):
         backend = platform_keyboard.RemoteDesktopPortalKeyboardBackend()
         backend._session_handle = "/session"
-        reply = MagicMock()
-        reply.errorMessage.return_value = "boom"
+        pending = MagicMock()
+        pending.isError.return_value = True
+        pending.error.return_value.message.return_value = "boom"
         iface = MagicMock()
-        iface.call.return_value = reply
+        iface.asyncCall.return_value = pending
 
         with patch.object(backend, "_remote_desktop_interface", return_value=iface):
             with patch.object(backend, "_dbus_object_path", side_effect=lambda value: value):
-                with self.assertRaises(RuntimeError):
-                    backend._send_key_sequence(((1, platform_keyboard.KEY_STATE_PRESSED),))
+                with patch("PyQt5.QtDBus.QDBusPendingReply", side_effect=lambda call: call):
+                    with self.assertRaises(RuntimeError):
+                        backend._send_key_sequence(((1, platform_keyboard.KEY_STATE_PRESSED),))
+
+        self.assertIsNone(backend._session_handle)
+
+    def test_remote_desktop_portal_send_key_sequence_pipelines_and_reports_failing_event(self):
+        backend = platform_keyboard.RemoteDesktopPortalKeyboardBackend()
+        backend._session_handle = "/session"
+        events = []
 
+        def async_call(method, session_path, options, keysym, state):
+            events.append(("send", keysym))
+            pending = MagicMock()
+            pending.waitForFinished.side_effect = lambda keysym=keysym: events.append(("wait", keysym))
+            pending.isError.return_value = keysym == 0x76
+            pending.error.return_value.message.return_value = "denied"
+            return pending
+
+        iface = MagicMock()
+        iface.asyncCall.side_effect = async_call
+
+        with patch.object(backend, "_remote_desktop_interface", return_value=iface):
+            with patch.object(backend, "_dbus_object_path", side_effect=lambda value: value):
+                with patch("PyQt5.QtDBus.QDBusPendingReply", side_effect=lambda call: call):
+                    with self.assertRaisesRegex(RuntimeError, "keysym=0x76, state=1.*denied"):
+                        backend._send_key_sequence(platform_keyboard._ctrl_v_sequence())
+
+        self.assertEqual(
+            events,
+            [
+                ("send", platform_keyboard.KEYSYM_CTRL_L),
+                ("send", platform_keyboard.KEYSYM_V),
+                ("send", platform_keyboard.KEYSYM_V),
+                ("send", platform_keyboard.KEYSYM_CTRL_L),
+                ("wait", platform_keyboard.KEYSYM_CTRL_L),
+                ("wait", platform_keyboard.KEYSYM_V),
+            ],
+        )
         self.assertIsNone(backend._session_handle)
 
     def test_wl_clipboard_backend_uses_wl_tools(self):
@@ -415,7 +1824,7 @@ class PlatformKeyboardTests(unittest.TestCase):
     def test_collect_focus_samples_uses_window_and_max_samples(self):
         monotonic_values = [10.0]
         monotonic_values.extend(10.01 + index * 0.01 for index in range(20))
-        probe = MagicMock(return_value={"role": "entry", "app_name": "Google Chrome"})
+        probe = MagicMock(return_value={"role": "frame", "app_name": "gnome-shell"})
         with patch("platform_keyboard.time.monotonic", side_effect=monotonic_values):
             with patch("platform_keyboard.time.sleep") as mock_sleep:
                 samples = platform_keyboard._collect_focus_samples(probe)
@@ -424,6 +1833,17 @@ class PlatformKeyboardTests(unittest.TestCase):
         self.assertEqual(probe.call_count, platform_keyboard.ATSPI_FOCUS_MAX_SAMPLES)
         self.assertEqual(mock_sleep.call_count, platform_keyboard.ATSPI_FOCUS_MAX_SAMPLES - 1)
 
+    def test_collect_focus_samples_stops_once_majority_is_decided(self):
+        normal = {"role": "entry", "app_name": "Google Chrome"}
+        terminal = {"role": "terminal", "app_name": "kitty"}
+        probe = MagicMock(side_effect=[terminal, normal, normal, normal, normal, normal, normal, normal])
+        with patch("platform_keyboard.time.sleep"):
+            samples = platform_keyboard._collect_focus_samples(probe)
+
+        # After 1 terminal + 5 normal votes, 2 remaining samples cannot flip a lead of 4.
+        self.assertEqual(len(samples), 6)
+        self.assertEqual(probe.call_count, 6)
+
     def test_is_current_focus_terminal_clears_cache_for_normal_focused_app(self):
         with patch(
             "platform_keyboard._sample_focus_infos",
@@ -531,18 +1951,310 @@ class PlatformKeyboardTests(unittest.TestCase):
                     )
         mock_find_active.assert_not_called()
 
+    def test_focused_shell_window_info_prefers_terminal_name(self):
+        windows = {
+            11: {"app-id": "firefox.desktop", "wm-class": "firefox", "has-focus": False, "title": "Docs"},
+            12: {"app-id": "", "wm-class": "kitty", "has-focus": True, "title": "~"},
+        }
+        self.assertEqual(
+            platform_keyboard._focused_shell_window_info(windows),
+            {"app_name": "kitty", "role": "frame", "name": "~"},
+        )
+        windows[12] = {"app-id": "org.gnome.TextEditor.desktop", "wm-class": "gnome-text-editor", "has-focus": True}
+        self.assertEqual(
+            platform_keyboard._focused_shell_window_info(windows)["app_name"],
+            "org.gnome.texteditor",
+        )
+        self.assertIsNone(platform_keyboard._focused_shell_window_info({11: {"has-focus": False}}))
+
+    def test_auto_paste_mode_uses_shell_window_before_sampling(self):
+        self.mock_get_shell_focus_info.return_value = {"app_name": "org.gnome.ptyxis", "role": "frame", "name": ""}
+        with patch("platform_keyboard._sample_focus_infos") as mock_sample:
+            self.assertEqual(platform_keyboard._resolve_auto_paste_mode(), platform_keyboard.PasteMode.TERMINAL)
+            self.mock_get_shell_focus_info.return_value = {"app_name": "firefox", "role": "frame", "name": ""}
+            self.assertEqual(platform_keyboard._resolve_auto_paste_mode(), platform_keyboard.PasteMode.NORMAL)
+        mock_sample.assert_not_called()
+        self.mock_probe_focus_info.assert_not_called()
+
+    def test_auto_paste_mode_samples_when_shell_window_is_unknown(self):
+        self.mock_get_shell_focus_info.return_value = None
+        with patch(
+            "platform_keyboard._sample_focus_infos",
+            return_value=[{"role": "terminal", "app_name": "code"}],
+        ) as mock_sample:
+            self.assertEqual(platform_keyboard._resolve_auto_paste_mode(), platform_keyboard.PasteMode.TERMINAL)
+        mock_sample.assert_called_once()
+
+    def test_scan_atspi_desktop_searches_active_window_first_and_prunes(self):
+        fake_atspi = MagicMock()
+        fake_atspi.StateType = FakeStateType
+        desktop = fake_desktop()
+        fake_atspi.get_desktop.return_value = desktop
+
+        self.assertEqual(
+            platform_keyboard._scan_atspi_desktop(fake_atspi),
+            {"app_name": "kitty", "role": "terminal", "name": "bash"},
+        )
+        # 2 windows checked for ACTIVE, then kitty frame, scrollback (pruned), prompt.
+        self.assertEqual(platform_keyboard._LAST_FOCUS_SCAN_NODES_VISITED, 5)
+        chrome_frame = desktop.children[0].children[0]
+        self.assertEqual(chrome_frame.children[0].state_reads, 0)
+
+    def test_find_focused_accessible_skips_hidden_subtrees_without_active_window(self):
+        fake_atspi = MagicMock()
+        fake_atspi.StateType = FakeStateType
+        desktop = fake_desktop()
+        kitty_frame = desktop.children[1].children[0]
+        kitty_frame.states = ("showing",)
+
+        scan = platform_keyboard._FocusScan()
+        focused = platform_keyboard._find_focused_accessible(fake_atspi, desktop, scan=scan)
+
+        self.assertEqual(focused.name, "bash")
+        # Hidden Chrome tabs are read once each but never descended into.
+        self.assertLess(scan.nodes_visited, 60)
+
+    def test_atspi_helper_script_matches_in_process_scan(self):
+        fake_atspi = MagicMock()
+        fake_atspi.StateType = FakeStateType
+        fake_atspi.get_desktop.return_value = fake_desktop()
+        fake_gi = MagicMock()
+        fake_repository = MagicMock(Atspi=fake_atspi)
+        namespace = {}
+        with patch.dict(sys.modules, {"gi": fake_gi, "gi.repository": fake_repository}):
+            exec(platform_keyboard._ATSPI_FOCUS_HELPER_COMMON, namespace)
+            result = namespace["scan_desktop"]()
+
+        self.assertEqual(result, {"app_name": "kitty", "role": "terminal", "name": "bash", "nodes_visited": 5})
+
+    def test_atspi_helper_script_knows_every_terminal_app(self):
+        namespace = {}
+        with patch.dict(sys.modules, {"gi": MagicMock(), "gi.repository": MagicMock()}):
+            exec(platform_keyboard._ATSPI_FOCUS_HELPER_COMMON, namespace)
+
+        self.assertEqual(namespace["TERMINAL_APP_NAMES"], platform_keyboard.TERMINAL_APP_NAMES)
+        for app_name in ("xterm", "UXTerm", "urxvt", "st-256color", "lxterminal.desktop"):
+            self.assertTrue(namespace["is_terminal"]({"app_name": app_name, "role": "frame"}), app_name)
+
+    def _running_focus_tracker(self, *events):
+        process = MagicMock()
+        process.poll.return_value = None
+        tracker = platform_keyboard._AtspiFocusTracker("/usr/bin/python3")
+        tracker._process = process
+        for event in events:
+            tracker.handle_event(event)
+        return tracker
+
+    def test_focus_tracker_answers_auto_paste_mode_without_sampling(self):
+        tracker = self._running_focus_tracker(
+            {"event": "scan", "app_name": "Firefox", "role": "entry", "name": ""},
+            {"event": "window:activate", "app_name": "gnome-terminal-server", "role": "frame", "name": "bash"},
+        )
+        self.mock_get_focus_tracker.return_value = tracker
+        with patch("platform_keyboard._sample_focus_infos") as mock_sample:
+            self.assertEqual(platform_keyboard._resolve_auto_paste_mode(), platform_keyboard.PasteMode.TERMINAL)
+            tracker.handle_event(
+                {"event": "object:state-changed:focused", "app_name": "Firefox", "role": "entry", "name": ""}
+            )
+            self.assertEqual(platform_keyboard._resolve_auto_paste_mode(), platform_keyboard.PasteMode.NORMAL)
+        mock_sample.assert_not_called()
+
+    def test_focus_tracker_falls_back_to_sampling_when_focus_is_unknown(self):
+        tracker = self._running_focus_tracker(
+            {"event": "window:activate", "app_name": "kgx", "role": "frame", "name": ""},
+            {"event": "window:deactivate", "app_name": "kgx", "role": "frame", "name": ""},
+        )
+        self.assertIsNone(tracker.current_focus_info())
+        self.mock_get_focus_tracker.return_value = tracker
+        normal = {"app_name": "Code", "role": "entry", "name": ""}
+        with patch("platform_keyboard._sample_focus_infos", return_value=[normal]) as mock_sample:
+            self.assertEqual(platform_keyboard._resolve_auto_paste_mode(), platform_keyboard.PasteMode.NORMAL)
+        mock_sample.assert_called_once_with()
+
+        tracker.handle_event({"event": "focus:", "app_name": "gnome-shell", "role": "frame", "name": ""})
+        with patch("platform_keyboard._sample_focus_infos", return_value=[normal]) as mock_sample:
+            platform_keyboard._resolve_auto_paste_mode()
+        mock_sample.assert_called_once_with()
+
+    def test_focus_tracker_ignores_info_after_helper_exits(self):
+        tracker = self._running_focus_tracker(
+            {"event": "scan", "app_name": "kitty", "role": "terminal", "name": ""},
+        )
+        self.assertEqual(tracker.current_focus_info()["app_name"], "kitty")
+        tracker._process.poll.return_value = 1
+        self.assertIsNone(tracker.current_focus_info())
+
+    def test_focus_tracker_reads_helper_event_stream(self):
+        tracker = platform_keyboard._AtspiFocusTracker(sys.executable)
+        script = (
+            "import json\n"
+            "print(json.dumps({'event': 'scan', 'app_name': 'kitty', 'role': 'terminal', 'name': ''}), flush=True)\n"
+            "import time; time.sleep(5)\n"
+        )
+        with patch("platform_keyboard._ATSPI_FOCUS_EVENT_HELPER", script):
+            self.assertTrue(tracker.start())
+        self.addCleanup(tracker.stop)
+        deadline = time.monotonic() + 5
+        while tracker.current_focus_info() is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(tracker.current_focus_info()["role"], "terminal")
+        tracker.stop()
+        self.assertFalse(tracker.is_running())
+
+    def test_paste_mode_cache_skips_sampling_for_confirmed_identity(self):
+        terminal = {"app_name": "org.gnome.Ptyxis.desktop", "role": "terminal", "name": ""}
+        self.mock_probe_focus_info.return_value = terminal
+        with patch("platform_keyboard._sample_focus_infos", return_value=[terminal, terminal]) as mock_sample:
+            for _ in range(3):
+                self.assertEqual(platform_keyboard._resolve_auto_paste_mode(), platform_keyboard.PasteMode.TERMINAL)
+        mock_sample.assert_called_once_with()
+        stats = platform_keyboard.get_paste_mode_cache_stats()
+        self.assertEqual((stats.hits, stats.misses, stats.size), (2, 1, 1))
+
+    def test_paste_mode_cache_ignores_probe_that_disagrees_with_vote(self):
+        normal = {"app_name": "Code", "role": "entry", "name": ""}
+        terminal = {"app_name": "kitty", "role": "terminal", "name": ""}
+        self.mock_probe_focus_info.return_value = normal
+        with patch("platform_keyboard._sample_focus_infos", return_value=[terminal, terminal, normal]) as mock_sample:
+            self.assertEqual(platform_keyboard._resolve_auto_paste_mode(), platform_keyboard.PasteMode.TERMINAL)
+            self.assertEqual(platform_keyboard._resolve_auto_paste_mode(), platform_keyboard.PasteMode.TERMINAL)
+        self.assertEqual(mock_sample.call_count, 2)
+        self.assertEqual(platform_keyboard.get_paste_mode_cache_stats().size, 0)
+
+    def test_paste_mode_cache_does_not_key_uncertain_focus(self):
+        self.mock_probe_focus_info.return_value = {"app_name": "gnome-shell", "role": "frame", "name": ""}
+        normal = {"app_name": "Code", "role": "entry", "name": ""}
+        with patch("platform_keyboard._sample_focus_infos", return_value=[normal]) as mock_sample:
+            platform_keyboard._resolve_auto_paste_mode()
+            platform_keyboard._resolve_auto_paste_mode()
+        self.assertEqual(mock_sample.call_count, 2)
+        self.assertEqual(platform_keyboard.get_paste_mode_cache_stats().size, 0)
+
+    def test_paste_mode_cache_expires_and_evicts_least_recent(self):
+        cache = platform_keyboard._PasteModeCache(ttl_sec=10, max_entries=2)
+        with patch("platform_keyboard.time.monotonic", return_value=100.0):
+            cache.put(("kitty", "terminal"), platform_keyboard.PasteMode.TERMINAL)
+            cache.put(("code", "entry"), platform_keyboard.PasteMode.NORMAL)
+            self.assertEqual(cache.get(("kitty", "terminal")), platform_keyboard.PasteMode.TERMINAL)
+            cache.put(("firefox", "entry"), platform_keyboard.PasteMode.NORMAL)
+            self.assertIsNone(cache.get(("code", "entry")))
+        with patch("platform_keyboard.time.monotonic", return_value=111.0):
+            self.assertIsNone(cache.get(("kitty", "terminal")))
+        self.assertEqual(cache.stats(), platform_keyboard.PasteModeCacheStats(1, 2, 0, 1))
+
+    def test_focus_tracker_window_deactivate_invalidates_cached_app(self):
+        platform_keyboard._PASTE_MODE_CACHE.put(("kgx", "terminal"), platform_keyboard.PasteMode.TERMINAL)
+        platform_keyboard._PASTE_MODE_CACHE.put(("code", "entry"), platform_keyboard.PasteMode.NORMAL)
+        tracker = self._running_focus_tracker(
+            {"event": "window:deactivate", "app_name": "kgx", "role": "frame", "name": ""},
+        )
+        self.assertIsNone(tracker.current_focus_info())
+        stats = platform_keyboard.get_paste_mode_cache_stats()
+        self.assertEqual((stats.invalidations, stats.size), (1, 1))
+
+    FAKE_ATSPI_SERVICE = (
+        "import json, sys, time\n"
+        "scans = 0\n"
+        "for line in sys.stdin:\n"
+        "    request = json.loads(line)\n"
+        "    scans += 1\n"
+        "    if scans == int(sys.argv[1] if len(sys.argv) > 1 else 0):\n"
+        "        time.sleep(5)\n"
+        "    result = {'app_name': 'kitty', 'role': 'terminal', 'name': str(scans)}\n"
+        "    print(json.dumps({'id': request['id'], 'result': result}), flush=True)\n"
+    )
+
+    def _fake_helper(self, timeout_sec=2.0):
+        helper = platform_keyboard._AtspiHelperProcess(sys.executable, timeout_sec=timeout_sec)
+        self.addCleanup(helper.stop)
+        return helper
+
+    def test_atspi_helper_process_answers_scans_from_one_process(self):
+        helper = self._fake_helper()
+        with patch("platform_keyboard._ATSPI_FOCUS_SERVICE_HELPER", self.FAKE_ATSPI_SERVICE):
+            self.assertTrue(helper.ensure_running())
+            pid = helper._process.pid
+            first = helper.scan()
+            second = helper.scan()
+            self.assertTrue(helper.ensure_running())
+
+        self.assertEqual(first, {"app_name": "kitty", "role": "terminal", "name": "1"})
+        self.assertEqual(second["name"], "2")
+        self.assertEqual(helper._process.pid, pid)
+        self.assertEqual(helper.restarts, 0)
+
+    def test_atspi_helper_process_timeout_kills_and_restarts(self):
+        helper = self._fake_helper(timeout_sec=0.2)
+        hang_on_first_scan = self.FAKE_ATSPI_SERVICE.replace("sys.argv[1] if len(sys.argv) > 1 else 0", "1")
+        with patch("platform_keyboard._ATSPI_FOCUS_SERVICE_HELPER", hang_on_first_scan):
+            self.assertTrue(helper.ensure_running())
+            with self.assertRaises(TimeoutError):
+                helper.scan()
+            self.assertFalse(helper.is_running())
+            with self.assertRaises(RuntimeError):
+                helper.scan()
+
+            self.assertFalse(helper.ensure_running())
+            helper._started_at -= platform_keyboard.ATSPI_HELPER_MIN_RESTART_INTERVAL_SEC
+            with patch("platform_keyboard._ATSPI_FOCUS_SERVICE_HELPER", self.FAKE_ATSPI_SERVICE):
+                self.assertTrue(helper.ensure_running())
+                self.assertEqual(helper.scan()["name"], "1")
+        self.assertEqual(helper.restarts, 1)
+
+    def test_atspi_helper_process_reports_crash(self):
+        helper = self._fake_helper()
+        with patch("platform_keyboard._ATSPI_FOCUS_SERVICE_HELPER", "import sys; sys.stdin.readline()"):
+            self.assertTrue(helper.ensure_running())
+            with self.assertRaisesRegex(RuntimeError, "已退出"):
+                helper.scan()
+        self.assertFalse(helper.is_running())
+
+    def test_sample_focus_infos_prefers_persistent_helper_over_one_shot(self):
+        helper = MagicMock()
+        helper.scan.return_value = {"app_name": "kitty", "role": "terminal", "name": ""}
+        helper.is_running.return_value = True
+        with patch("platform_keyboard._sample_focus_infos_in_process", return_value=[]):
+            with patch("platform_keyboard._get_atspi_helper", return_value=helper):
+                with patch("platform_keyboard._sample_focus_infos_from_system_python") as mock_one_shot:
+                    with patch("platform_keyboard.ATSPI_FOCUS_MAX_SAMPLES", 3):
+                        with patch("platform_keyboard.ATSPI_FOCUS_SAMPLE_INTERVAL_SEC", 0):
+                            samples = platform_keyboard._sample_focus_infos()
+        self.assertEqual(len(samples), 2)
+        mock_one_shot.assert_not_called()
+
+    def test_sample_focus_infos_falls_back_to_one_shot_when_helper_dies(self):
+        helper = MagicMock()
+        helper.scan.side_effect = TimeoutError("timeout")
+        helper.is_running.return_value = False
+        one_shot = [{"app_name": "Code", "role": "entry", "name": ""}]
+        with patch("platform_keyboard._sample_focus_infos_in_process", return_value=[]):
+            with patch("platform_keyboard._get_atspi_helper", return_value=helper):
+                with patch("platform_keyboard._sample_focus_infos_from_system_python", return_value=one_shot):
+                    self.assertEqual(platform_keyboard._sample_focus_infos(), one_shot)
+
+    def test_get_clipboard_backend_prefers_portal_clipboard_on_wayland(self):
+        portal_clipboard = MagicMock()
+        with patch("platform_keyboard._is_linux_wayland", return_value=True):
+            with patch("platform_keyboard._get_portal_clipboard_backend", return_value=portal_clipboard):
+                self.assertIs(platform_keyboard._get_clipboard_backend(), portal_clipboard)
+
     def test_get_clipboard_backend_prefers_wl_tools_on_wayland(self):
         with patch("platform_keyboard._is_linux_wayland", return_value=True):
-            with patch("platform_keyboard.shutil.which", side_effect=lambda command: f"/usr/bin/{command}"):
-                self.assertIsInstance(platform_keyboard._get_clipboard_backend(), platform_keyboard._WlClipboardBackend)
+            with patch("platform_keyboard._get_portal_clipboard_backend", return_value=None):
+                with patch("platform_keyboard.shutil.which", side_effect=lambda command: f"/usr/bin/{command}"):
+                    self.assertIsInstance(
+                        platform_keyboard._get_clipboard_backend(),
+                        platform_keyboard._WlClipboardBackend,
+                    )
 
     def test_get_clipboard_backend_falls_back_to_pyperclip(self):
         with patch("platform_keyboard._is_linux_wayland", return_value=True):
-            with patch("platform_keyboard.shutil.which", return_value=None):
-                self.assertIsInstance(
-                    platform_keyboard._get_clipboard_backend(),
-                    platform_keyboard._PyperclipClipboardBackend,
-                )
+            with patch("platform_keyboard._get_portal_clipboard_backend", return_value=None):
+                with patch("platform_keyboard.shutil.which", return_value=None):
+                    self.assertIsInstance(
+                        platform_keyboard._get_clipboard_backend(),
+                        platform_keyboard._PyperclipClipboardBackend,
+                    )
 
     def test_press_enter_windows_prefers_sendinput(self):
         with patch("platform_keyboard.ensure_runtime_supported"):
@@ -572,5 +2284,287 @@ class PlatformKeyboardTests(unittest.TestCase):
         backend.press.assert_called_once_with("enter")
 
 
+FAKE_GNOME_SHELL_INTROSPECT = r"""
+import sys
+from PyQt5.QtCore import QCoreApplication, QMetaType, QObject, QSocketNotifier, Q_CLASSINFO, pyqtSlot
+from PyQt5.QtDBus import QDBusAbstractAdaptor, QDBusArgument, QDBusConnection, QDBusMessage
+
+app = QCoreApplication([])
+bus = QDBusConnection.sessionBus()
+state = {"focus": 1, "deny": False, "calls": 0}
+windows = {1: ("kitty.desktop", "kitty"), 2: ("firefox.desktop", "firefox")}
+
+
+class Adaptor(QDBusAbstractAdaptor):
+    Q_CLASSINFO("D-Bus Interface", "org.gnome.Shell.Introspect")
+    Q_CLASSINFO(
+        "D-Bus Introspection",
+        '<interface name="org.gnome.Shell.Introspect">'
+        '<method name="GetWindows"><arg direction="out" type="a{ta{sv}}" name="windows"/></method>'
+        '<signal name="WindowsChanged"/>'
+        '<signal name="RunningApplicationsChanged"/>'
+        "</interface>",
+    )
+
+    @pyqtSlot(QDBusMessage)
+    def GetWindows(self, message):
+        state["calls"] += 1
+        message.setDelayedReply(True)
+        if state["deny"]:
+            bus.send(message.createErrorReply("org.freedesktop.DBus.Error.AccessDenied", "not allowed"))
+            return
+        argument = QDBusArgument()
+        argument.beginMap(QMetaType.ULongLong, QMetaType.QVariantMap)
+        for window_id, (app_id, wm_class) in windows.items():
+            argument.beginMapEntry()
+            argument.add(window_id, QMetaType.ULongLong)
+            argument.add({"app-id": app_id, "wm-class": wm_class, "has-focus": window_id == state["focus"]})
+            argument.endMapEntry()
+        argument.endMap()
+        bus.send(message.createReply([argument]))
+
+
+def on_command():
+    command = sys.stdin.readline().split()
+    if not command:
+        app.quit()
+    elif command[0] == "focus":
+        state["focus"] = int(command[1])
+        bus.send(QDBusMessage.createSignal(
+            "/org/gnome/Shell/Introspect", "org.gnome.Shell.Introspect", "RunningApplicationsChanged"
+        ))
+    elif command[0] == "deny":
+        state["deny"] = True
+        bus.send(QDBusMessage.createSignal("/org/gnome/Shell/Introspect", "org.gnome.Shell.Introspect", "WindowsChanged"))
+    elif command[0] == "calls":
+        print(state["calls"], flush=True)
+
+
+root = QObject()
+Adaptor(root)
+bus.registerObject("/org/gnome/Shell/Introspect", root)
+bus.registerService("org.gnome.Shell.Introspect")
+notifier = QSocketNotifier(sys.stdin.fileno(), QSocketNotifier.Read)
+notifier.activated.connect(on_command)
+print("ready", flush=True)
+app.exec()
+"""
+
+
+@unittest.skipUnless(shutil.which("dbus-daemon"), "dbus-daemon is not installed")
+class GnomeShellWindowIntrospectorTests(unittest.TestCase):
+    def setUp(self):
+        from PyQt5.QtDBus import QDBusConnection
+        from PyQt5.QtWidgets import QApplication
+
+        self.app = QApplication.instance() or QApplication([])
+        self.daemon = subprocess.Popen(
+            ["dbus-daemon", "--session", "--nofork", "--print-address"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+        )
+        self.addCleanup(self._stop, self.daemon)
+        address = self.daemon.stdout.readline().strip()
+        self.service = subprocess.Popen(
+            [sys.executable, "-c", FAKE_GNOME_SHELL_INTROSPECT],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            env={**os.environ, "DBUS_SESSION_BUS_ADDRESS": address, "QT_QPA_PLATFORM": "offscreen"},
+        )
+        self.addCleanup(self._stop, self.service)
+        self.assertEqual(self.service.stdout.readline().strip(), "ready")
+        connection_name = f"voicing-test-{id(self)}"
+        self.bus = QDBusConnection.connectToBus(address, connection_name)
+        self.addCleanup(QDBusConnection.disconnectFromBus, connection_name)
+        self.introspector = platform_keyboard._GnomeShellWindowIntrospector(self.bus)
+        self.addCleanup(self.introspector.close)
+
+    def _stop(self, process):
+        for stream in (process.stdin, process.stdout):
+            if stream is not None:
+                stream.close()
+        process.terminate()
+        process.wait(5)
+
+    def command(self, line):
+        self.service.stdin.write(line + "\n")
+        self.service.stdin.flush()
+
+    def service_calls(self):
+        self.command("calls")
+        return int(self.service.stdout.readline())
+
+    def wait_for_invalidation(self, generation):
+        deadline = time.monotonic() + 5
+        while self.introspector._generation == generation and time.monotonic() < deadline:
+            self.app.processEvents()
+            time.sleep(0.01)
+
+    def test_caches_focused_window_until_shell_reports_a_change(self):
+        self.assertEqual(self.introspector.focused_window_info()["app_name"], "kitty")
+        self.assertEqual(self.introspector.focused_window_info()["app_name"], "kitty")
+        self.assertEqual(self.service_calls(), 1)
+
+        generation = self.introspector._generation
+        self.command("focus 2")
+        self.wait_for_invalidation(generation)
+
+        self.assertEqual(self.introspector.focused_window_info()["app_name"], "firefox")
+        self.assertEqual(self.service_calls(), 2)
+
+    def test_access_denied_disables_introspection(self):
+        generation = self.introspector._generation
+        self.introspector.focused_window_info()
+        self.command("deny")
+        self.wait_for_invalidation(generation)
+
+        self.assertIsNone(self.introspector.focused_window_info())
+        self.assertTrue(self.introspector.disabled)
+        self.assertIsNone(self.introspector.focused_window_info())
+        self.assertEqual(self.service_calls(), 2)
+
+
+class QtClipboardBackendTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        from PyQt5.QtWidgets import QApplication
+
+        cls.app = QApplication.instance() or QApplication([])
+
+    def setUp(self):
+        self.clipboard = platform_keyboard._get_qt_clipboard_backend()
+        self.assertIsNotNone(self.clipboard)
+
+    def test_copies_and_pastes_on_the_gui_thread(self):
+        self.clipboard.copy("你好 voicing")
+        self.assertEqual(self.clipboard.paste(), "你好 voicing")
+        self.assertEqual(self.app.clipboard().text(), "你好 voicing")
+
+    def test_worker_thread_calls_return_synchronously(self):
+        results = []
+
+        def worker():
+            self.clipboard.copy("from worker")
+            results.append(self.clipboard.paste())
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        deadline = time.monotonic() + 5
+        while thread.is_alive() and time.monotonic() < deadline:
+            self.app.processEvents()
+        thread.join(1)
+
+        self.assertEqual(results, ["from worker"])
+        self.assertEqual(self.app.clipboard().text(), "from worker")
+
+
+@unittest.skipUnless(shutil.which("Xvfb"), "Xvfb is not installed")
+class X11XvfbTests(unittest.TestCase):
+    def setUp(self):
+        from Xlib import display
+
+        read_fd, write_fd = os.pipe()
+        self.server = subprocess.Popen(
+            ["Xvfb", "-displayfd", str(write_fd), "-nolisten", "tcp"],
+            pass_fds=(write_fd,),
+            stderr=subprocess.DEVNULL,
+        )
+        os.close(write_fd)
+        with os.fdopen(read_fd) as reader:
+            self.display_name = f":{reader.readline().strip()}"
+        self.addCleanup(self.server.wait, 5)
+        self.addCleanup(self.server.terminate)
+        self.display = display.Display(self.display_name)
+        self.addCleanup(self.display.close)
+
+    def make_window(self, wm_class):
+        root = self.display.screen().root
+        window = root.create_window(0, 0, 10, 10, 0, self.display.screen().root_depth)
+        window.set_wm_class(*wm_class)
+        return window
+
+    def activate(self, window_id):
+        from Xlib import X, Xatom
+
+        root = self.display.screen().root
+        root.change_property(
+            self.display.intern_atom("_NET_ACTIVE_WINDOW"),
+            Xatom.WINDOW,
+            32,
+            [window_id],
+            X.PropModeReplace,
+        )
+        self.display.sync()
+
+    def test_xtest_backend_sends_keys_to_the_server(self):
+        backend = platform_keyboard.XTestKeyboardBackend.connect(self.display_name)
+        self.addCleanup(backend.close)
+        with patch("platform_keyboard.get_paste_mode", return_value=platform_keyboard.PasteMode.COMPAT):
+            backend.paste_from_clipboard()
+        backend._send_key_sequence(((platform_keyboard.KEYSYM_CTRL_L, platform_keyboard.KEY_STATE_PRESSED),))
+        backend._display.sync()
+
+        keycode = self.display.keysym_to_keycode(platform_keyboard.KEYSYM_CTRL_L)
+        self.assertTrue(self.display.query_keymap()[keycode // 8] & (1 << (keycode % 8)))
+        backend._send_key_sequence(((platform_keyboard.KEYSYM_CTRL_L, platform_keyboard.KEY_STATE_RELEASED),))
+
+    def test_xtest_backend_types_text_through_spare_keycodes(self):
+        backend = platform_keyboard.XTestKeyboardBackend.connect(self.display_name)
+        self.addCleanup(backend.close)
+        info = self.display.display.info
+        before = self.display.get_keyboard_mapping(info.min_keycode, info.max_keycode - info.min_keycode + 1)
+
+        backend.type_text("中a")
+
+        # The spare keycodes are emptied again as soon as the call returns.
+        after = self.display.get_keyboard_mapping(info.min_keycode, info.max_keycode - info.min_keycode + 1)
+        self.assertFalse(any(0x01004E2D in row for row in after))
+        self.assertEqual([list(row) for row in after], [list(row) for row in before])
+
+    def test_x11_clipboard_reports_when_another_client_fetches_it(self):
+        from Xlib import X
+
+        clipboard = platform_keyboard._X11ClipboardBackend.connect(self.display_name)
+        self.addCleanup(clipboard.close)
+        clipboard.copy("你好 voicing")
+        clipboard.expect_transfer()
+
+        reader = self.display.screen().root.create_window(0, 0, 1, 1, 0, X.CopyFromParent)
+        prop = self.display.intern_atom("VOICING_TEST")
+        reader.convert_selection(
+            self.display.intern_atom("CLIPBOARD"),
+            self.display.intern_atom("UTF8_STRING"),
+            prop,
+            X.CurrentTime,
+        )
+        self.display.flush()
+        while self.display.next_event().type != X.SelectionNotify:
+            pass
+
+        self.assertTrue(clipboard.wait_for_transfer(1))
+        value = reader.get_full_property(prop, X.AnyPropertyType).value
+        self.assertEqual(bytes(value).decode("utf-8"), "你好 voicing")
+
+    def test_classifies_active_window_from_wm_class(self):
+        terminal = self.make_window(("kitty", "kitty"))
+        browser = self.make_window(("Navigator", "firefox"))
+        classifier = platform_keyboard._X11FocusClassifier.connect(self.display_name)
+        self.addCleanup(classifier.close)
+
+        self.activate(terminal.id)
+        self.assertEqual(classifier.classify(), platform_keyboard._FocusKind.TERMINAL)
+        self.activate(browser.id)
+        self.assertEqual(classifier.classify(), platform_keyboard._FocusKind.NORMAL)
+        self.activate(0)
+        self.assertEqual(classifier.classify(), platform_keyboard._FocusKind.UNCERTAIN)
+
+        browser.destroy()
+        self.activate(browser.id)
+        self.assertEqual(classifier.classify(), platform_keyboard._FocusKind.UNCERTAIN)
+
+
 if __name__ == "__main__":
     unittest.main()
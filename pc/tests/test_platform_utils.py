@@ -10,6 +10,10 @@ import platform_utils
 
 
 class PlatformUtilsTests(unittest.TestCase):
+    def setUp(self):
+        platform_utils.invalidate_capability()
+        self.addCleanup(platform_utils.invalidate_capability)
+
     def test_get_platform_returns_supported_value(self):
         self.assertIn(platform_utils.get_platform(), {"windows", "darwin", "linux"})
 
@@ -123,6 +127,44 @@ class PlatformUtilsTests(unittest.TestCase):
                     env = platform_utils.system_subprocess_env()
         self.assertNotIn("LD_LIBRARY_PATH", env)
 
+    def test_wayland_runtime_check_probes_portal_once(self):
+        with patch.object(platform_utils.sys, "platform", "linux"):
+            with patch.dict(os.environ, {"XDG_SESSION_TYPE": "wayland"}, clear=False):
+                with patch("platform_utils.has_remote_desktop_keyboard_portal", return_value=True) as mock_probe:
+                    for _ in range(3):
+                        platform_utils.ensure_runtime_supported()
+                    self.assertEqual(mock_probe.call_count, 1)
+
+                    platform_utils.invalidate_capability(platform_utils.CAPABILITY_REMOTE_DESKTOP_KEYBOARD)
+                    platform_utils.ensure_runtime_supported()
+                    self.assertEqual(mock_probe.call_count, 2)
+
+    def test_capabilities_are_reprobed_when_session_changes(self):
+        probe = MagicMock(side_effect=["/usr/bin/wl-copy", None])
+        with patch.dict(os.environ, {"WAYLAND_DISPLAY": "wayland-0"}, clear=False):
+            self.assertEqual(platform_utils.get_capability("which:wl-copy", probe), "/usr/bin/wl-copy")
+            self.assertEqual(platform_utils.get_capability("which:wl-copy", probe), "/usr/bin/wl-copy")
+        with patch.dict(os.environ, {"WAYLAND_DISPLAY": "wayland-1"}, clear=False):
+            self.assertIsNone(platform_utils.get_capability("which:wl-copy", probe))
+        self.assertEqual(probe.call_count, 2)
+
+    def test_failed_capability_probe_is_not_cached(self):
+        probe = MagicMock(side_effect=[RuntimeError("bus down"), True])
+        with self.assertRaises(RuntimeError):
+            platform_utils.get_capability("probe", probe)
+        self.assertTrue(platform_utils.get_capability("probe", probe))
+
+    def test_capability_report_lists_probed_capabilities(self):
+        with patch("platform_utils.shutil.which", return_value="/usr/bin/gdbus"):
+            platform_utils.which_cached("gdbus")
+        with patch.object(platform_utils.sys, "platform", "linux"):
+            with patch("platform_utils.shutil.which", return_value=None):
+                report = platform_utils.probe_runtime_capabilities()
+        self.assertEqual(report["which:gdbus"], "/usr/bin/gdbus")
+        self.assertIsNone(report["which:wl-copy"])
+        self.assertIn("session", report)
+        self.assertIn("which:gdbus=/usr/bin/gdbus", platform_utils.format_capability_report())
+
     def test_known_hotspot_prefixes_cover_all_platforms(self):
         self.assertEqual(
             platform_utils.get_known_hotspot_prefixes(),
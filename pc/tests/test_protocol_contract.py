@@ -83,6 +83,12 @@ class ProtocolContractTests(unittest.TestCase):
             with self.subTest(message_type=message_type):
                 self.assertEqual(set(sample.keys()), set(server_messages[message_type]))
 
+        self.assertTrue(samples["connected"]["injection_ready"])
+        self.assertFalse(
+            build_connected_message(sync_enabled=True, computer_name="DESKTOP", injection_ready=False)[
+                "injection_ready"
+            ]
+        )
         self.assertTrue(build_ack_message()["clear_input"])
         self.assertFalse(build_ack_message(clear_input=False)["clear_input"])
 
@@ -2,13 +2,15 @@ import asyncio
 import json
 import sys
 import unittest
+from concurrent.futures import Future
 from pathlib import Path
 from unittest.mock import patch
 
 sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
 
 import voice_coding
-from voicing_protocol import TYPE_TEXT, TEXT_SEND_MODE_COMMIT, TEXT_SEND_MODE_SUBMIT
+from injection_worker import InjectionWorker
+from voicing_protocol import TYPE_TEXT, TEXT_SEND_MODE_COMMIT, TEXT_SEND_MODE_SHADOW, TEXT_SEND_MODE_SUBMIT
 
 
 class FakeWebSocket:
@@ -126,6 +128,198 @@ class HandleClientTests(unittest.TestCase):
         self.assertEqual(websocket.sent[-1]["type"], "ack")
         self.assertFalse(websocket.sent[-1]["clear_input"])
 
+    def test_failed_batch_is_logged_and_later_frames_still_get_acks(self):
+        messages = [
+            json.dumps({"type": TYPE_TEXT, "content": "a", "send_mode": TEXT_SEND_MODE_SUBMIT}),
+            json.dumps({"type": TYPE_TEXT, "content": "", "send_mode": TEXT_SEND_MODE_COMMIT, "auto_enter": True}),
+        ]
+        websocket = FakeWebSocket(messages)
+        old_sync_enabled = voice_coding.state.sync_enabled
+        old_clients = set(voice_coding.state.connected_clients)
+        try:
+            voice_coding.state.sync_enabled = True
+            voice_coding.state.connected_clients.clear()
+            with (
+                patch("voice_coding.type_text", side_effect=RuntimeError("backend gone")),
+                patch("voice_coding.press_enter_after_settle", return_value=True),
+                patch("voice_coding.get_or_create_device_identity") as identity,
+            ):
+                identity.return_value.name = "PC"
+                identity.return_value.device_id = "device"
+                identity.return_value.os = "linux"
+                with self.assertLogs(level="ERROR") as logs:
+                    asyncio.run(voice_coding.handle_client(websocket))
+        finally:
+            voice_coding.state.sync_enabled = old_sync_enabled
+            voice_coding.state.connected_clients.clear()
+            voice_coding.state.connected_clients.update(old_clients)
+
+        self.assertIn("backend gone", "\n".join(logs.output))
+        acks = [message for message in websocket.sent if message["type"] == "ack"]
+        self.assertEqual([ack["clear_input"] for ack in acks], [False, True])
+
+    def test_pending_shadow_frames_are_merged_into_one_paste(self):
+        messages = [
+            json.dumps({"type": TYPE_TEXT, "content": "a", "send_mode": TEXT_SEND_MODE_SHADOW, "auto_enter": False}),
+            json.dumps({"type": TYPE_TEXT, "content": "b", "send_mode": TEXT_SEND_MODE_SHADOW, "auto_enter": False}),
+            json.dumps({"type": TYPE_TEXT, "content": "c", "send_mode": TEXT_SEND_MODE_SUBMIT, "auto_enter": True}),
+            json.dumps({"type": TYPE_TEXT, "content": "", "send_mode": TEXT_SEND_MODE_COMMIT, "auto_enter": False}),
+        ]
+        websocket = FakeWebSocket(messages)
+        old_sync_enabled = voice_coding.state.sync_enabled
+        old_clients = set(voice_coding.state.connected_clients)
+        try:
+            voice_coding.state.sync_enabled = True
+            voice_coding.state.connected_clients.clear()
+            with (
+                patch("voice_coding.type_text", return_value=True) as mock_type,
+                patch("voice_coding.press_enter_after_settle") as mock_enter,
+                patch("voice_coding.prefetch_paste_sequence") as mock_prefetch,
+                patch("voice_coding.get_or_create_device_identity") as identity,
+            ):
+                identity.return_value.name = "PC"
+                identity.return_value.device_id = "device"
+                identity.return_value.os = "linux"
+                asyncio.run(voice_coding.handle_client(websocket))
+        finally:
+            voice_coding.state.sync_enabled = old_sync_enabled
+            voice_coding.state.connected_clients.clear()
+            voice_coding.state.connected_clients.update(old_clients)
+
+        mock_prefetch.assert_called_once_with()
+        mock_type.assert_called_once_with("abc", True)
+        mock_enter.assert_not_called()
+        acks = [message for message in websocket.sent if message["type"] == "ack"]
+        self.assertEqual([ack["clear_input"] for ack in acks], [False, False, True, False])
+
+    def test_shadow_frames_then_auto_enter_commit_waits_on_last_paste(self):
+        messages = [
+            json.dumps({"type": TYPE_TEXT, "content": "a", "send_mode": TEXT_SEND_MODE_SHADOW}),
+            json.dumps({"type": TYPE_TEXT, "content": "b", "send_mode": TEXT_SEND_MODE_SHADOW}),
+            json.dumps({"type": TYPE_TEXT, "content": "", "send_mode": TEXT_SEND_MODE_COMMIT, "auto_enter": True}),
+        ]
+        websocket = FakeWebSocket(messages)
+        calls = []
+        old_sync_enabled = voice_coding.state.sync_enabled
+        old_clients = set(voice_coding.state.connected_clients)
+        try:
+            voice_coding.state.sync_enabled = True
+            voice_coding.state.connected_clients.clear()
+            with (
+                patch("voice_coding.type_text_at_cursor", side_effect=lambda text, **kwargs: calls.append(text)),
+                patch(
+                    "voice_coding.press_enter_after_paste",
+                    side_effect=lambda delay_sec: calls.append(("enter", delay_sec)),
+                ),
+                patch("voice_coding.prefetch_paste_sequence"),
+                patch("voice_coding.get_or_create_device_identity") as identity,
+            ):
+                identity.return_value.name = "PC"
+                identity.return_value.device_id = "device"
+                identity.return_value.os = "linux"
+                asyncio.run(voice_coding.handle_client(websocket))
+        finally:
+            voice_coding.state.sync_enabled = old_sync_enabled
+            voice_coding.state.connected_clients.clear()
+            voice_coding.state.connected_clients.update(old_clients)
+
+        self.assertEqual(calls[-1], ("enter", voice_coding.AUTO_ENTER_SETTLE_DELAY_SEC))
+        self.assertEqual("".join(call for call in calls[:-1]), "ab")
+        self.assertTrue(websocket.sent[-1]["clear_input"])
+
+    def test_first_shadow_frame_of_each_utterance_prefetches_paste_keys(self):
+        messages = [
+            json.dumps({"type": TYPE_TEXT, "content": "", "send_mode": TEXT_SEND_MODE_SHADOW}),
+            json.dumps({"type": TYPE_TEXT, "content": "a", "send_mode": TEXT_SEND_MODE_SHADOW}),
+            json.dumps({"type": TYPE_TEXT, "content": "b", "send_mode": TEXT_SEND_MODE_SHADOW}),
+            json.dumps({"type": TYPE_TEXT, "content": "", "send_mode": TEXT_SEND_MODE_COMMIT}),
+            json.dumps({"type": TYPE_TEXT, "content": "c", "send_mode": TEXT_SEND_MODE_SHADOW}),
+        ]
+        websocket = FakeWebSocket(messages)
+        old_sync_enabled = voice_coding.state.sync_enabled
+        old_clients = set(voice_coding.state.connected_clients)
+        try:
+            voice_coding.state.sync_enabled = True
+            voice_coding.state.connected_clients.clear()
+            with (
+                patch("voice_coding.type_text", return_value=True),
+                patch("voice_coding.press_enter_after_settle"),
+                patch("voice_coding.prefetch_paste_sequence") as mock_prefetch,
+                patch("voice_coding.get_or_create_device_identity") as identity,
+            ):
+                identity.return_value.name = "PC"
+                identity.return_value.device_id = "device"
+                identity.return_value.os = "linux"
+                asyncio.run(voice_coding.handle_client(websocket))
+        finally:
+            voice_coding.state.sync_enabled = old_sync_enabled
+            voice_coding.state.connected_clients.clear()
+            voice_coding.state.connected_clients.update(old_clients)
+
+        self.assertEqual(mock_prefetch.call_count, 2)
+
+    def test_connected_handshake_reports_injection_readiness(self):
+        old_ready = voice_coding.state.injection_ready
+        old_clients = set(voice_coding.state.connected_clients)
+        try:
+            for ready in (False, True):
+                voice_coding.state.injection_ready = ready
+                websocket = FakeWebSocket([])
+                with patch("voice_coding.get_or_create_device_identity") as identity:
+                    identity.return_value.name = "PC"
+                    identity.return_value.device_id = "device"
+                    identity.return_value.os = "linux"
+                    asyncio.run(voice_coding.handle_client(websocket))
+                self.assertEqual(websocket.sent[0]["type"], "connected")
+                self.assertIs(websocket.sent[0]["injection_ready"], ready)
+        finally:
+            voice_coding.state.injection_ready = old_ready
+            voice_coding.state.connected_clients.clear()
+            voice_coding.state.connected_clients.update(old_clients)
+
+
+class InjectionWarmupTests(unittest.TestCase):
+    def setUp(self):
+        old_ready = voice_coding.state.injection_ready
+        old_timings = voice_coding.state.warmup_timings
+        old_failed = voice_coding.state.injection_failed
+        self.addCleanup(setattr, voice_coding.state, "injection_ready", old_ready)
+        self.addCleanup(setattr, voice_coding.state, "warmup_timings", old_timings)
+        self.addCleanup(setattr, voice_coding.state, "injection_failed", old_failed)
+        voice_coding.state.injection_ready = False
+        voice_coding.state.injection_failed = False
+
+    def test_warmup_runs_on_injection_thread_and_sets_ready(self):
+        worker = InjectionWorker()
+        self.addCleanup(worker.stop)
+        ran_on_worker = []
+
+        def fake_warm_up():
+            ran_on_worker.append(worker.is_worker_thread())
+            return {"clipboard": 0.002}
+
+        with (
+            patch.object(voice_coding.state, "injection_worker", worker),
+            patch("voice_coding.warm_up_injection_stack", side_effect=fake_warm_up),
+        ):
+            with self.assertLogs(level="INFO") as logs:
+                voice_coding.start_injection_warmup()
+                worker.submit(lambda: None).result(timeout=2)
+
+        self.assertEqual(ran_on_worker, [True])
+        self.assertTrue(voice_coding.state.injection_ready)
+        self.assertEqual(voice_coding.state.warmup_timings, {"clipboard": 0.002})
+        self.assertIn("clipboard 2 ms", "\n".join(logs.output))
+
+    def test_failed_warmup_reports_injection_unavailable(self):
+        future = Future()
+        future.set_exception(RuntimeError("boom"))
+        with self.assertLogs(level="WARNING"):
+            voice_coding.finish_injection_warmup(future)
+        self.assertFalse(voice_coding.state.injection_ready)
+        self.assertTrue(voice_coding.state.injection_failed)
+        self.assertEqual(voice_coding.state.warmup_timings, {})
+
 
 if __name__ == "__main__":
     unittest.main()
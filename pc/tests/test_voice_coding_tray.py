@@ -32,6 +32,13 @@ class TrayActivationTests(unittest.TestCase):
         )
 
 
+class TrayTooltipTests(unittest.TestCase):
+    def test_tooltip_shows_warmup_until_injection_is_ready(self):
+        self.assertEqual(ModernTrayIcon.tooltip_text(True), "Voicing")
+        self.assertIn("准备中", ModernTrayIcon.tooltip_text(False))
+        self.assertIn("不可用", ModernTrayIcon.tooltip_text(False, injection_failed=True))
+
+
 class TrayNativeMenuTests(unittest.TestCase):
     def test_native_menu_pops_on_left_and_double_click(self):
         # Linux 原生菜单在左键 / 双击时手动 popup
@@ -130,6 +137,31 @@ class QRCodeDialogOpenTests(unittest.TestCase):
             dialog.hide()
             dialog.deleteLater()
 
+    def test_qr_dialog_follows_snapshots_only_while_visible(self):
+        import voice_coding
+        from voice_coding import QRCodeDialog
+        dialog = QRCodeDialog()
+        dialog._populate_content = MagicMock()
+        snapshot = voice_coding.NetworkSnapshot(generation=7, interfaces=(), advertised_ips=())
+
+        try:
+            with patch("voice_coding.subscribe_network_snapshot", return_value=MagicMock()) as subscribe:
+                dialog.show()
+                dialog.show()
+                subscribe.assert_called_once()
+                unsubscribe = subscribe.return_value
+
+                dialog.network_snapshot_changed.emit(snapshot)
+                dialog._populate_content.assert_called_once_with()
+
+                dialog.hide()
+                unsubscribe.assert_called_once_with()
+                dialog._refresh_qr(snapshot)
+                dialog._populate_content.assert_called_once_with()
+        finally:
+            dialog.hide()
+            dialog.deleteLater()
+
 
 class SyncStateBroadcastTests(unittest.TestCase):
     def test_schedule_sync_state_broadcast_uses_server_loop(self):
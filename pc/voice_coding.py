@@ -18,7 +18,7 @@ import sys
 import threading
 from datetime import datetime
 from pathlib import Path
-from typing import NamedTuple, Optional
+from typing import Any, Callable, NamedTuple, Optional
 
 # PyQt5 for modern tray menu
 from PyQt5.QtWidgets import (
@@ -53,19 +53,27 @@ except Exception:
     psutil = None
 
 from device_identity import get_or_create_device_identity
+from injection_worker import InjectionQueueFullError, InjectionWorker
+from network_monitor import open_network_change_monitor, wait_for_network_change
+from pending_text_queue import PendingText, PendingTextQueue
 from platform_autostart import is_startup_enabled, set_startup_enabled
 from platform_instance import check_single_instance, show_already_running_message
 from platform_keyboard import (
     PasteMode,
+    flush_clipboard_burst,
     get_paste_mode,
     get_paste_mode_label,
-    press_enter,
+    prefetch_paste_sequence,
+    press_enter_after_paste,
     set_paste_mode,
+    stop_focus_helpers,
     type_text_at_cursor,
+    warm_up_injection_stack,
 )
 from platform_utils import (
     WINDOWS_HOTSPOT_PREFIXES,
     ensure_runtime_supported,
+    format_capability_report,
     get_default_server_ip,
     get_known_hotspot_prefixes,
     get_log_dir,
@@ -74,6 +82,7 @@ from platform_utils import (
     get_preferred_hotspot_prefixes,
     open_file_in_default_app,
     open_file_in_text_editor,
+    probe_runtime_capabilities,
 )
 from voicing_protocol import (
     QR_SCAN_PING_SOURCE,
@@ -81,6 +90,7 @@ from voicing_protocol import (
     TYPE_TEXT,
     WEBSOCKET_PORT,
     TEXT_SEND_MODE_COMMIT,
+    TEXT_SEND_MODE_SHADOW,
     TEXT_SEND_MODE_SUBMIT,
     build_ack_message,
     build_connected_message,
@@ -97,8 +107,22 @@ APP_NAME = "Voicing"
 APP_VERSION = "2.9.9"
 WS_PORT = WEBSOCKET_PORT      # WebSocket port
 AUTO_ENTER_SETTLE_DELAY_SEC = 0.35
+CLIPBOARD_RESTORE_DELAY_SEC = 0.1
+# Consecutive pastes within this idle window share one clipboard snapshot/restore.
+CLIPBOARD_BURST_IDLE_SEC = 1.5
+# With VOICING_TEXT_INJECTION=direct (opt-in), texts up to this many characters
+# are typed key by key instead of pasted.
+DIRECT_TYPING_MAX_CHARS = 24
+# 0 types as fast as the backend allows; lower it for apps that drop fast input.
+DIRECT_TYPING_KEYS_PER_SEC = 0
 NATIVE_FONT_FAMILY = get_native_font_family()
+# Polling interval when rtnetlink change notifications are unavailable.
 NETWORK_INTERFACE_REFRESH_SEC = 1
+# With rtnetlink, interfaces are still rescanned this often as a safety net.
+NETWORK_CHANGE_FALLBACK_REFRESH_SEC = 60
+# Retry delay while no interface can be bound doubles up to the maximum.
+NETWORK_BIND_RETRY_INITIAL_SEC = 2
+NETWORK_BIND_RETRY_MAX_SEC = 30
 
 
 # ============================================================
@@ -127,6 +151,11 @@ class AppState:
         self.bound_ws_host = None  # 当前 WebSocket 实际绑定地址
         self.bound_ws_hosts = []  # 当前 WebSocket 实际绑定成功的地址列表
         self.server_loop = None  # WebSocket server 所属 asyncio event loop
+        # 全部连接共享的有序文本注入线程；空闲时负责恢复连续听写期间占用的剪贴板
+        self.injection_worker = InjectionWorker(idle_callback=flush_clipboard_burst)
+        self.injection_ready = False  # 注入后端预热完成后置 True
+        self.injection_failed = False  # 注入后端预热失败时置 True
+        self.warmup_timings = {}  # 各注入组件预热耗时（秒）
 
 state = AppState()
 
@@ -187,6 +216,14 @@ class NetworkInterfaceCandidate(NamedTuple):
     interface_type: str
 
 
+class NetworkSnapshot(NamedTuple):
+    """Published QR/WS interface state; generation increases on every change."""
+
+    generation: int
+    interfaces: tuple[tuple[str, str], ...]
+    advertised_ips: tuple[str, ...]
+
+
 def get_hotspot_ip() -> str:
     """
     Get the actual hotspot IP address / 获取热点的实际 IP 地址
@@ -662,63 +699,94 @@ def _ip_sort_key(ip: str) -> tuple[int, str]:
     return (2, ip)
 
 
-def refresh_server_interfaces(*, log_changes: bool = True) -> list[tuple[str, str]]:
-    """Refresh the QR/WS interface snapshot from the current OS network state."""
-    global SERVER_INTERFACES, SERVER_INTERFACES_INITIALIZED
+def refresh_server_interfaces(*, log_changes: bool = True) -> NetworkSnapshot:
+    """Rescan the OS network state and publish a new snapshot if it changed.
+
+    Only startup and the WebSocket server loop call this; everything else reads
+    get_network_snapshot() or subscribes with subscribe_network_snapshot().
+    """
+    global NETWORK_SNAPSHOT
 
     discovered_interfaces = get_all_network_candidates()
-    latest_interfaces = calculate_broadcast_addresses(
+    latest_interfaces = tuple(calculate_broadcast_addresses(
         [(candidate.ip, candidate.prefix_length) for candidate in discovered_interfaces]
-    )
-
-    with SERVER_INTERFACES_LOCK:
-        was_initialized = SERVER_INTERFACES_INITIALIZED
-        previous_interfaces = list(SERVER_INTERFACES)
-        changed = latest_interfaces != SERVER_INTERFACES
+    ))
+    advertised_ips = list(dict.fromkeys(ip for ip, _broadcast in latest_interfaces))
+    if not advertised_ips:
+        fallback_ip = get_hotspot_ip()
+        if fallback_ip:
+            advertised_ips.append(fallback_ip)
+
+    with NETWORK_SNAPSHOT_LOCK:
+        previous = NETWORK_SNAPSHOT
+        changed = (
+            previous.generation == 0
+            or previous.interfaces != latest_interfaces
+            or previous.advertised_ips != tuple(advertised_ips)
+        )
         if changed:
-            SERVER_INTERFACES = latest_interfaces
-        SERVER_INTERFACES_INITIALIZED = True
-        snapshot = list(SERVER_INTERFACES)
+            NETWORK_SNAPSHOT = NetworkSnapshot(
+                generation=previous.generation + 1,
+                interfaces=latest_interfaces,
+                advertised_ips=tuple(advertised_ips),
+            )
+        snapshot = NETWORK_SNAPSHOT
+        subscribers = list(NETWORK_SNAPSHOT_SUBSCRIBERS) if changed else []
 
-    if log_changes and (changed or not was_initialized):
+    if log_changes and changed:
         logging.info(
-            "QR/WS 网络接口刷新: "
-            f"{_format_server_interface_ips(previous_interfaces)} -> "
-            f"{_format_server_interface_ips(snapshot)}"
+            f"QR/WS 网络接口刷新 (#{snapshot.generation}): "
+            f"{_format_server_interface_ips(previous.interfaces)} -> "
+            f"{_format_server_interface_ips(snapshot.interfaces)}"
         )
         log_detected_network_interfaces(discovered_interfaces)
 
+    for callback in subscribers:
+        try:
+            callback(snapshot)
+        except Exception as exc:
+            logging.warning(f"网络快照订阅回调失败: {exc}")
+
     return snapshot
 
 
-def get_server_interfaces(*, refresh: bool = False) -> list[tuple[str, str]]:
-    if refresh:
-        return refresh_server_interfaces()
-    with SERVER_INTERFACES_LOCK:
-        return list(SERVER_INTERFACES)
+def get_network_snapshot() -> NetworkSnapshot:
+    with NETWORK_SNAPSHOT_LOCK:
+        return NETWORK_SNAPSHOT
+
+
+def subscribe_network_snapshot(
+    callback: Callable[[NetworkSnapshot], None],
+) -> Callable[[], None]:
+    """Call ``callback`` from the refreshing thread on every new snapshot; returns an unsubscribe function."""
+    with NETWORK_SNAPSHOT_LOCK:
+        NETWORK_SNAPSHOT_SUBSCRIBERS.append(callback)
+
+    def unsubscribe() -> None:
+        with NETWORK_SNAPSHOT_LOCK:
+            if callback in NETWORK_SNAPSHOT_SUBSCRIBERS:
+                NETWORK_SNAPSHOT_SUBSCRIBERS.remove(callback)
+
+    return unsubscribe
+
+
+def get_server_interfaces() -> list[tuple[str, str]]:
+    return list(get_network_snapshot().interfaces)
 
 
-def _format_server_interface_ips(interfaces: list[tuple[str, str]]) -> str:
+def _format_server_interface_ips(interfaces) -> str:
     return ", ".join(ip for ip, _broadcast in interfaces) or "none"
 
 
-def get_primary_server_ip(*, refresh: bool = False) -> str:
-    server_interfaces = get_server_interfaces(refresh=refresh)
-    if server_interfaces:
-        return server_interfaces[0][0]
-    return get_hotspot_ip()
+def get_primary_server_ip() -> str:
+    advertised_ips = get_network_snapshot().advertised_ips
+    if advertised_ips:
+        return advertised_ips[0]
+    return DEFAULT_SERVER_IP
 
 
-def get_advertised_server_ips(*, refresh: bool = False) -> list[str]:
-    ips: list[str] = []
-    for ip, _broadcast in get_server_interfaces(refresh=refresh):
-        if ip not in ips:
-            ips.append(ip)
-    if not ips:
-        fallback_ip = get_hotspot_ip()
-        if fallback_ip:
-            ips.append(fallback_ip)
-    return ips
+def get_advertised_server_ips() -> list[str]:
+    return list(get_network_snapshot().advertised_ips)
 
 
 def get_bound_server_ips() -> list[str]:
@@ -733,11 +801,11 @@ def set_bound_server_ips(hosts: list[str]) -> None:
         state.bound_ws_host = ",".join(normalized_hosts) if normalized_hosts else None
 
 
-def get_qr_advertised_server_ips(*, refresh: bool = False) -> list[str]:
+def get_qr_advertised_server_ips() -> list[str]:
     bound_ips = get_bound_server_ips()
     if bound_ips:
         return bound_ips
-    return get_advertised_server_ips(refresh=refresh)
+    return get_advertised_server_ips()
 
 
 def log_detected_network_interfaces(interfaces: list[NetworkInterfaceCandidate]) -> None:
@@ -755,9 +823,9 @@ def log_detected_network_interfaces(interfaces: list[NetworkInterfaceCandidate])
 
 
 # Will be set at runtime / 运行时设置
-SERVER_INTERFACES: list[tuple[str, str]] = []
-SERVER_INTERFACES_LOCK = threading.Lock()
-SERVER_INTERFACES_INITIALIZED = False
+NETWORK_SNAPSHOT = NetworkSnapshot(generation=0, interfaces=(), advertised_ips=())
+NETWORK_SNAPSHOT_LOCK = threading.Lock()
+NETWORK_SNAPSHOT_SUBSCRIBERS: list[Callable[[NetworkSnapshot], None]] = []
 
 
 # ============================================================
@@ -782,7 +850,10 @@ def type_text(text: str, auto_enter: bool = False) -> bool:
             text,
             auto_enter=auto_enter,
             enter_delay_sec=AUTO_ENTER_SETTLE_DELAY_SEC,
-            restore_delay_sec=0.1,
+            restore_delay_sec=CLIPBOARD_RESTORE_DELAY_SEC,
+            burst_idle_sec=CLIPBOARD_BURST_IDLE_SEC,
+            direct_typing_max_chars=DIRECT_TYPING_MAX_CHARS,
+            direct_typing_keys_per_sec=DIRECT_TYPING_KEYS_PER_SEC,
         )
         return True
 
@@ -792,16 +863,24 @@ def type_text(text: str, auto_enter: bool = False) -> bool:
 
 
 def press_enter_after_settle(delay_sec: float = AUTO_ENTER_SETTLE_DELAY_SEC) -> bool:
-    """Press Enter after giving the target app time to consume a paste event."""
+    """Press Enter once the target app has consumed the last paste, at most ``delay_sec`` later."""
     try:
-        threading.Event().wait(delay_sec)
-        press_enter()
+        press_enter_after_paste(delay_sec)
         return True
     except Exception as e:
         logging.error(f"Error pressing Enter: {e}")
         return False
 
 
+async def run_injection(func, *args) -> bool:
+    """Run a paste/Enter call on the shared injection worker, in arrival order."""
+    try:
+        return await state.injection_worker.run(func, *args)
+    except InjectionQueueFullError as e:
+        logging.error(str(e))
+        return False
+
+
 # ============================================================
 # Reserved for future features / 保留给未来功能
 # ============================================================
@@ -817,6 +896,11 @@ async def handle_client(websocket):
         state.connected_clients.add(websocket)
     print(f"Client connected: {client_addr}")
 
+    # Text frames are queued and injected by a separate task, so frames that
+    # arrive while a slow paste is in flight are merged into the next paste.
+    pending_texts = PendingTextQueue()
+    injector = asyncio.create_task(inject_pending_texts(websocket, pending_texts))
+    utterance_started = False
     try:
         # Get computer name for identification
         device_identity = get_or_create_device_identity()
@@ -827,6 +911,7 @@ async def handle_client(websocket):
             computer_name=device_identity.name,
             device_id=device_identity.device_id,
             os_name=device_identity.os,
+            injection_ready=state.injection_ready,
         )))
 
         async for message in websocket:
@@ -842,21 +927,20 @@ async def handle_client(websocket):
 
                     text = data.get("content", "")
                     send_mode = data.get("send_mode", TEXT_SEND_MODE_SUBMIT)
-                    auto_enter = data.get("auto_enter", False) and send_mode == TEXT_SEND_MODE_SUBMIT
+                    if send_mode == TEXT_SEND_MODE_SHADOW and text and not utterance_started:
+                        # First frame of an utterance: work out the paste keys
+                        # while the text is still queued behind earlier pastes.
+                        prefetch_paste_sequence()
+                    utterance_started = send_mode == TEXT_SEND_MODE_SHADOW and (utterance_started or bool(text))
                     if send_mode == TEXT_SEND_MODE_COMMIT:
-                        entered = False
-                        if data.get("auto_enter", False):
-                            entered = await asyncio.to_thread(press_enter_after_settle)
-                        await websocket.send(json.dumps(build_ack_message(
-                            clear_input=entered,
-                        )))
+                        pending_texts.put(PendingText(
+                            "",
+                            send_mode,
+                            auto_enter=bool(data.get("auto_enter", False)),
+                        ))
                     elif text:
-                        # Type the received text (run in thread to avoid blocking event loop)
-                        typed = await asyncio.to_thread(type_text, text, auto_enter)
-                        # Send acknowledgment
-                        await websocket.send(json.dumps(build_ack_message(
-                            clear_input=typed and send_mode == TEXT_SEND_MODE_SUBMIT,
-                        )))
+                        auto_enter = data.get("auto_enter", False) and send_mode == TEXT_SEND_MODE_SUBMIT
+                        pending_texts.put(PendingText(text, send_mode, auto_enter=bool(auto_enter)))
 
                 elif msg_type == TYPE_PING:
                     if data.get("source") == QR_SCAN_PING_SOURCE:
@@ -869,16 +953,57 @@ async def handle_client(websocket):
             except json.JSONDecodeError:
                 # If not JSON, treat as plain text
                 if message.strip() and state.sync_enabled:
-                    await asyncio.to_thread(type_text, message)
-                    
+                    pending_texts.put(PendingText(message, send_ack=False))
+
     except websockets.exceptions.ConnectionClosed:
         pass
     finally:
+        # Texts received before the socket closed are still typed, as before.
+        pending_texts.close()
+        await asyncio.gather(injector, return_exceptions=True)
         with state.lock:
             state.connected_clients.discard(websocket)
         print(f"Client disconnected: {client_addr}")
 
 
+async def inject_pending_texts(websocket, pending_texts: PendingTextQueue) -> None:
+    """Inject one connection's queued texts in order, one paste per merged batch."""
+    while True:
+        batch = await pending_texts.next_batch()
+        if batch is None:
+            return
+
+        try:
+            if batch.is_commit:
+                entered = False
+                if batch.auto_enter:
+                    entered = await run_injection(press_enter_after_settle)
+                acks = [entered]
+            else:
+                if len(batch.messages) > 1:
+                    logging.info(f"合并 {len(batch.messages)} 条待注入文本为一次粘贴")
+                typed = await run_injection(type_text, batch.text, batch.auto_enter)
+                acks = [
+                    typed and message.send_mode == TEXT_SEND_MODE_SUBMIT
+                    for message in batch.messages
+                ]
+        except Exception as e:
+            # One failed batch must not end the task, or later frames would
+            # pile up unanswered.
+            logging.error(f"文本注入失败: {e}")
+            acks = [False] * len(batch.messages)
+
+        for message, clear_input in zip(batch.messages, acks):
+            if not message.send_ack:
+                continue
+            try:
+                await websocket.send(json.dumps(build_ack_message(
+                    clear_input=clear_input,
+                )))
+            except websockets.exceptions.ConnectionClosed:
+                break
+
+
 async def broadcast_sync_state():
     """Broadcast sync state to all connected clients / 广播同步状态给所有客户端"""
     if not state.connected_clients:
@@ -911,62 +1036,97 @@ def schedule_sync_state_broadcast():
     future.add_done_callback(log_broadcast_error)
 
 
+async def reconcile_websocket_listeners(
+    listeners: dict[str, Any],
+    bind_hosts: list[str],
+    failed_hosts: set[str],
+) -> None:
+    """Bind listeners for new hosts and close those whose host vanished.
+
+    ``listeners`` maps bind host to its ``serve(...)`` server and is updated in
+    place. Listeners on hosts that are still advertised, and the connections
+    they accepted, are left untouched. A host that fails to bind is retried on
+    the next call; its error is logged once.
+    """
+    vanished = [host for host in listeners if host not in bind_hosts]
+    closing = [listeners.pop(host) for host in vanished]
+    for server in closing:
+        server.close()
+    failed_hosts.intersection_update(bind_hosts)
+
+    added = []
+    for bind_host in bind_hosts:
+        if bind_host in listeners:
+            continue
+        try:
+            listeners[bind_host] = await serve(handle_client, bind_host, state.ws_port)
+        except OSError as e:
+            if bind_host not in failed_hosts:
+                failed_hosts.add(bind_host)
+                logging.error(f"WebSocket 绑定 {bind_host}:{state.ws_port} 失败: {e}")
+            continue
+        failed_hosts.discard(bind_host)
+        added.append(bind_host)
+        print(f"WebSocket server started at ws://{bind_host}:{state.ws_port}")
+
+    # One update with the final host list, so readers never see a partial set.
+    set_bound_server_ips([host for host in bind_hosts if host in listeners])
+    if added or vanished:
+        logging.info(
+            "WebSocket 监听接口变化: "
+            f"+[{', '.join(added)}] -[{', '.join(vanished)}]，当前: "
+            f"{', '.join(f'{host}:{state.ws_port}' for host in listeners) or 'none'}"
+        )
+    if closing:
+        await asyncio.gather(
+            *(server.wait_closed() for server in closing),
+            return_exceptions=True,
+        )
+
+
 async def start_server():
     """Start the WebSocket server / 启动WebSocket服务器"""
     state.server_loop = asyncio.get_running_loop()
-    while state.running:
-        bind_hosts = get_advertised_server_ips(refresh=True)
-        servers = []
-        bound_hosts = []
-        try:
-            for bind_host in bind_hosts:
-                try:
-                    server = await serve(handle_client, bind_host, state.ws_port)
-                except OSError as e:
-                    logging.error(f"WebSocket 绑定 {bind_host}:{state.ws_port} 失败: {e}")
-                    continue
-                servers.append(server)
-                bound_hosts.append(bind_host)
-                print(f"WebSocket server started at ws://{bind_host}:{state.ws_port}")
-
-            if not servers:
-                set_bound_server_ips([])
-                logging.error(
-                    "没有可监听的物理网络接口，WebSocket server 暂停重试。"
-                )
-                await asyncio.sleep(2)
-                continue
-
-            set_bound_server_ips(bound_hosts)
-            logging.info(
-                "WebSocket server listening on physical interfaces: "
-                f"{', '.join(f'{host}:{state.ws_port}' for host in bound_hosts)}"
-            )
-            while state.running:
-                await asyncio.sleep(NETWORK_INTERFACE_REFRESH_SEC)
-                latest_hosts = get_advertised_server_ips(refresh=True)
-                if set(latest_hosts) != set(bound_hosts):
-                    old_hosts = ", ".join(bound_hosts) or "none"
-                    new_hosts = ", ".join(latest_hosts) or "none"
-                    logging.info(f"WebSocket 监听接口变化: {old_hosts} -> {new_hosts}")
-                    break
-        except Exception as e:
-            print(f"Server error: {e}")
-            logging.error(f"WebSocket server error: {e}")
-            await asyncio.sleep(2)
-        finally:
-            for server in servers:
-                server.close()
-            if servers:
-                logging.info(
-                    "WebSocket server closing listeners: "
-                    f"{', '.join(f'{host}:{state.ws_port}' for host in bound_hosts)}"
-                )
-                await asyncio.gather(
-                    *(server.wait_closed() for server in servers),
-                    return_exceptions=True,
+    listeners: dict[str, Any] = {}
+    failed_hosts: set[str] = set()
+    monitor = open_network_change_monitor()
+    if monitor is not None:
+        logging.info("网络变化检测: rtnetlink 事件")
+        refresh_sec = NETWORK_CHANGE_FALLBACK_REFRESH_SEC
+    else:
+        logging.info(f"网络变化检测: 每 {NETWORK_INTERFACE_REFRESH_SEC} 秒轮询")
+        refresh_sec = NETWORK_INTERFACE_REFRESH_SEC
+    retry_sec = NETWORK_BIND_RETRY_INITIAL_SEC
+    try:
+        while state.running:
+            try:
+                snapshot = refresh_server_interfaces()
+                await reconcile_websocket_listeners(
+                    listeners,
+                    list(snapshot.advertised_ips),
+                    failed_hosts,
                 )
-            set_bound_server_ips([])
+            except Exception as e:
+                print(f"Server error: {e}")
+                logging.error(f"WebSocket server error: {e}")
+                listeners_ready = False
+            else:
+                listeners_ready = bool(listeners)
+                if not listeners_ready:
+                    logging.error(
+                        f"没有可监听的物理网络接口，WebSocket server {retry_sec} 秒后重试。"
+                    )
+            if listeners_ready:
+                retry_sec = NETWORK_BIND_RETRY_INITIAL_SEC
+                await wait_for_network_change(monitor, refresh_sec)
+            elif await wait_for_network_change(monitor, retry_sec):
+                retry_sec = NETWORK_BIND_RETRY_INITIAL_SEC
+            else:
+                retry_sec = min(retry_sec * 2, NETWORK_BIND_RETRY_MAX_SEC)
+    finally:
+        await reconcile_websocket_listeners(listeners, [], failed_hosts)
+        if monitor is not None:
+            monitor.close()
 
 
 def run_server():
@@ -1506,6 +1666,8 @@ class QRSuccessOverlay(QWidget):
 class QRCodeDialog(QWidget):
     """QR 码弹窗 - 与托盘菜单同色同风格，直接在屏幕中心显示。"""
 
+    # Emitted from the server thread; Qt queues it onto the GUI thread.
+    network_snapshot_changed = pyqtSignal(object)
     DIALOG_WIDTH = 282
     DIALOG_HEIGHT = 308
     QR_SIZE = 230
@@ -1523,9 +1685,12 @@ class QRCodeDialog(QWidget):
         self._ignore_focus_loss = False
         self._anim_end_rect = None
 
-        # Keep QR payload aligned with runtime IP changes.
+        # Network changes arrive as snapshots; the timer only re-reads cached
+        # state so bound listener hosts that settle later are picked up too.
         self._refresh_timer = QTimer(self)
         self._refresh_timer.timeout.connect(self._refresh_qr)
+        self.network_snapshot_changed.connect(self._refresh_qr)
+        self._unsubscribe_network_snapshot = None
 
         self._cached_qr_payload = None
         self._cached_qr_pixmap = None
@@ -1638,14 +1803,28 @@ class QRCodeDialog(QWidget):
         pix.loadFromData(buf.getvalue())
         return pix
 
-    def _refresh_qr(self):
+    def _refresh_qr(self, _snapshot=None):
         """Refresh QR payload from the current interface snapshot."""
-        self._populate_content()
+        if self.isVisible():
+            self._populate_content()
+
+    def showEvent(self, event):
+        if self._unsubscribe_network_snapshot is None:
+            self._unsubscribe_network_snapshot = subscribe_network_snapshot(
+                self.network_snapshot_changed.emit
+            )
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        if self._unsubscribe_network_snapshot is not None:
+            self._unsubscribe_network_snapshot()
+            self._unsubscribe_network_snapshot = None
+        super().hideEvent(event)
 
     def _build_qr_payload(self):
         device_identity = get_or_create_device_identity()
-        advertised_ips = get_qr_advertised_server_ips(refresh=True)
-        primary_ip = advertised_ips[0] if advertised_ips else get_primary_server_ip(refresh=True)
+        advertised_ips = get_qr_advertised_server_ips()
+        primary_ip = advertised_ips[0] if advertised_ips else get_primary_server_ip()
         payload = build_qr_payload(
             device_id=device_identity.device_id,
             ip=primary_ip,
@@ -1826,7 +2005,8 @@ class ModernTrayIcon(QSystemTrayIcon):
         self.setup_icon()
         self.setup_menu()
         # 设置悬停提示
-        self.setToolTip("Voicing")
+        self._current_tooltip = None
+        self.update_tooltip()
 
     def _init_icon_cache(self):
         """预先生成并缓存所有状态的图标"""
@@ -1988,6 +2168,19 @@ class ModernTrayIcon(QSystemTrayIcon):
         pos = QCursor.pos()
         self.menu_widget.show_at_position(pos)
 
+    @staticmethod
+    def tooltip_text(injection_ready, injection_failed=False):
+        if injection_failed:
+            return "Voicing（输入不可用，详见日志）"
+        return "Voicing" if injection_ready else "Voicing（输入准备中…）"
+
+    def update_tooltip(self):
+        """预热完成前提示输入尚未就绪，预热失败时提示不可用；文本未变时跳过 setToolTip"""
+        tooltip = self.tooltip_text(state.injection_ready, state.injection_failed)
+        if tooltip != self._current_tooltip:
+            self._current_tooltip = tooltip
+            self.setToolTip(tooltip)
+
     def update_icon(self, status, dim=False):
         """更新图标状态 - 使用缓存的图标，仅在目标图标真正变化时才 setIcon。
 
@@ -2073,6 +2266,11 @@ def run_tray():
     # 保存到状态
     state.tray_icon = tray_icon
 
+    # QApplication 已存在，预热 portal/剪贴板等依赖 Qt 的注入后端
+    start_injection_warmup()
+    # 在事件循环退出前停止注入线程，最后的剪贴板恢复仍需 GUI 线程处理 Qt 调用
+    app.aboutToQuit.connect(stop_injection_worker)
+
     # 定时更新图标状态
     update_timer = QTimer()
     update_timer.timeout.connect(lambda: update_tray_icon_pyqt(tray_icon))
@@ -2082,8 +2280,35 @@ def run_tray():
     app.exec()
 
 
+def start_injection_warmup():
+    """在注入线程上预热注入后端，完成后置位 state.injection_ready"""
+    state.injection_worker.submit(warm_up_injection_stack).add_done_callback(finish_injection_warmup)
+
+
+def stop_injection_worker():
+    """停止注入线程，等待期间继续处理 Qt 事件，使最后一次剪贴板恢复得以完成"""
+    state.injection_worker.stop(process_events=QApplication.processEvents)
+
+
+def finish_injection_warmup(future):
+    try:
+        timings = future.result()
+    except Exception as exc:
+        # 后端不可用时不能报告就绪；握手保持 injection_ready: false
+        logging.warning(f"输入注入预热失败: {exc}")
+        state.warmup_timings = {}
+        state.injection_failed = True
+        return
+    state.warmup_timings = timings
+    state.injection_failed = False
+    state.injection_ready = True
+    summary = ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in timings.items())
+    logging.info(f"输入注入预热完成: {summary}")
+
+
 def update_tray_icon_pyqt(tray_icon):
     """更新 PyQt5 托盘图标状态"""
+    tray_icon.update_tooltip()
     # 判断是否需要闪烁（等待连接状态）
     if state.sync_enabled and len(state.connected_clients) == 0:
         # 等待连接 - 切换闪烁状态
@@ -2107,9 +2332,11 @@ def main():
         logging.error(str(exc))
         show_fatal_message("Voicing 无法启动", str(exc))
         return
+    probe_runtime_capabilities()
+    logging.info(f"运行时能力: {format_capability_report()}")
 
-    # Detect QR-advertisable interfaces at startup; the server thread refreshes
-    # this snapshot at runtime for network changes.
+    # Detect QR-advertisable interfaces at startup; after this only the server
+    # thread rescans, and other consumers read or subscribe to the snapshot.
     refresh_server_interfaces(log_changes=True)
     logging.info(f"当前首选服务地址: {get_primary_server_ip()}")
 
@@ -2122,6 +2349,9 @@ def main():
     except RuntimeError as exc:
         logging.error(str(exc))
         show_fatal_message("Voicing 无法启动", str(exc))
+    finally:
+        state.injection_worker.stop()
+        stop_focus_helpers()
 
 
 def show_fatal_message(title: str, message: str) -> None:
@@ -60,6 +60,7 @@ def build_connected_message(
     computer_name: str,
     device_id: str = "",
     os_name: str = "",
+    injection_ready: bool = True,
 ) -> dict:
     return {
         "type": TYPE_CONNECTED,
@@ -69,6 +70,7 @@ def build_connected_message(
         "device_id": device_id,
         "name": computer_name,
         "os": os_name,
+        "injection_ready": injection_ready,
     }
 
 